@@ -0,0 +1,272 @@
+import heapq
+import sys
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import chain, islice, takewhile
+from typing import NamedTuple
+from uuid import UUID
+
+from django.conf import settings
+
+from accounts.models import User
+from accounts.search import SEARCH_FIELDS, get_query_terms, make_tokens
+
+# The user fields an entry is made from
+ENTRY_FIELDS = ["pk", "uid", "first_name", "last_name", "phone_number", "country_code"]
+
+# The user fields whose changes the index follows
+INDEXED_FIELDS = SEARCH_FIELDS | {"is_staff", "is_superuser"}
+
+
+class UserMatch(NamedTuple):
+    uid: UUID
+    first_name: str
+    last_name: str
+    phone_number: int
+
+
+class AutocompleteIndex:
+    """Process-local prefix index over the names and phone numbers of
+    non-staff users, for recipient autocomplete without a database query.
+
+    Every token of every user, as made for the database search, is kept in
+    sorted order with the user's pk alongside, so the tokens starting with
+    a prefix are one bisection away. Equal tokens are ordered by the first
+    name of their user, then by pk, as search results are. The sorted order is split into chunks
+    of about `chunk_size` tokens, so a save only shifts the chunk its tokens
+    land in rather than millions of positions. Strings are interned, so
+    users sharing a name share its string.
+
+    The index is loaded from `User.non_staff` on first use and then follows
+    saves made by this process, see `accounts.signals`. Saves made by other
+    processes only show up once this one restarts.
+    """
+
+    chunk_size = 1000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        # Sorted tokens, the pks of the users they belong to at the same
+        # positions, and the last token of each chunk
+        self._chunks = []
+        self._chunk_pks = []
+        self._maxes = []
+        # pk: (uid bytes, first name, last name, phone number, tokens)
+        self._entries = {}
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def load(self, users=None):
+        """Indexes `users`, rows of `ENTRY_FIELDS`, in place of whatever the
+        index held. Defaults to every non-staff user."""
+        if users is None:
+            users = User.non_staff.order_by().values_list(*ENTRY_FIELDS).iterator()
+
+        entries = {}
+        pairs = []
+        for pk, *fields in users:
+            entry = self._make_entry(*fields)
+            entries[pk] = entry
+            pairs += [(token, entry[1], pk) for token in entry[-1]]
+        pairs.sort()
+
+        chunks = []
+        chunk_pks = []
+        for start in range(0, len(pairs), self.chunk_size):
+            chunk = pairs[start:start + self.chunk_size]
+            chunks.append([token for token, _, _ in chunk])
+            chunk_pks.append(array("q", (pk for _, _, pk in chunk)))
+        del pairs
+
+        with self._lock:
+            self._chunks = chunks
+            self._chunk_pks = chunk_pks
+            self._maxes = [chunk[-1] for chunk in chunks]
+            self._entries = entries
+            self.loaded = True
+
+    def ensure_loaded(self):
+        # Loading a large directory takes a while, so it is done once
+        # while the other requests that need it wait
+        with self._load_lock:
+            if not self.loaded:
+                self.load()
+
+    def unload(self):
+        """Drops every entry, so the next use loads the index afresh"""
+        with self._lock:
+            self._clear()
+
+    def _make_entry(self, uid, first_name, last_name, phone_number, country_code) -> tuple:
+        tokens = make_tokens(first_name, last_name, phone_number, country_code)
+        return (
+            uid.bytes,
+            sys.intern(first_name),
+            sys.intern(last_name),
+            phone_number,
+            tuple(sys.intern(token) for token in tokens),
+        )
+
+    def update(self, user: User):
+        """Re-indexes `user`, or drops them if they are staff"""
+        entry = None
+        if not (user.is_staff or user.is_superuser):
+            entry = self._make_entry(
+                user.uid, user.first_name, user.last_name, user.phone_number, user.country_code
+            )
+
+        with self._lock:
+            self._remove(user.pk)
+            if entry is not None:
+                self._entries[user.pk] = entry
+                for token in entry[-1]:
+                    self._insert(token, user.pk)
+
+    def remove(self, pk: int):
+        with self._lock:
+            self._remove(pk)
+
+    def _insert(self, token: str, pk: int):
+        if not self._chunks:
+            self._chunks.append([token])
+            self._chunk_pks.append(array("q", [pk]))
+            self._maxes.append(token)
+            return
+
+        # A run of equal tokens may span chunks, and is ordered by first name
+        # then pk, so the token goes after those of the run that sort before it
+        key = self._tie_key(pk)
+        c = min(bisect_left(self._maxes, token), len(self._chunks) - 1)
+        while (
+            c + 1 < len(self._chunks)
+            and self._chunks[c + 1][0] == token
+            and self._tie_key(self._chunk_pks[c + 1][0]) < key
+        ):
+            c += 1
+        chunk, pks = self._chunks[c], self._chunk_pks[c]
+        start = bisect_left(chunk, token)
+        end = bisect_right(chunk, token, lo=start)
+        i = bisect_right(pks, key, lo=start, hi=end, key=self._tie_key)
+        chunk.insert(i, token)
+        pks.insert(i, pk)
+        self._maxes[c] = chunk[-1]
+
+        if len(chunk) > 2 * self.chunk_size:
+            half = len(chunk) // 2
+            self._chunks.insert(c + 1, chunk[half:])
+            self._chunk_pks.insert(c + 1, pks[half:])
+            del chunk[half:]
+            del pks[half:]
+            self._maxes[c:c + 1] = [chunk[-1], self._chunks[c + 1][-1]]
+
+    def _tie_key(self, pk: int) -> tuple:
+        return self._entries[pk][1], pk
+
+    def _remove(self, pk: int):
+        entry = self._entries.pop(pk, None)
+        if entry is None:
+            return
+
+        for token in entry[-1]:
+            # A run of equal tokens may span chunks
+            c = bisect_left(self._maxes, token)
+            while c < len(self._chunks):
+                chunk, pks = self._chunks[c], self._chunk_pks[c]
+                start = bisect_left(chunk, token)
+                end = bisect_right(chunk, token, lo=start)
+                try:
+                    i = pks.index(pk, start, end)
+                except ValueError:
+                    c += 1
+                    continue
+
+                del chunk[i]
+                del pks[i]
+                if chunk:
+                    self._maxes[c] = chunk[-1]
+                else:
+                    del self._chunks[c], self._chunk_pks[c], self._maxes[c]
+                break
+
+    def _scan(self, prefix: str):
+        """Yields the `(token, pk)` pairs whose token starts with `prefix`, in order"""
+        c = bisect_left(self._maxes, prefix)
+        i = bisect_left(self._chunks[c], prefix) if c < len(self._chunks) else 0
+        while c < len(self._chunks):
+            chunk, pks = self._chunks[c], self._chunk_pks[c]
+            while i < len(chunk):
+                if not chunk[i].startswith(prefix):
+                    return
+                yield chunk[i], pks[i]
+                i += 1
+            c += 1
+            i = 0
+
+    def search(self, query: str, limit: int = 10) -> list:
+        """Returns up to `limit` users with a token starting with each term
+        of `query`, users matching more terms whole first. Ties go to the
+        user whose token starting with the longest term sorts first, then
+        by first name and pk, which is the order the index walks them in.
+
+        Only users holding a term whole can match any whole, so the runs of
+        tokens equal to the other terms are read first. The range of the
+        longest term is then walked until the rest of it cannot rank above
+        the best `limit` found: inside the run of the term itself once that
+        many users match every term whole, and past it once that many users
+        match at all. At most `USER_SEARCH_CANDIDATES` tokens are read."""
+        terms = get_query_terms(query)
+        if not terms:
+            return []
+
+        anchor = max(terms, key=len)
+        others = set(terms) - {anchor}
+        ranks = {}
+        matched = whole = 0
+        with self._lock:
+            runs = (
+                takewhile(lambda pair, term=term: pair[0] == term, self._scan(term))
+                for term in others
+            )
+            pairs = chain(*runs, self._scan(anchor))
+            for token, pk in islice(pairs, settings.USER_SEARCH_CANDIDATES):
+                if pk not in ranks:
+                    ranks[pk] = self._rank(pk, terms, anchor)
+                    matched += ranks[pk] is not None
+                if not token.startswith(anchor):
+                    continue
+
+                if token != anchor:
+                    if matched >= limit:
+                        break
+                elif ranks[pk] is not None and -ranks[pk][0] == len(terms):
+                    whole += 1
+                    if whole == limit:
+                        break
+
+            best = heapq.nsmallest(limit, (rank for rank in ranks.values() if rank is not None))
+            entries = [self._entries[rank[-1]] for rank in best]
+
+        return [
+            UserMatch(UUID(bytes=uid), first_name, last_name, phone_number)
+            for uid, first_name, last_name, phone_number, _ in entries
+        ]
+
+    def _rank(self, pk: int, terms: list, anchor: str):
+        """Where user `pk` ranks for `terms`, lowest first, or None unless
+        they have a token starting with each term"""
+        entry = self._entries[pk]
+        tokens = entry[-1]
+        if not all(any(token.startswith(term) for token in tokens) for term in terms):
+            return None
+        first = min(token for token in tokens if token.startswith(anchor))
+        return -sum(term in tokens for term in terms), first, entry[1], pk
+
+
+user_autocomplete = AutocompleteIndex()
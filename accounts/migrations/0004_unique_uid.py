@@ -0,0 +1,24 @@
+# Generated by Django 5.0.6 on 2026-10-18 15:05
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_user_has_verified_email'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='otp',
+            name='uid',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='uid',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_unique_uid'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['first_name', 'id'], name='user_first_name_id_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:13
+
+import django.db.models.deletion
+import django_extensions.db.fields
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_user_first_name_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('uid', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('token', models.CharField(max_length=80)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['token', 'user'], name='user_search_token_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='usersearchtoken',
+            constraint=models.UniqueConstraint(fields=('user', 'token'), name='unique_user_search_token'),
+        ),
+    ]
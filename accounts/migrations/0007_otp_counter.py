@@ -0,0 +1,22 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_user_search_token'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='otp',
+            name='otp',
+        ),
+        migrations.AddField(
+            model_name='otp',
+            name='counter',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,10 +1,13 @@
-import random
+import hmac
+from datetime import timedelta
 
 from django.conf import settings
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
 
 from core.model_abstracts import Model
 from core.model_managers.accounts import NonStaffManager
@@ -55,13 +58,22 @@ class User(AbstractUser, Model):
     objects = CustomUserManager()
     non_staff = NonStaffManager()
 
+    class Meta(AbstractUser.Meta):
+        # Walked by the keyset pagination of the users list
+        indexes = [models.Index(fields=["first_name", "id"], name="user_first_name_id_idx")]
+
     def __str__(self) -> str:
         return self.email
 
 
 class OTP(Model):
+    """A user's one time passwords. Codes are not stored but derived from the
+    user, a counter moved on by each new code and the code's expiry, so they
+    need not be unique across users and checking one reads only its user's row.
+    """
+
     user = models.OneToOneField(User, on_delete=models.CASCADE)
-    otp = models.CharField(max_length=10, unique=True)
+    counter = models.PositiveIntegerField(default=0)
     otp_expiry = models.DateTimeField(blank=True, null=True)
     max_otp_try = models.CharField(max_length=2, default=settings.MAX_OTP_TRY)
     otp_max_out = models.DateTimeField(blank=True, null=True)
@@ -69,13 +81,55 @@ class OTP(Model):
     def __str__(self) -> str:
         return f"{self.__class__.__name__} - {self.user.email}"
 
-    @classmethod
-    def generate_otp(cls):
-        """Generates a unique 6-digit number as OTP"""
-        # TODO: modify to limit number of attempts
-        otp = random.randint(100000, 999999)
-        otp_exists = cls.objects.filter(otp=otp).exists()
-        while otp_exists:
-            otp = random.randint(999999, 999999)
-            otp_exists = cls.objects.filter(otp=otp).exists()
-        return otp
+    def issue(self, expiry_minutes: int = settings.OTP_EXPIRY_MINUTES) -> str:
+        """Moves on to a new code, valid for `expiry_minutes`, and returns it.
+        Saving is left to the caller."""
+        self.counter += 1
+        self.otp_expiry = timezone.now() + timedelta(minutes=expiry_minutes)
+        return self.get_code()
+
+    def get_code(self) -> str | None:
+        """Returns the current 6-digit code, or None if none was issued"""
+        if self.otp_expiry is None:
+            return None
+        window = int(self.otp_expiry.timestamp())
+        digest = salted_hmac(
+            "accounts.OTP", f"{self.user_id}:{self.counter}:{window}", algorithm="sha256"
+        ).digest()
+        # Dynamic truncation, as in HOTP (RFC 4226)
+        offset = digest[-1] & 0x0F
+        number = int.from_bytes(digest[offset:offset + 4], "big") & 0x7FFFFFFF
+        return f"{number % 10**6:06d}"
+
+    def check_code(self, code) -> bool:
+        """Whether `code` is the current code and has not expired"""
+        expected = self.get_code()
+        return (
+            expected is not None
+            and timezone.now() < self.otp_expiry
+            and hmac.compare_digest(expected, str(code))
+        )
+
+
+class UserSearchToken(Model):
+    """A word of a user's name, or their phone number, normalized so the user
+    directory can be searched by prefix through an index. Kept in sync with
+    the user on save, see `accounts.search`."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="search_tokens",
+        # Covered by unique_user_search_token
+        db_index=False,
+    )
+    token = models.CharField(max_length=80)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "token"], name="unique_user_search_token")
+        ]
+        indexes = [models.Index(fields=["token", "user"], name="user_search_token_idx")]
+
+    def __str__(self) -> str:
+        return self.token
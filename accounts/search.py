@@ -0,0 +1,116 @@
+import re
+import unicodedata
+
+from django.db import transaction
+from django.db.models import Case, Exists, IntegerField, OuterRef, Q, QuerySet, Value, When
+
+from accounts.models import User, UserSearchToken
+
+# The user fields tokens are made from
+SEARCH_FIELDS = {"first_name", "last_name", "phone_number", "country_code"}
+
+TOKEN_LENGTH = UserSearchToken._meta.get_field("token").max_length
+
+WORD = re.compile(r"\w+")
+
+
+def normalize(text: str) -> list:
+    """Splits `text` into casefolded words without accents"""
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return WORD.findall(text.casefold())
+
+
+def make_tokens(first_name: str, last_name: str, phone_number: int, country_code: int) -> set:
+    """The tokens a user can be found by: each word of their names, and their
+    phone number with and without the country code"""
+    tokens = set(normalize(first_name)) | set(normalize(last_name))
+    tokens |= {str(phone_number), f"{country_code}{phone_number}"}
+    return {token[:TOKEN_LENGTH] for token in tokens}
+
+
+def get_user_tokens(user: User) -> set:
+    return make_tokens(user.first_name, user.last_name, user.phone_number, user.country_code)
+
+
+def get_query_terms(query: str) -> list:
+    """The terms of a search, each matched against the start of a token.
+    Runs of numbers are joined, so "+234 803 123" is one phone number, and
+    leading zeros are dropped as phone numbers are stored without them."""
+    terms = []
+    for word in normalize(query):
+        if word.isdigit() and terms and terms[-1].isdigit():
+            terms[-1] += word
+        else:
+            terms.append(word)
+    terms = [term.lstrip("0") if term.isdigit() else term for term in terms]
+    return [term[:TOKEN_LENGTH] for term in terms if term]
+
+
+def starts_with(term: str) -> Q:
+    """Matches the tokens starting with `term` as a range, which unlike
+    LIKE is answered from the token index"""
+    return Q(token__gte=term, token__lt=term[:-1] + chr(ord(term[-1]) + 1))
+
+
+def index_user(user: User, created: bool = False):
+    """Brings the tokens of `user` in line with their fields"""
+    tokens = get_user_tokens(user)
+    existing = set() if created else set(user.search_tokens.values_list("token", flat=True))
+    if existing - tokens:
+        user.search_tokens.filter(token__in=existing - tokens).delete()
+    if tokens - existing:
+        UserSearchToken.objects.bulk_create(
+            [UserSearchToken(user=user, token=token) for token in tokens - existing],
+            ignore_conflicts=True,
+        )
+
+
+def rebuild_search_index(batch_size: int = 1000) -> int:
+    """Remakes the tokens of every user, such as those inserted in bulk
+    without signals. Each batch of users is swapped in its own transaction,
+    so searches keep working throughout. Returns the number of users."""
+    count = 0
+    users = User.objects.only(*SEARCH_FIELDS).order_by("pk")
+    last_pk = 0
+    while batch := list(users.filter(pk__gt=last_pk)[:batch_size]):
+        with transaction.atomic():
+            UserSearchToken.objects.filter(user__in=batch).delete()
+            UserSearchToken.objects.bulk_create(
+                UserSearchToken(user=user, token=token)
+                for user in batch
+                for token in get_user_tokens(user)
+            )
+        count += len(batch)
+        last_pk = batch[-1].pk
+    return count
+
+
+def search_users(queryset: QuerySet, query: str) -> QuerySet:
+    """Filters `queryset` to the users with a token starting with each term
+    of `query`, annotated with a `relevance`: the number of terms that match
+    a token whole.
+
+    Candidates come from the index range of the longest term, and the other
+    terms are checked against each candidate's own tokens. Every match is
+    kept, so callers page through all of them; a search reads as many rows
+    as its longest term matches tokens, however many users there are."""
+    terms = get_query_terms(query)
+    if not terms:
+        return queryset.annotate(relevance=Value(0)).none()
+
+    anchor = max(terms, key=len)
+    candidates = UserSearchToken.objects.filter(starts_with(anchor)).values("user_id")
+    queryset = queryset.filter(pk__in=candidates)
+
+    tokens = UserSearchToken.objects.filter(user=OuterRef("pk"))
+    relevance = Value(0)
+    for term in terms:
+        if term != anchor:
+            queryset = queryset.filter(Exists(tokens.filter(starts_with(term))))
+        relevance += Case(
+            When(Exists(tokens.filter(token=term)), then=1),
+            default=0,
+            output_field=IntegerField(),
+        )
+    return queryset.annotate(relevance=relevance)
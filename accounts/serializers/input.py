@@ -1,10 +1,6 @@
-import random
-from datetime import timedelta
-
 from django.conf import settings
 from django.core.validators import validate_email
 from django.db import transaction
-from django.utils import timezone
 from rest_framework import serializers
 from rest_framework.validators import ValidationError
 
@@ -71,14 +67,10 @@ class SignUpSerializer(serializers.ModelSerializer):
         validated_data.pop("confirm_password")
         password = validated_data.pop("password")
         currency: Currency = validated_data.pop("currency")
-        otp = random.randint(100000, 999999)
-        otp_expiry = timezone.now() + timedelta(minutes=10)
         user = super().create(validated_data)
         user.set_password(password)
-        user_otp = OTP.objects.create(user=user)
-        user_otp.otp = otp
-        user_otp.otp_expiry = otp_expiry
-        user_otp.max_otp_try = settings.MAX_OTP_TRY
+        user_otp = OTP(user=user, max_otp_try=settings.MAX_OTP_TRY)
+        otp = user_otp.issue(expiry_minutes=10)
         user_otp.save()
         iSwiftAccount.objects.create(
             user=user,
@@ -87,7 +79,7 @@ class SignUpSerializer(serializers.ModelSerializer):
             name=f"{(currency.iso_code).upper()} Account",
         )
         send_otp(phone_number=validated_data["phone_number"], otp=otp)
-        user.save()
+        user.save(update_fields=["password", "modified"])
         return user
 
 
@@ -1,3 +1,5 @@
+from rest_framework import serializers
+
 from accounts.models import User
 from accounts.schema import KnoxTokenSchema
 from core.serializers.output import ModelBaseSerializer
@@ -34,3 +36,13 @@ class UserLoginSerializer(UserSerializer):
 
     class Meta(UserSerializer.Meta):
         fields = UserSerializer.Meta.fields + ["authentication"]
+
+
+class UserMatchSerializer(serializers.Serializer):
+    """A user found by autocomplete, shaped like `PublicUserSerializer`"""
+
+    uid = serializers.UUIDField()
+    object = serializers.CharField(default="user")
+    first_name = serializers.CharField()
+    last_name = serializers.CharField()
+    phone_number = serializers.IntegerField()
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from accounts.autocomplete import INDEXED_FIELDS, user_autocomplete
+from accounts.models import User
+from accounts.search import SEARCH_FIELDS, index_user
+
+
+def touches(update_fields, fields: set) -> bool:
+    # Most saves, such as on login, touch none of the indexed fields
+    return update_fields is None or bool(fields & set(update_fields))
+
+
+@receiver(post_save, sender=User)
+def update_search_tokens(sender, instance: User, created: bool, update_fields=None, **kwargs):
+    if touches(update_fields, SEARCH_FIELDS):
+        index_user(instance, created=created)
+
+
+@receiver(post_save, sender=User)
+def update_autocomplete(sender, instance: User, update_fields=None, **kwargs):
+    # An index that is not loaded yet reads the user when it is loaded
+    if settings.USER_AUTOCOMPLETE and user_autocomplete.loaded:
+        if touches(update_fields, INDEXED_FIELDS):
+            transaction.on_commit(lambda: user_autocomplete.update(instance))
+
+
+@receiver(post_delete, sender=User)
+def remove_from_autocomplete(sender, instance: User, **kwargs):
+    if settings.USER_AUTOCOMPLETE and user_autocomplete.loaded:
+        pk = instance.pk
+        transaction.on_commit(lambda: user_autocomplete.remove(pk))
@@ -184,7 +184,7 @@ class ResetPasswordFromOTP(UnauthenticatedOnlyMixin, APIView):
         if password_reset_serializer.is_valid(raise_exception=True):
             password = password_reset_serializer.validated_data["password"]
             user.set_password(password)
-            user.save()
+            user.save(update_fields=["password", "modified"])
             return Response(response_dict("Password reset successful"), status.HTTP_200_OK)
 
 
@@ -202,6 +202,6 @@ class AuthUserResetPasswordView(AuthenticatedOnlyMixin, APIView):
 
             new_password = serializer.validated_data["new_password"]
             user.set_password(new_password)
-            user.save()
+            user.save(update_fields=["password", "modified"])
             login(request, user)
             return Response(response_dict("Password reset successful"), status.HTTP_200_OK)
@@ -0,0 +1,146 @@
+import threading
+from contextlib import contextmanager, nullcontext
+
+from django.conf import settings
+from django.db import OperationalError
+from django.db.backends.sqlite3 import base
+
+# Statements that never write, so never wait for the write lock
+READ_STATEMENTS = ("SELECT", "PRAGMA", "EXPLAIN")
+
+# Statements that begin or end transactions and savepoints
+TRANSACTION_STATEMENTS = ("BEGIN", "SAVEPOINT", "RELEASE", "ROLLBACK", "COMMIT")
+
+
+def is_write(query: str) -> bool:
+    return not query.lstrip()[:9].upper().startswith(READ_STATEMENTS + TRANSACTION_STATEMENTS)
+
+
+class SQLiteCursorWrapper(base.SQLiteCursorWrapper):
+    """Begins the transaction a statement runs in and takes the write lock
+    for the writes among them"""
+
+    def __init__(self, connection, wrapper: "DatabaseWrapper"):
+        super().__init__(connection)
+        self.wrapper = wrapper
+
+    def execute(self, query, params=None):
+        with self.wrapper.serialize(query):
+            return super().execute(query, params)
+
+    def executemany(self, query, param_list):
+        with self.wrapper.serialize(query):
+            return super().executemany(query, param_list)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite tuned for many threads writing to one database.
+
+    Every new connection gets `SQLITE_PRAGMAS`, which by default turn on WAL
+    so readers no longer wait for writers. With `SQLITE_WRITE_LOCK` set,
+    writers in this process queue on a lock of their own as well, instead of
+    polling SQLite's busy handler.
+
+    A transaction begins at its first statement rather than when the atomic
+    block is entered. One that writes first begins IMMEDIATE, holding the
+    write locks until it ends. One that reads first begins DEFERRED without
+    them, so read-only transactions run alongside writers, and takes them at
+    its first write. SQLite refuses that write with "database is locked" if
+    another transaction wrote in between, so blocks that read before they
+    write call `begin_writing()`, through `core.helpers.write_transaction`,
+    to begin IMMEDIATE whatever their first statement.
+    """
+
+    # Shared by the connections of every thread in this process
+    write_lock = threading.Lock()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.holds_write_lock = False
+        # Set between entering a transaction and running its first statement
+        self.begin_pending = False
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        return conn
+
+    def create_cursor(self, name=None):
+        return self.connection.cursor(factory=lambda conn: SQLiteCursorWrapper(conn, self))
+
+    def acquire_write_lock(self):
+        if not settings.SQLITE_WRITE_LOCK or self.holds_write_lock:
+            return
+
+        timeout = settings.SQLITE_PRAGMAS.get("busy_timeout", 5000) / 1000
+        if not self.write_lock.acquire(timeout=timeout):
+            raise OperationalError("database is locked")
+        self.holds_write_lock = True
+
+    def release_write_lock(self):
+        if self.holds_write_lock:
+            self.holds_write_lock = False
+            self.write_lock.release()
+
+    def serialize(self, query: str):
+        """Begins the pending transaction `query` is the first statement of.
+        Holds the write lock while `query` runs if it writes outside a
+        transaction, or until the transaction ends if it writes in one."""
+        writes = is_write(query)
+        if self.begin_pending:
+            self.begin_transaction(immediate=writes)
+        if not writes or self.holds_write_lock:
+            return nullcontext()
+        if self.connection.in_transaction:
+            self.acquire_write_lock()
+            return nullcontext()
+        return self.write_lock_held()
+
+    @contextmanager
+    def write_lock_held(self):
+        self.acquire_write_lock()
+        try:
+            yield
+        finally:
+            self.release_write_lock()
+
+    def begin_transaction(self, immediate: bool):
+        self.begin_pending = False
+        if immediate:
+            self.acquire_write_lock()
+        try:
+            self.cursor().execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        except Exception:
+            self.release_write_lock()
+            raise
+
+    def begin_writing(self):
+        """Begins the pending transaction IMMEDIATE, for one that will write"""
+        if self.begin_pending:
+            self.begin_transaction(immediate=True)
+
+    def _start_transaction_under_autocommit(self):
+        # Begun by its first statement, once it is known whether that writes
+        self.begin_pending = True
+
+    def _commit(self):
+        self.begin_pending = False
+        try:
+            return super()._commit()
+        finally:
+            self.release_write_lock()
+
+    def _rollback(self):
+        self.begin_pending = False
+        try:
+            return super()._rollback()
+        finally:
+            self.release_write_lock()
+
+    def close(self):
+        self.begin_pending = False
+        try:
+            super().close()
+        finally:
+            self.release_write_lock()
@@ -36,6 +36,10 @@ class ConversionError(Exception):
     pass
 
 
+class JournalError(Exception):
+    pass
+
+
 class NotFound(APIException):
     def __init__(self, Klass, *, verbose=False, id=None):
         self.klass = Klass
@@ -63,3 +67,24 @@ class InsufficientFunds(APIException):
     status_code = status.HTTP_400_BAD_REQUEST
     default_detail = "Insufficient funds in selected account for transaction"
     default_code = "Insufficient Funds"
+
+
+class IdempotencyKeyInUse(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "A request with this idempotency key is still in progress"
+    default_code = "Idempotency Key In Use"
+
+
+class IdempotencyKeyMismatch(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = "This idempotency key was already used with a different request"
+    default_code = "Idempotency Key Mismatch"
+
+
+class TransferPending(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = (
+        "The transfer is taking longer than expected and may still complete, "
+        "check the account's transactions before trying again"
+    )
+    default_code = "Transfer Pending"
@@ -1,7 +1,8 @@
-from django.db.models import Q, QuerySet
+from django.db.models import QuerySet
 from django_filters import rest_framework as df_filters
 
 from accounts.models import User
+from accounts.search import search_users
 
 
 class UserFilter(df_filters.FilterSet):
@@ -12,8 +13,4 @@ class UserFilter(df_filters.FilterSet):
         fields = []  # We don't need to define any fields here since we are using a custom method
 
     def custom_filter(self, queryset: QuerySet, name: str, value: str):
-        return queryset.filter(
-            Q(first_name__icontains=value)
-            | Q(phone_number__icontains=value)
-            | Q(last_name__icontains=value)
-        ).distinct()
+        return search_users(queryset, value)
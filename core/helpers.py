@@ -1,4 +1,6 @@
-from django.db import models
+from contextlib import contextmanager
+
+from django.db import models, transaction
 from django.http import Http404
 from django.shortcuts import get_object_or_404 as g_404
 from django.utils import timezone
@@ -32,3 +34,20 @@ def get_object_or_404(Klass, verbose=False, *args, **kwargs):
             raise NotFound(Klass=Klass, verbose=True, id=kwargs.get("id"))
         else:
             raise NotFound(Klass=Klass)
+
+
+@contextmanager
+def write_transaction(using=None):
+    """`transaction.atomic()` for a block that reads before it writes.
+
+    Engines that begin a transaction at its first statement, such as
+    core.backends.sqlite3, would begin this one as a reader and refuse its
+    first write if another transaction wrote in between. Here it begins as
+    a writer instead. On other engines this is `transaction.atomic()`."""
+    connection = transaction.get_connection(using)
+    begin_writing = getattr(connection, "begin_writing", lambda: None)
+    # Before the savepoint of a nested block would begin the enclosing one
+    begin_writing()
+    with transaction.atomic(using=using):
+        begin_writing()
+        yield
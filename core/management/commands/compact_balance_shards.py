@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from finance.models import iSwiftAccount
+
+
+class Command(BaseCommand):
+    help = "Fold the credits held on balance shards back into their accounts' balances"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval", type=float, help="Keep running, compacting this many seconds apart"
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            compacted = 0
+            for account in iSwiftAccount.objects.filter(balance_shards__gt=0).iterator():
+                if account.compact_shards():
+                    compacted += 1
+
+            self.stdout.write(self.style.SUCCESS(f"Compacted {compacted} sharded accounts"))
+            if options["interval"] is None:
+                return
+
+            time.sleep(options["interval"])
@@ -0,0 +1,34 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from finance.models import iSwiftAccount
+from finance.statements import STATEMENT_FORMATS, stream_statement
+
+
+class Command(BaseCommand):
+    help = "Stream the statement of an iSwift account as CSV or NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("account", help="The uid of the iSwift account")
+        parser.add_argument("--start", type=date.fromisoformat, help="First day, YYYY-MM-DD")
+        parser.add_argument("--end", type=date.fromisoformat, help="Last day, YYYY-MM-DD")
+        parser.add_argument("--file-format", choices=list(STATEMENT_FORMATS), default="csv")
+        parser.add_argument("--output", help="File to write to instead of stdout")
+
+    def handle(self, *args, **options):
+        try:
+            account = iSwiftAccount.objects.get(uid=options["account"])
+        except (iSwiftAccount.DoesNotExist, ValueError):
+            raise CommandError(f"iSwift account {options['account']} does not exist")
+
+        chunks = stream_statement(
+            account, options["file_format"], options["start"], options["end"]
+        )
+        if options["output"] is None:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending="")
+            return
+
+        with open(options["output"], "w", newline="") as file:
+            file.writelines(chunks)
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from finance.journal import project_balances
+
+
+class Command(BaseCommand):
+    help = "Fold journal postings into the balances of their accounts"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Accounts per update")
+        parser.add_argument(
+            "--interval", type=float, help="Keep running, projecting this many seconds apart"
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            count = project_balances(options["chunk_size"])
+            self.stdout.write(self.style.SUCCESS(f"Projected {count} balances"))
+            if options["interval"] is None:
+                return
+
+            time.sleep(options["interval"])
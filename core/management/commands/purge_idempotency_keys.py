@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from finance.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = "Delete expired idempotency keys in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="Keys deleted per statement"
+        )
+
+    def handle(self, *args, **options):
+        count = purge_expired_keys(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Purged {count} expired idempotency keys"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from accounts.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Remake the search tokens of every user, such as after inserting users in bulk"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Users per transaction")
+
+    def handle(self, *args, **options):
+        count = rebuild_search_index(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the search tokens of {count} users"))
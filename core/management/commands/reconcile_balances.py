@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from finance.reconciliation import get_run, reconcile
+
+
+class Command(BaseCommand):
+    help = "Check that the balance of every iSwift account matches its transactions"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, help="Accounts checked per query")
+        parser.add_argument("--workers", type=int, help="Chunks checked concurrently")
+        parser.add_argument(
+            "--restart", action="store_true", help="Start over instead of resuming the last run"
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            help="Keep running, starting a new run this many seconds after each one",
+        )
+
+    def handle(self, *args, **options):
+        run = get_run(restart=options["restart"])
+        while True:
+            run = reconcile(run, options["chunk_size"], options["workers"])
+            self.report(run)
+            if options["interval"] is None:
+                return
+
+            time.sleep(options["interval"])
+            run = get_run()
+
+    def report(self, run):
+        drifts = run.drifts.select_related("iswift_account").order_by("iswift_account")
+        for drift in drifts.iterator():
+            self.stdout.write(
+                f"{drift.iswift_account.uid}  balance {drift.balance}"
+                f"  expected {drift.expected_balance}  difference {drift.difference}"
+            )
+
+        message = f"Checked {run.accounts_checked} accounts, {run.drifts.count()} drifted"
+        style = self.style.WARNING if run.drifts.exists() else self.style.SUCCESS
+        self.stdout.write(style(message))
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from finance.payouts import resume_payout_jobs
+
+
+class Command(BaseCommand):
+    help = "Pay every unfinished payout job, resuming each from its last committed chunk"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval", type=float, help="Keep running, looking for jobs this many seconds apart"
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            resumed = resume_payout_jobs()
+            self.stdout.write(self.style.SUCCESS(f"Paid {resumed} unfinished payout jobs"))
+            if options["interval"] is None:
+                return
+
+            time.sleep(options["interval"])
@@ -0,0 +1,38 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def copy_database(source, target):
+    """Copies every page of the `source` SQLite database over `target` with
+    SQLite's online backup, which readers of `target` can run alongside"""
+    source.ensure_connection()
+    target.ensure_connection()
+    source.connection.backup(target.connection)
+
+
+class Command(BaseCommand):
+    help = "Copy the default SQLite database over each of the DATABASE_REPLICAS"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval", type=float, help="Keep running, copying this many seconds apart"
+        )
+
+    def handle(self, *args, **options):
+        source = connections[DEFAULT_DB_ALIAS]
+        if source.vendor != "sqlite":
+            raise CommandError("Only SQLite replicas are copied, others replicate themselves")
+
+        while True:
+            for alias in settings.DATABASE_REPLICAS:
+                copy_database(source, connections[alias])
+
+            copied = len(settings.DATABASE_REPLICAS)
+            self.stdout.write(self.style.SUCCESS(f"Copied the database to {copied} replicas"))
+            if options["interval"] is None:
+                return
+
+            time.sleep(options["interval"])
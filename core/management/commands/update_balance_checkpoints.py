@@ -0,0 +1,25 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from finance.checkpoints import update_balance_checkpoints
+
+
+class Command(BaseCommand):
+    help = "Write the closing balance of every account for each day since the last run"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--until",
+            type=date.fromisoformat,
+            help="Last day to checkpoint, YYYY-MM-DD. Defaults to yesterday",
+        )
+
+    def handle(self, *args, **options):
+        until = options["until"] or timezone.localdate() - timedelta(days=1)
+        if until >= timezone.localdate():
+            raise CommandError("Only days that have ended can be checkpointed")
+
+        count = update_balance_checkpoints(until)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {count} balance checkpoints"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from finance.utils import update_rates
+
+
+class Command(BaseCommand):
+    help = "Refresh the conversion rates between active currencies"
+
+    def handle(self, *args, **options):
+        count = update_rates()
+        self.stdout.write(self.style.SUCCESS(f"Updated {count} conversion rates"))
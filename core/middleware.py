@@ -0,0 +1,25 @@
+from rest_framework.permissions import SAFE_METHODS
+
+from core import routers
+
+
+class ReplicaStickinessMiddleware:
+    """Keeps a user's reads on the primary for `REPLICA_STICKY_SECONDS` after
+    a request of theirs that may have written, so they see their own writes
+    before the replicas do"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        # DRF sets the user it authenticated on the request it wraps
+        user = getattr(request, "user", None)
+        if (
+            request.method not in SAFE_METHODS
+            and response.status_code < 400
+            and user is not None
+            and user.is_authenticated
+        ):
+            routers.stick(user)
+        return response
@@ -1,6 +1,6 @@
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
 
-from core import permission_classes
+from core import permission_classes, routers
 
 
 class UnauthenticatedOnlyMixin:
@@ -9,3 +9,24 @@ class UnauthenticatedOnlyMixin:
 
 class AuthenticatedOnlyMixin:
     permission_classes = [IsAuthenticated]
+
+
+class ReadReplicaMixin:
+    """Serves safe requests from a read replica, unless the user wrote
+    recently. Authentication still reads from the primary, so a token
+    that was just issued is always found."""
+
+    replica_token = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS and not routers.is_sticky(request.user):
+            self.replica_token = routers.start_replica_reads()
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            if self.replica_token is not None:
+                routers.end_replica_reads(self.replica_token)
+                self.replica_token = None
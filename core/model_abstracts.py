@@ -6,10 +6,10 @@ from django_extensions.db.models import TimeStampedModel
 
 class Model(TimeStampedModel, models.Model):
     """Model \n
-    An abstract base model that provides a UUID field.
+    An abstract base model that provides a unique, indexed UUID field.
     """
 
-    uid = models.UUIDField(default=uuid.uuid4, editable=False)
+    uid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
 
     class Meta:
         abstract = True
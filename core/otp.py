@@ -66,36 +66,30 @@ class OTPGenerator:
         # Retrieve the phone number from the input data
         phone_number = self.data.get("phone_number")
 
-        # Get the user instance associated with the phone number
-        user = User.objects.filter(phone_number=phone_number).first()
+        # Get the user instance associated with the phone number, with their OTP information
+        user = User.objects.select_related("otp").filter(phone_number=phone_number).first()
         if not user:
             raise NotFound(User)
         # If activate_user is True and the user is already active, raise an exception
         if self.activate_user and user.is_active:
             raise PermissionDenied("Not Allowed")
 
-        # Get the user's OTP information from the database
-        user_otp = OTP.objects.filter(user=user).first()
-        if not user_otp:
+        if not hasattr(user, "otp"):
             raise NotFound(User)
+        user_otp: OTP = user.otp
 
         # If the user has reached the maximum number of OTP tries, raise an exception
         if not self._can_generate_otp(user_otp):
             message = f"Max OTP try reached. Try again after {self.max_out_minutes} minutes"
             raise BadRequest(message, status_code=status.HTTP_400_BAD_REQUEST)
 
-        # Generate a new OTP
-        otp = OTP.generate_otp()
-
-        # Set the OTP expiry time
-        otp_expiry = timezone.now() + datetime.timedelta(minutes=self.expiry_minutes)
+        # Generate a new OTP, which also sets its expiry time
+        otp = user_otp.issue(self.expiry_minutes)
 
         # Decrement the max_otp_try counter
         max_otp_try = int(user_otp.max_otp_try) - 1
 
         # Update the user's OTP information in the database
-        user_otp.otp = otp
-        user_otp.otp_expiry = otp_expiry
         user_otp.max_otp_try = max_otp_try
 
         # Update the user's OTP information based on the value of max_otp_try
@@ -174,29 +168,20 @@ class OTPVerifier:
         otp = self.data.get("otp")
         phone_number = self.data.get("phone_number")
 
-        # Get the user's OTP information from the database
-        user_otp = OTP.objects.filter(otp=otp).first()
-
-        # If no matching OTP is found, raise an exception
-        if not user_otp:
-            raise BadRequest(self.invalid_otp_message, status.HTTP_400_BAD_REQUEST)
-
-        # Get the user instance associated with the phone number
-        user = User.objects.filter(phone_number=phone_number).first()
-
-        if not user:
-            raise BadRequest(self.invalid_otp_message, status.HTTP_400_BAD_REQUEST)
+        # Get the user instance associated with the phone number, with their OTP information
+        user = User.objects.select_related("otp").filter(phone_number=phone_number).first()
 
-        # If the user and user_otp.user instances do not match, raise an exception
-        if user != user_otp.user:
+        # If the user or their OTP information is not found, raise an exception
+        if not user or not hasattr(user, "otp"):
             raise BadRequest(self.invalid_otp_message, status.HTTP_400_BAD_REQUEST)
+        user_otp: OTP = user.otp
 
         # If activate_user is True and the user is already active, raise an exception
         if self.activate_user and user.is_active:
             raise BadRequest(self.invalid_otp_message, status.HTTP_400_BAD_REQUEST)
 
         # If the OTP is not valid, raise an exception
-        if not self._is_valid_otp(user_otp):
+        if not self._is_valid_otp(user_otp, otp):
             raise BadRequest(self.invalid_otp_message, status.HTTP_400_BAD_REQUEST)
 
         # Update the user's OTP information in the database
@@ -205,23 +190,24 @@ class OTPVerifier:
         # If activate_user is True and a user instance exists, activate the user's account
         if self.activate_user and user:
             user.is_active = True
-            user.save()
+            user.save(update_fields=["is_active", "modified"])
 
         return user
 
-    def _is_valid_otp(self, user_otp: OTP):
+    def _is_valid_otp(self, user_otp: OTP, otp):
         """
         Checks if the given OTP is valid.
 
         Args:
             user_otp: An instance of the OTP model.
+            otp: The OTP to check.
 
         Returns:
             `True` if the OTP is valid, `False` otherwise.
         """
 
-        # Check if the OTP has not expired.
-        return user_otp.otp_expiry and timezone.now() < user_otp.otp_expiry
+        # Check if the OTP is the user's current one and has not expired.
+        return user_otp.check_code(otp)
 
     def _update_user_otp(self, user_otp: OTP):
         """
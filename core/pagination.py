@@ -1,5 +1,16 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.pagination import BasePagination
 from rest_framework.pagination import PageNumberPagination as DRF_PageNumberPagination
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from core.exceptions import BadRequest
 
 
 class PageNumberPagination(DRF_PageNumberPagination):
@@ -21,3 +32,136 @@ class PageNumberPagination(DRF_PageNumberPagination):
                 "results": data,
             }
         )
+
+
+def reverse_ordering(ordering: tuple) -> tuple:
+    return tuple(field[1:] if field.startswith("-") else f"-{field}" for field in ordering)
+
+
+class CursorPagination(BasePagination):
+    """Keyset pagination for tables too large to count or skip through.
+
+    Rows are ordered by `ordering`, whose fields must not be null and whose
+    last field must be unique. A cursor holds the values of those fields on
+    the row its page starts after, so every page is one query reading a page
+    of rows however deep it is. There is no count. Views opt in through
+    `pagination_class` and may set `ordering`, or pick one per request in
+    `get_ordering`, to replace the default."""
+
+    page_size = 10
+    ordering = ("-created", "-id")
+    cursor_query_param = "cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(view)
+        backwards, position = self.decode_cursor(request)
+        ordering = reverse_ordering(self.ordering) if backwards else self.ordering
+
+        queryset = queryset.order_by(*ordering)
+        try:
+            if position is not None:
+                queryset = queryset.filter(self.get_rows_after(ordering, position))
+            rows = list(queryset[: self.page_size + 1])
+        except (DjangoValidationError, TypeError, ValueError):
+            # A position that does not fit the fields it is compared with
+            raise BadRequest("Invalid cursor")
+
+        has_more = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        if backwards:
+            rows.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.page = rows
+        return rows
+
+    def get_ordering(self, view) -> tuple:
+        """The ordering of `view`, from its `get_ordering` if it has one"""
+        if hasattr(view, "get_ordering"):
+            return tuple(view.get_ordering())
+        return tuple(getattr(view, "ordering", self.ordering))
+
+    def get_rows_after(self, ordering: tuple, position: list) -> Q:
+        """Matches the rows that come after `position` in `ordering`"""
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            condition |= equal & Q(**{f"{name}__{lookup}": value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def get_position(self, row) -> list:
+        return [str(getattr(row, field.lstrip("-"))) for field in self.ordering]
+
+    def decode_cursor(self, request: Request) -> tuple:
+        """Returns whether the cursor pages backwards and the position it
+        starts after, which is `None` on the first page"""
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor is None:
+            return False, None
+
+        try:
+            backwards, position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (binascii.Error, UnicodeError, ValueError, TypeError):
+            raise BadRequest("Invalid cursor")
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise BadRequest("Invalid cursor")
+        return bool(backwards), position
+
+    def encode_cursor(self, backwards: bool, row) -> str:
+        cursor = json.dumps([backwards, self.get_position(row)])
+        cursor = base64.urlsafe_b64encode(cursor.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_next_link(self) -> str:
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(False, self.page[-1])
+
+    def get_previous_link(self) -> str:
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(True, self.page[0])
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "object": "list",
+                "links": {
+                    "next": self.get_next_link(),
+                    "previous": self.get_previous_link(),
+                },
+                "results": data,
+            }
+        )
+
+    def get_paginated_response_schema(self, schema):
+        link = {"type": "string", "nullable": True, "format": "uri"}
+        return {
+            "type": "object",
+            "required": ["object", "links", "results"],
+            "properties": {
+                "object": {"type": "string", "example": "list"},
+                "links": {
+                    "type": "object",
+                    "properties": {"next": link, "previous": link},
+                },
+                "results": schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "The cursor of the page, from the links of the one before",
+                "schema": {"type": "string"},
+            }
+        ]
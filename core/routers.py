@@ -0,0 +1,52 @@
+import random
+from contextvars import ContextVar, Token
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+STICKY_KEY = "replica-sticky:{}"
+
+# The replica the current request reads from, or None to read from the primary
+_replica = ContextVar("replica", default=None)
+
+
+def start_replica_reads() -> Token:
+    """Sends the reads that follow to a random replica, if there are any.
+    Pass the returned token to `end_replica_reads` to stop."""
+    replicas = settings.DATABASE_REPLICAS
+    return _replica.set(random.choice(replicas) if replicas else None)
+
+
+def end_replica_reads(token: Token):
+    _replica.reset(token)
+
+
+def is_sticky(user) -> bool:
+    """Whether `user` wrote in the last `REPLICA_STICKY_SECONDS`, so their
+    reads stay on the primary until the replicas have caught up"""
+    return user.is_authenticated and cache.get(STICKY_KEY.format(user.pk), False)
+
+
+def stick(user):
+    cache.set(STICKY_KEY.format(user.pk), True, timeout=settings.REPLICA_STICKY_SECONDS)
+
+
+class ReplicaRouter:
+    """Reads from a replica inside `start_replica_reads`, and from the primary
+    everywhere else. Writes always go to the primary, including those of
+    objects that were read from a replica."""
+
+    def db_for_read(self, model, **hints):
+        return _replica.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold copies of the primary's rows
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas are copied from the primary, migrations and all
+        return db not in settings.DATABASE_REPLICAS
@@ -14,3 +14,15 @@ def uid_parameter(name):
         location=OpenApiParameter.PATH,
         description=f"The uid of the {name}",
     )
+
+
+def idempotency_key_parameter():
+    return OpenApiParameter(
+        name="Idempotency-Key",
+        type=OpenApiTypes.STR,
+        location=OpenApiParameter.HEADER,
+        description=(
+            "A unique key that makes the request safe to retry. "
+            "Retries with the same key replay the first response."
+        ),
+    )
@@ -1,15 +1,35 @@
 from django.contrib import admin
 
 from finance.models import (
+    BalanceCheckpoint,
+    BalanceDrift,
+    BalanceShard,
     ConversionRate,
+    ConversionRateSnapshot,
     CreditTransaction,
     Currency,
     DebitTransaction,
+    IdempotencyKey,
+    JournalEntry,
+    PayoutItem,
+    PayoutJob,
+    Posting,
+    ReconciliationRun,
     iSwiftAccount,
 )
 
 admin.site.register(iSwiftAccount)
 admin.site.register(Currency)
 admin.site.register(ConversionRate)
+admin.site.register(ConversionRateSnapshot)
 admin.site.register(DebitTransaction)
 admin.site.register(CreditTransaction)
+admin.site.register(IdempotencyKey)
+admin.site.register(BalanceCheckpoint)
+admin.site.register(ReconciliationRun)
+admin.site.register(BalanceDrift)
+admin.site.register(JournalEntry)
+admin.site.register(Posting)
+admin.site.register(BalanceShard)
+admin.site.register(PayoutJob)
+admin.site.register(PayoutItem)
@@ -0,0 +1,162 @@
+import logging
+import threading
+import time
+from decimal import Decimal
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+RATES_VERSION_KEY = "finance:rates-version"
+
+
+def get_rates_version():
+    return cache.get(RATES_VERSION_KEY)
+
+
+def bump_rates_version():
+    """Marks every process' rate matrix as stale.
+    Each process reloads its matrix lazily the next time it is used.
+
+    The version is a fresh token rather than a counter, so a version that
+    expired or was culled from the cache can never come back as one a
+    process already loaded under, and concurrent bumps need no locking."""
+    version = uuid4().hex
+    cache.set(RATES_VERSION_KEY, version, timeout=None)
+    # This process sees its own bump at once, the others within
+    # `RATES_VERSION_CHECK_SECONDS`
+    rate_cache.expire()
+    return version
+
+
+class RateCache:
+    """Process-local cache of the full conversion rate matrix.
+
+    The matrix holds both the direct and the reverse rate of every stored
+    `ConversionRate`, keyed by currency pk, along with the snapshot each
+    rate was written from. It is tagged with the rates version it was
+    loaded under, and lookups only touch the database when the shared
+    version has moved on since the last load. The shared version is itself
+    read at most once every `RATES_VERSION_CHECK_SECONDS`, so most lookups
+    touch neither the database nor the shared cache.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        # (rates, snapshot ids), swapped together on reload
+        self._matrix = ({}, {})
+        self._version = None
+        self._loaded = False
+        # When the shared version was last read, on the monotonic clock
+        self._checked_at = None
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def get_rate(self, base_id: int, target_id: int) -> Decimal | None:
+        """Returns the rate to convert from `base_id` to `target_id`,
+        or `None` if no rate is stored for the pair"""
+        if base_id == target_id:
+            return Decimal(1)
+
+        return self.get_rates(base_id).get(target_id)
+
+    def get_rates(self, base_id: int) -> dict:
+        """Returns every rate from `base_id` keyed by the target currency pk"""
+        return self._get_matrix()[0].get(base_id, {})
+
+    def get_rate_with_snapshot(self, base_id: int, target_id: int) -> tuple:
+        """Returns the rate from `base_id` to `target_id` along with the pk
+        of the `ConversionRateSnapshot` it was written from, or `(None, None)`
+        if no rate is stored for the pair"""
+        if base_id == target_id:
+            return Decimal(1), None
+
+        return self.get_rates_with_snapshots(base_id).get(target_id, (None, None))
+
+    def get_rates_with_snapshots(self, base_id: int) -> dict:
+        """Returns `(rate, snapshot pk)` for every rate from `base_id` keyed by
+        the target currency pk. Both are read from the same matrix, so a
+        reload in between cannot pair a rate with another rate's snapshot."""
+        rates, snapshot_ids = self._get_matrix()
+        snapshot_ids = snapshot_ids.get(base_id, {})
+        return {
+            target_id: (rate, snapshot_ids.get(target_id))
+            for target_id, rate in rates.get(base_id, {}).items()
+        }
+
+    def clear(self):
+        with self._lock:
+            self._matrix = ({}, {})
+            self._version = None
+            self._loaded = False
+            self._checked_at = None
+
+    def expire(self):
+        """Makes the next lookup read the shared version"""
+        self._checked_at = None
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "version": self._version,
+        }
+
+    def _get_matrix(self) -> tuple:
+        checked_at = self._checked_at
+        now = time.monotonic()
+        if checked_at is not None and now - checked_at < settings.RATES_VERSION_CHECK_SECONDS:
+            self._count("hits")
+            return self._matrix
+
+        version = get_rates_version()
+        if self._loaded and self._version == version:
+            self._checked_at = now
+            self._count("hits")
+            return self._matrix
+
+        self._count("misses")
+        with self._lock:
+            # Another thread may have reloaded while we waited for the lock
+            if not (self._loaded and self._version == version):
+                self._matrix = self._load()
+                self._version = version
+                self._loaded = True
+                self._count("reloads")
+                logger.debug("Loaded conversion rate matrix at version %s", version)
+
+            self._checked_at = now
+            return self._matrix
+
+    def _count(self, counter: str):
+        # Lookups come from request, transfer and payout threads alike
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _load(self) -> tuple:
+        from finance.models import ConversionRate
+
+        matrix = {}
+        snapshots = {}
+        rates = ConversionRate.objects.values_list(
+            "base_currency_id",
+            "target_currency_id",
+            "conversion_rate",
+            "reverse_rate",
+            "snapshot_id",
+        )
+        for base_id, target_id, conversion_rate, reverse_rate, snapshot_id in rates:
+            matrix.setdefault(base_id, {})[target_id] = conversion_rate
+            matrix.setdefault(target_id, {})[base_id] = reverse_rate
+            snapshots.setdefault(base_id, {})[target_id] = snapshot_id
+            snapshots.setdefault(target_id, {})[base_id] = snapshot_id
+
+        return matrix, snapshots
+
+
+rate_cache = RateCache()
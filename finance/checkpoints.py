@@ -0,0 +1,122 @@
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.db.models import Max, Min, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from core.helpers import write_transaction
+from finance.models import (
+    BULK_BATCH_SIZE,
+    BalanceCheckpoint,
+    CreditTransaction,
+    DebitTransaction,
+    iSwiftAccount,
+)
+from finance.statements import get_date_range
+
+
+def get_movements(day: date) -> dict:
+    """Returns the net amount every account moved by on `day`, keyed by account pk.
+    Both totals are summed by the database over the `created` index."""
+    start, end = get_date_range(day, day)
+    movements = defaultdict(int)
+    credits = (
+        CreditTransaction.objects.filter(created__gte=start, created__lt=end)
+        .values("iswift_account")
+        .annotate(total=Sum("amount_received"))
+        .values_list("iswift_account", "total")
+    )
+    for account_id, total in credits:
+        movements[account_id] += total
+
+    debits = (
+        DebitTransaction.objects.filter(created__gte=start, created__lt=end)
+        .values("iswift_account")
+        .annotate(total=Sum("amount_sent"))
+        .values_list("iswift_account", "total")
+    )
+    for account_id, total in debits:
+        movements[account_id] -= total
+
+    return movements
+
+
+def get_opening_balances(account_ids: list, day: date) -> dict:
+    """Returns the closing balance of the last checkpoint before `day`
+    of every account in `account_ids` that has one, keyed by account pk"""
+    last_balance = (
+        BalanceCheckpoint.objects.filter(iswift_account=OuterRef("pk"), date__lt=day)
+        .order_by("-date")
+        .values("balance")[:1]
+    )
+    balances = {}
+    for i in range(0, len(account_ids), BULK_BATCH_SIZE):
+        # fmt:off
+        batch = account_ids[i:i + BULK_BATCH_SIZE]
+        # fmt:on
+        balances.update(
+            iSwiftAccount.objects.filter(pk__in=batch)
+            .annotate(opening=Subquery(last_balance))
+            .exclude(opening=None)
+            .values_list("pk", "opening")
+        )
+    return balances
+
+
+@write_transaction()
+def checkpoint_day(day: date) -> int:
+    """Writes the closing balance on `day` of every account that moved on it.
+    Returns the number of checkpoints written."""
+    _, closed_at = get_date_range(day, day)
+    movements = get_movements(day)
+    openings = get_opening_balances(list(movements), day)
+    checkpoints = [
+        BalanceCheckpoint(
+            iswift_account_id=account_id,
+            date=day,
+            closed_at=closed_at,
+            balance=openings.get(account_id, 0) + movement,
+        )
+        for account_id, movement in movements.items()
+    ]
+    BalanceCheckpoint.objects.bulk_create(checkpoints, batch_size=BULK_BATCH_SIZE)
+    return len(checkpoints)
+
+
+def get_first_open_day():
+    """The first day with no checkpoints yet: the day after the last
+    checkpoint, or the day of the oldest transaction on the first run"""
+    last_day = BalanceCheckpoint.objects.aggregate(day=Max("date"))["day"]
+    if last_day is not None:
+        return last_day + timedelta(days=1)
+
+    oldest = [
+        Klass.objects.aggregate(created=Min("created"))["created"]
+        for Klass in [CreditTransaction, DebitTransaction]
+    ]
+    oldest = [created for created in oldest if created is not None]
+    if not oldest:
+        return None
+
+    return timezone.localdate(min(oldest))
+
+
+def update_balance_checkpoints(until: date = None) -> int:
+    """Checkpoints every day after the last checkpointed day up to and
+    including `until` (defaults to yesterday), so only transactions created
+    since the last run are read. Each day is written in its own transaction
+    and a failed run resumes from the first day it did not finish.
+    Returns the number of checkpoints written."""
+    if until is None:
+        until = timezone.localdate() - timedelta(days=1)
+
+    day = get_first_open_day()
+    if day is None:
+        return 0
+
+    written = 0
+    while day <= until:
+        written += checkpoint_day(day)
+        day += timedelta(days=1)
+
+    return written
@@ -0,0 +1,62 @@
+import base64
+import binascii
+from datetime import datetime
+
+from core.exceptions import BadRequest
+from finance.models import Currency, iSwiftAccount
+
+
+def encode_cursor(row: dict) -> str:
+    position = f"{row['created'].isoformat()}|{row['object']}|{row['id']}"
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        created, row_object, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created), row_object, int(pk)
+    except (binascii.Error, UnicodeError, ValueError):
+        raise BadRequest("Invalid cursor")
+
+
+class TransactionFeed:
+    """Keyset-paginated feed of an account's credits and debits, newest first.
+
+    Every page is a single bounded query no matter how deep it is, and the
+    cursor of a page is the (created, object, id) position of its last row."""
+
+    page_size = 20
+    max_page_size = 100
+
+    def __init__(self, account: iSwiftAccount, page_size: int = None):
+        self.account = account
+        if page_size is not None:
+            self.page_size = max(1, min(page_size, self.max_page_size))
+
+    def get_page(self, cursor: str = None) -> tuple:
+        """Returns the transactions after `cursor` and the cursor
+        of the next page, which is `None` on the last page"""
+        after = decode_cursor(cursor) if cursor else None
+        rows = list(self.account.get_transactions(after=after)[: self.page_size + 1])
+        next_cursor = None
+        if len(rows) > self.page_size:
+            rows = rows[: self.page_size]
+            next_cursor = encode_cursor(rows[-1])
+
+        return [self.to_transaction(row) for row in rows], next_cursor
+
+    def to_transaction(self, row: dict) -> dict:
+        """Shapes a row for `TransactionSerializer`"""
+        return {
+            "uid": row["uid"],
+            "object": row["object"],
+            "amount": row["amount"],
+            "currency": Currency(
+                uid=row["currency_uid"],
+                name=row["currency_name"],
+                iso_code=row["currency_iso_code"],
+            ),
+            "description": row["description"],
+            "sender_or_recipient": row["sender_or_recipient"].strip(),
+            "iswift_account": self.account.uid,
+        }
@@ -0,0 +1,172 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+from core.exceptions import TransferPending
+from finance.models import iSwiftAccount, retry_on_conflict
+
+
+class GroupCommitter:
+    """Applies work submitted from any thread on a single committer thread.
+
+    The committer takes up to `size` submissions, or whatever arrives within
+    `wait_ms` of the first, and applies them in one database transaction, so
+    they share one commit instead of paying for one each. Every submission
+    runs in its own savepoint: one that fails is rolled back alone and its
+    error is handed to its caller, while the rest of the batch commits.
+    """
+
+    def __init__(self, size: int = None, wait_ms: float = None, timeout: float = None):
+        self._size = size
+        self._wait_ms = wait_ms
+        self._timeout = timeout
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.batches = 0
+
+    @property
+    def size(self) -> int:
+        return self._size or settings.TRANSFER_GROUP_COMMIT_SIZE
+
+    @property
+    def wait(self) -> float:
+        wait_ms = self._wait_ms
+        if wait_ms is None:
+            wait_ms = settings.TRANSFER_GROUP_COMMIT_WAIT_MS
+        return wait_ms / 1000
+
+    @property
+    def timeout(self) -> float:
+        if self._timeout is None:
+            return settings.TRANSFER_GROUP_COMMIT_TIMEOUT
+        return self._timeout
+
+    def call(self, fn, *args, **kwargs):
+        """Submits `fn(*args, **kwargs)` and waits up to `timeout` seconds for
+        its result. Work the committer has not picked up by then is taken
+        back and run directly, so a stalled committer cannot hang callers.
+        Work already in a batch may still commit, so it raises `TransferPending`."""
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            if future.cancel():
+                return fn(*args, **kwargs)
+            raise TransferPending()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """Queues `fn(*args, **kwargs)` and returns a future that
+        resolves once the batch it runs in is committed.
+
+        A caller in a transaction would hold its database locks while it
+        waits, and the committer needs them, so its work runs at once in
+        the caller's transaction instead. That is always the case for
+        transfers sent with an `Idempotency-Key`, whose handler runs in the
+        transaction that stores its response, so they are never grouped."""
+        future = Future()
+        if connection.in_atomic_block:
+            future.set_running_or_notify_cancel()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        self._queue.put((future, fn, args, kwargs))
+        self._start()
+        return future
+
+    def _start(self):
+        # Started on first use, so a process forked after import runs its own
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="group-commit", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = self.get_batch()
+            close_old_connections()
+            self.commit(batch)
+
+    def get_batch(self) -> list:
+        """Waits for a submission, then collects more until the batch is
+        full or `wait` has passed since the first one arrived"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.wait
+        while len(batch) < self.size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def commit(self, batch: list):
+        """Applies `batch` in one transaction and resolves its futures after
+        the commit, so no caller sees a result that could still be rolled back.
+        A batch aborted by a lock conflict is applied again from the start."""
+        batch = [work for work in batch if work[0].set_running_or_notify_cancel()]
+        try:
+            outcomes = self.apply(batch)
+        except Exception as e:
+            # The commit itself failed, so nothing in the batch was written
+            for future, *_ in batch:
+                future.set_exception(e)
+            return
+        finally:
+            self.batches += 1
+
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    @retry_on_conflict
+    def apply(self, batch: list) -> list:
+        outcomes = []
+        for future, fn, args, kwargs in batch:
+            try:
+                with transaction.atomic():
+                    outcomes.append((future, fn(*args, **kwargs), None))
+            except Exception as e:
+                outcomes.append((future, None, e))
+        return outcomes
+
+
+class TransferCommitter(GroupCommitter):
+    """A `GroupCommitter` that records the transfers of a batch together with
+    `iSwiftAccount.record_transfers`, so their accounts are locked and their
+    rows inserted once per batch instead of once per transfer. A transfer that
+    fails its checks writes nothing and gets its error, while the rest of the
+    batch commits. Batches holding other work are applied as usual."""
+
+    def apply(self, batch: list) -> list:
+        transfers = [self.get_transfer(fn, args, kwargs) for _, fn, args, kwargs in batch]
+        if None in transfers:
+            return super().apply(batch)
+
+        outcomes = iSwiftAccount.record_transfers(transfers)
+        return [(future, *outcome) for (future, *_), outcome in zip(batch, outcomes)]
+
+    @staticmethod
+    def get_transfer(fn, args: tuple, kwargs: dict):
+        """The (account, recipients, description) of work submitted as
+        `account.record_transfer(recipients, description)`, or None"""
+        if getattr(fn, "__func__", None) is not iSwiftAccount.record_transfer or kwargs:
+            return None
+        return (fn.__self__, *args)
+
+
+transfer_committer = TransferCommitter()
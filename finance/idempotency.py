@@ -0,0 +1,148 @@
+import hashlib
+import json
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from core.exceptions import BadRequest, IdempotencyKeyInUse, IdempotencyKeyMismatch
+from core.helpers import write_transaction
+from finance.models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+# Seconds between checks on a request that is still in progress
+POLL_INTERVAL = 0.05
+
+# Times a key is looked up and inserted again when its record disappears
+# between the two, because the request that claimed it failed meanwhile
+CLAIM_ATTEMPTS = 3
+
+
+def get_fingerprint(request: Request) -> str:
+    """Hashes the parts of a request that must match for a key to be replayed"""
+    body = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(f"{request.method} {request.path}\n{body}".encode()).hexdigest()
+
+
+def claim_key(user, key: str, fingerprint: str) -> tuple:
+    """Returns the record of `key` and whether this request claimed it.
+
+    A key is claimed by inserting its record, so of any number of concurrent
+    requests with the same key exactly one claims it."""
+    for _ in range(CLAIM_ATTEMPTS):
+        record = IdempotencyKey.objects.filter(user=user, key=key).first()
+        if record is not None and record.expires_at <= timezone.now():
+            record.delete()
+            record = None
+
+        if record is None:
+            try:
+                with transaction.atomic():
+                    record = IdempotencyKey.objects.create(
+                        user=user,
+                        key=key,
+                        fingerprint=fingerprint,
+                        expires_at=timezone.now()
+                        + timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS),
+                    )
+                return record, True
+            except IntegrityError:
+                # Another request claimed the key between the lookup and the
+                # insert. It may have failed and released it since, in which
+                # case the key is up for claiming again.
+                record = IdempotencyKey.objects.filter(user=user, key=key).first()
+                if record is None:
+                    continue
+
+        if record.fingerprint != fingerprint:
+            raise IdempotencyKeyMismatch()
+
+        return record, False
+
+    raise IdempotencyKeyInUse()
+
+
+def wait_for_response(record: IdempotencyKey) -> IdempotencyKey:
+    """Waits for the request that claimed `record` to store its response"""
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    while not record.is_complete:
+        if time.monotonic() >= deadline:
+            raise IdempotencyKeyInUse()
+
+        time.sleep(POLL_INTERVAL)
+        try:
+            record.refresh_from_db(fields=["status_code", "response"])
+        except IdempotencyKey.DoesNotExist:
+            # The first request failed and released the key
+            raise IdempotencyKeyInUse("The first request with this idempotency key failed")
+
+    return record
+
+
+def purge_expired_keys(batch_size: int = 1000) -> int:
+    """Deletes expired keys a batch at a time, so no single statement
+    holds locks for long. Returns the number of keys deleted."""
+    now = timezone.now()
+    deleted = 0
+    while True:
+        pks = list(
+            IdempotencyKey.objects.filter(expires_at__lte=now).values_list("pk", flat=True)[
+                :batch_size
+            ]
+        )
+        if not pks:
+            return deleted
+
+        deleted += IdempotencyKey.objects.filter(pk__in=pks).delete()[0]
+
+
+def idempotent(handler):
+    """Makes a view's handler safe to retry by sending an `Idempotency-Key` header.
+
+    The first request with a key runs as usual and its response is stored.
+    Retries with the same key and body get the stored response back without
+    running the handler again, and retries that arrive while the first
+    request is still running wait for it to finish. Failed requests release
+    their key so they can be retried.
+
+    The handler runs in a transaction that also stores its response, so a
+    request that dies part way leaves neither its writes nor a response
+    behind, only the claim on its key until that expires. Transfers it makes
+    therefore skip `TRANSFER_GROUP_COMMIT` and are recorded on their own."""
+
+    @wraps(handler)
+    def wrapper(view, request: Request, *args, **kwargs) -> Response:
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return handler(view, request, *args, **kwargs)
+
+        if not key or len(key) > IdempotencyKey._meta.get_field("key").max_length:
+            raise BadRequest(f"{IDEMPOTENCY_HEADER} must be 1 to 255 characters")
+
+        record, claimed = claim_key(request.user, key, get_fingerprint(request))
+        if not claimed:
+            record = wait_for_response(record)
+            response = Response(record.response, status=record.status_code)
+            response["Idempotent-Replayed"] = "true"
+            return response
+
+        try:
+            with write_transaction():
+                response = handler(view, request, *args, **kwargs)
+                record.status_code = response.status_code
+                record.response = response.data
+                record.save(update_fields=["status_code", "response", "modified"])
+        except Exception:
+            record.delete()
+            raise
+
+        return response
+
+    return wrapper
@@ -0,0 +1,28 @@
+from django.db.models import Max, OuterRef, Subquery
+
+from finance.models import BULK_BATCH_SIZE, Posting, iSwiftAccount
+from finance.reconciliation import get_chunks
+
+
+def project_balances(chunk_size: int = BULK_BATCH_SIZE) -> int:
+    """Folds every posting not in its account's balance yet into it.
+
+    Accounts are walked in keyset chunks and each chunk is one UPDATE that
+    only touches accounts with pending postings, so a pass holds no lock
+    for long and costs little when nothing is pending. A posting is folded
+    by sequence, whenever it committed, so no posting is ever missed.
+    Returns the number of accounts updated."""
+    last_sequence = (
+        Posting.objects.filter(iswift_account=OuterRef("pk"), shard=0)
+        .values("iswift_account")
+        .annotate(last=Max("sequence"))
+        .values("last")
+    )
+    updated = 0
+    for after, last in get_chunks(0, chunk_size):
+        updated += (
+            iSwiftAccount.objects.filter(pk__gt=after, pk__lte=last)
+            .filter(projected_sequence__lt=Subquery(last_sequence))
+            .update(**iSwiftAccount.get_projection())
+        )
+    return updated
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.6 on 2026-10-18 14:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0005_debittransaction_credittransaction_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='iswiftaccount',
+            options={'verbose_name': 'iSwift Account'},
+        ),
+        migrations.AlterField(
+            model_name='currency',
+            name='iso_code',
+            field=models.CharField(max_length=6),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-18 14:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0006_alter_iswiftaccount_options_alter_currency_iso_code'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='credittransaction',
+            index=models.Index(fields=['debit_transaction', 'iswift_account'], name='credit_debit_account_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.6 on 2026-10-18 14:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0006_credittransaction_debit_account_index'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='conversionrate',
+            constraint=models.UniqueConstraint(fields=('base_currency', 'target_currency'), name='unique_conversion_rate_pair'),
+        ),
+    ]
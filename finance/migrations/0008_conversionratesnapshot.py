@@ -0,0 +1,63 @@
+# Generated by Django 5.0.6 on 2026-10-18 14:59
+
+import core.feilds
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+import django_extensions.db.fields
+import uuid
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def snapshot_existing_rates(apps, schema_editor):
+    ConversionRate = apps.get_model("finance", "ConversionRate")
+    ConversionRateSnapshot = apps.get_model("finance", "ConversionRateSnapshot")
+    for rate in ConversionRate.objects.all():
+        rate.snapshot = ConversionRateSnapshot.objects.create(
+            base_currency_id=rate.base_currency_id,
+            target_currency_id=rate.target_currency_id,
+            conversion_rate=rate.conversion_rate,
+            reverse_rate=rate.reverse_rate,
+            effective_at=rate.modified,
+        )
+        rate.save(update_fields=["snapshot"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0007_conversionrate_unique_pair'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversionRateSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('uid', models.UUIDField(default=uuid.uuid4, editable=False)),
+                ('conversion_rate', core.feilds.MoneyField(decimal_places=10, default=0.0, max_digits=20, validators=[django.core.validators.MinValueValidator(Decimal('0.00'))])),
+                ('reverse_rate', core.feilds.MoneyField(decimal_places=10, default=0.0, max_digits=20, validators=[django.core.validators.MinValueValidator(Decimal('0.00'))])),
+                ('effective_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('base_currency', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='base_rate_snapshots', to='finance.currency')),
+                ('target_currency', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='target_rate_snapshots', to='finance.currency')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='conversionrate',
+            name='snapshot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='finance.conversionratesnapshot'),
+        ),
+        migrations.AddField(
+            model_name='credittransaction',
+            name='conversion_rate_snapshot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='credit_transactions', to='finance.conversionratesnapshot'),
+        ),
+        migrations.AddIndex(
+            model_name='conversionratesnapshot',
+            index=models.Index(fields=['base_currency', 'target_currency', 'effective_at'], name='rate_snapshot_pair_time_idx'),
+        ),
+        migrations.RunPython(snapshot_existing_rates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.0.6 on 2026-10-18 15:05
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0008_conversionratesnapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='conversionrate',
+            name='uid',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='conversionratesnapshot',
+            name='uid',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='credittransaction',
+            name='iswift_account',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='credit_transactions', to='finance.iswiftaccount'),
+        ),
+        migrations.AlterField(
+            model_name='credittransaction',
+            name='uid',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='currency',
+            name='uid',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='debittransaction',
+            name='iswift_account',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='debit_transactions', to='finance.iswiftaccount'),
+        ),
+        migrations.AlterField(
+            model_name='debittransaction',
+            name='uid',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='iswiftaccount',
+            name='uid',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='credittransaction',
+            index=models.Index(fields=['iswift_account', 'created'], name='credit_account_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='debittransaction',
+            index=models.Index(fields=['iswift_account', 'created'], name='debit_account_created_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.0.6 on 2026-10-18 15:55
+
+import django.db.models.deletion
+import django_extensions.db.fields
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0010_idempotencykey'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('uid', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('date', models.DateField()),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=10)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='credittransaction',
+            index=models.Index(fields=['created'], name='credit_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='debittransaction',
+            index=models.Index(fields=['created'], name='debit_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='balancecheckpoint',
+            name='iswift_account',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_checkpoints', to='finance.iswiftaccount'),
+        ),
+        migrations.AddConstraint(
+            model_name='balancecheckpoint',
+            constraint=models.UniqueConstraint(fields=('iswift_account', 'date'), name='unique_balance_checkpoint'),
+        ),
+    ]
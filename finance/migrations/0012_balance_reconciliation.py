@@ -0,0 +1,70 @@
+# Generated by Django 5.0.6 on 2026-10-18 15:59
+
+import django.db.models.deletion
+import django_extensions.db.fields
+import uuid
+from datetime import datetime, time, timedelta
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def set_closed_at(apps, schema_editor):
+    BalanceCheckpoint = apps.get_model("finance", "BalanceCheckpoint")
+    tz = timezone.get_current_timezone()
+    for checkpoint in BalanceCheckpoint.objects.all():
+        checkpoint.closed_at = timezone.make_aware(
+            datetime.combine(checkpoint.date + timedelta(days=1), time.min), tz
+        )
+        checkpoint.save(update_fields=["closed_at"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0011_balance_checkpoints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReconciliationRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('uid', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('watermark', models.BigIntegerField(default=0)),
+                ('accounts_checked', models.PositiveIntegerField(default=0)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='balancecheckpoint',
+            name='closed_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(set_closed_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='balancecheckpoint',
+            name='closed_at',
+            field=models.DateTimeField(),
+        ),
+        migrations.CreateModel(
+            name='BalanceDrift',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('uid', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('expected_balance', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('iswift_account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='finance.iswiftaccount')),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='drifts', to='finance.reconciliationrun')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:38
+
+import django.db.models.deletion
+import django_extensions.db.fields
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0013_journal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('uid', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('index', models.PositiveSmallIntegerField()),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+            ],
+        ),
+        migrations.RemoveConstraint(
+            model_name='posting',
+            name='unique_posting_sequence',
+        ),
+        migrations.AddField(
+            model_name='iswiftaccount',
+            name='balance_shards',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='posting',
+            name='shard',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddConstraint(
+            model_name='posting',
+            constraint=models.UniqueConstraint(fields=('iswift_account', 'shard', 'sequence'), name='unique_posting_sequence'),
+        ),
+        migrations.AddField(
+            model_name='balanceshard',
+            name='iswift_account',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='finance.iswiftaccount'),
+        ),
+        migrations.AddConstraint(
+            model_name='balanceshard',
+            constraint=models.UniqueConstraint(fields=('iswift_account', 'index'), name='unique_balance_shard'),
+        ),
+    ]
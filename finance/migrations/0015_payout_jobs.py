@@ -0,0 +1,57 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:57
+
+import django.db.models.deletion
+import django_extensions.db.fields
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0014_balance_shards'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayoutJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('uid', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('description', models.CharField(max_length=450)),
+                ('total', models.PositiveIntegerField()),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('watermark', models.PositiveIntegerField(default=0)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('iswift_account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payout_jobs', to='finance.iswiftaccount')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payout_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='PayoutItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('uid', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('index', models.PositiveIntegerField()),
+                ('recipient', models.UUIDField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('error', models.CharField(blank=True, max_length=200)),
+                ('debit_transaction', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='finance.debittransaction')),
+                ('job', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='items', to='finance.payoutjob')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='payoutitem',
+            constraint=models.UniqueConstraint(fields=('job', 'index'), name='unique_payout_item'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0015_payout_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payoutjob',
+            name='error',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+    ]
@@ -1,13 +1,103 @@
+import random
+import time
 from decimal import Decimal, InvalidOperation
+from functools import wraps
 
-from django.db import models, transaction
-from django.db.models import Q
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, OperationalError, models, transaction
+from django.db.models import (
+    Case,
+    CharField,
+    Exists,
+    F,
+    Max,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce, Concat
+from django.utils import timezone
 from django_extensions.db.models import ActivatorModel
 
 from accounts.models import User
-from core.exceptions import InsufficientFunds, SameAccountOperation
+from core import object_kebab_case
+from core.exceptions import (
+    ConversionError,
+    InsufficientFunds,
+    JournalError,
+    NotFound,
+    SameAccountOperation,
+)
 from core.feilds import MoneyField
+from core.helpers import write_transaction
 from core.model_abstracts import Model
+from finance.cache import rate_cache
+
+# Upper bound on rows written per INSERT by the bulk transfer path.
+# Backends with a lower parameter limit (e.g. SQLite) batch further.
+BULK_BATCH_SIZE = 1000
+
+# Times a journal entry is numbered and inserted before a conflict is given up on
+JOURNAL_POST_ATTEMPTS = 3
+
+# Times a transfer is run before a deadlock or serialization failure is given up on
+TRANSFER_ATTEMPTS = 5
+
+# Longest wait in seconds after the first failed attempt, doubled after each one
+TRANSFER_BACKOFF = 0.01
+
+
+# SQLSTATEs of lock timeouts, deadlocks and serialization failures
+CONFLICT_SQLSTATES = {"40001", "40P01", "55P03"}
+
+# How SQLite and the other backends word the same failures
+CONFLICT_MESSAGES = [
+    "database is locked",
+    "database table is locked",
+    "deadlock",
+    "could not serialize",
+    "lock wait timeout",
+]
+
+
+def is_conflict(error: OperationalError) -> bool:
+    """Whether `error` aborted a transaction that may succeed when run again,
+    as opposed to one that fails the same way every time, such as a missing
+    table or a lost connection"""
+    # psycopg 3 and psycopg2 name the SQLSTATE differently
+    sqlstate = getattr(error.__cause__, "sqlstate", None) or getattr(
+        error.__cause__, "pgcode", None
+    )
+    if sqlstate:
+        return sqlstate in CONFLICT_SQLSTATES
+
+    message = str(error).lower()
+    return any(conflict in message for conflict in CONFLICT_MESSAGES)
+
+
+def retry_on_conflict(method):
+    """Runs `method` in a transaction, running it again from the start when
+    the database aborts it to break a deadlock or a serialization failure,
+    or because it waited too long for a lock. Other errors are raised at once.
+    Waits are jittered so the transactions that collided do not meet again."""
+
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        for attempt in range(1, TRANSFER_ATTEMPTS + 1):
+            try:
+                with write_transaction():
+                    return method(*args, **kwargs)
+            except OperationalError as error:
+                if attempt == TRANSFER_ATTEMPTS or not is_conflict(error):
+                    raise
+
+                time.sleep(random.uniform(0, TRANSFER_BACKOFF * 2 ** (attempt - 1)))
+
+    return wrapper
 
 
 class Currency(Model, ActivatorModel):
@@ -39,14 +129,56 @@ class Currency(Model, ActivatorModel):
             # TODO raise error here?
             rate = None, None
 
+    def get_conversion_rate_as_of(self, target: "Currency", at=None):
+        """Returns the rate from this currency to `target` that was in force
+        at `at` (defaults to now), with the snapshot it was read from.
+        One query for each direction the rate may have been saved in, each a
+        single seek of the (pair, effective_at) index."""
+        if self == target:
+            return Decimal(1), None
+
+        at = at or timezone.now()
+        snapshots = [
+            ConversionRateSnapshot.objects.filter(
+                base_currency=base, target_currency=other, effective_at__lte=at
+            )
+            .order_by("-effective_at", "-pk")
+            .first()
+            for base, other in [(self, target), (target, self)]
+        ]
+        # The newest snapshot of the pair wins, whichever way it was saved
+        snapshots = [snapshot for snapshot in snapshots if snapshot is not None]
+        snapshot = max(snapshots, key=lambda s: (s.effective_at, s.pk), default=None)
+        if snapshot is None:
+            return None, None
+
+        if snapshot.base_currency_id == self.pk:
+            return snapshot.conversion_rate, snapshot
+        return snapshot.reverse_rate, snapshot
+
+    def get_conversion_rates(self) -> dict:
+        """Returns the rates from this currency to every currency it can be
+        converted to, keyed by the target currency pk.
+        Served from the process-local rate cache."""
+        rates = {self.pk: Decimal(1)}
+        rates.update(rate_cache.get_rates(self.pk))
+        return rates
+
     def convert_currency(self, target: "Currency", amount: Decimal) -> Decimal:
+        rate = rate_cache.get_rate(self.pk, target.pk)
+        if rate is None:
+            raise ConversionError(f"No conversion rate from {self} to {target}")
+
+        return self.apply_rate(rate, amount)
+
+    @staticmethod
+    def apply_rate(rate: Decimal, amount: Decimal) -> Decimal:
         if not isinstance(amount, Decimal):
             try:
                 amount = Decimal(amount)
             except InvalidOperation as e:
                 raise e
 
-        rate = self.get_conversion_rate(target)[0]
         return (amount * rate).__round__(2)
 
 
@@ -59,6 +191,51 @@ class ConversionRate(Model):
     )
     conversion_rate = MoneyField(decimal_places=10, max_digits=20)
     reverse_rate = MoneyField(decimal_places=10, max_digits=20)
+    snapshot = models.ForeignKey(
+        "ConversionRateSnapshot",
+        on_delete=models.SET_NULL,
+        related_name="+",
+        null=True,
+        blank=True,
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["base_currency", "target_currency"], name="unique_conversion_rate_pair"
+            ),
+        ]
+
+
+class ConversionRateSnapshot(Model):
+    """Append-only history of conversion rates.
+    A row is written every time the rate of a pair changes."""
+
+    base_currency = models.ForeignKey(
+        Currency, on_delete=models.PROTECT, related_name="base_rate_snapshots"
+    )
+    target_currency = models.ForeignKey(
+        Currency, on_delete=models.PROTECT, related_name="target_rate_snapshots"
+    )
+    conversion_rate = MoneyField(decimal_places=10, max_digits=20)
+    reverse_rate = MoneyField(decimal_places=10, max_digits=20)
+    effective_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["base_currency", "target_currency", "effective_at"],
+                name="rate_snapshot_pair_time_idx",
+            ),
+        ]
+
+    def save(self, **kwargs):
+        if not self._state.adding:
+            raise ConversionError("Conversion rate snapshots cannot be changed")
+        return super().save(**kwargs)
+
+    def delete(self, **kwargs):
+        raise ConversionError("Conversion rate snapshots cannot be deleted")
 
 
 class iSwiftAccount(Model, ActivatorModel):
@@ -67,79 +244,386 @@ class iSwiftAccount(Model, ActivatorModel):
     currency = models.ForeignKey(Currency, on_delete=models.PROTECT)
     balance = MoneyField()
     is_default = models.BooleanField(default=False)
+    # Sequence of the last posting folded into `balance`
+    projected_sequence = models.PositiveBigIntegerField(default=0)
+    # Number of `BalanceShard` rows credits are spread over, 0 to credit `balance`
+    balance_shards = models.PositiveSmallIntegerField(default=0)
 
     class Meta:
         verbose_name = "iSwift Account"
 
-    @transaction.atomic
+    @staticmethod
+    def get_projection() -> dict:
+        """Returns the `update()` arguments that fold the postings of each
+        updated account that are not in its balance yet into it"""
+        pending = Posting.objects.filter(
+            iswift_account=OuterRef("pk"),
+            sequence__gt=OuterRef("projected_sequence"),
+            # Postings to shards are held there instead
+            shard=0,
+        ).values("iswift_account")
+        total = pending.annotate(total=Sum("amount")).values("total")
+        last = pending.annotate(last=Max("sequence")).values("last")
+        return {
+            "balance": F("balance")
+            + Coalesce(Subquery(total), Value(Decimal(0)), output_field=models.DecimalField()),
+            "projected_sequence": Coalesce(Subquery(last), F("projected_sequence")),
+        }
+
+    @staticmethod
+    def lock_accounts(pks: list) -> dict:
+        """Locks the rows of the accounts in `pks` with a single
+        `SELECT ... FOR UPDATE` in primary key order. Every transfer takes its
+        locks in the same order, so two over the same accounts queue behind
+        each other instead of deadlocking. Returns the locked accounts keyed by pk."""
+        accounts = iSwiftAccount.objects.select_for_update().filter(pk__in=set(pks)).order_by("pk")
+        return {account.pk: account for account in accounts}
+
+    def get_written_accounts(self, accounts: list) -> list:
+        """The pks of this account and of those of `accounts` whose row
+        a credit from it updates: not sharded, and not left to the projector"""
+        if settings.JOURNAL_DEFERRED_CREDITS:
+            return [self.pk]
+        return [self.pk] + [account.pk for account in accounts if not account.balance_shards]
+
+    def refresh_balance(self, locked: dict):
+        """Takes the balance of this account from its locked row, if it was locked"""
+        if self.pk in locked:
+            self.balance = locked[self.pk].balance
+            self.projected_sequence = locked[self.pk].projected_sequence
+
     def record_transfer(self, recipients: list, description: str):
-        total_amount = sum(re["amount"] for re in recipients)
-        if Decimal(total_amount) > self.balance:
-            raise InsufficientFunds()
-
-        debit = DebitTransaction(
-            description=description,
-            iswift_account=self,
-            currency=self.currency,
-            amount_sent=total_amount,
-        )
-        if len(recipients) == 1:
-            user = recipients[0]["recipient"]
-            amount = recipients[0]["amount"]
-            debit.recipient = user
-            debit.save()
-            iswift_account = user.iswift_accounts.get(is_default=True)
-            if iswift_account == self:
-                raise SameAccountOperation()
-
-            iswift_account.record_credit(debit, amount)
-            self.balance -= amount
-            self.save()
-            return debit
-
-        debit.save()
-        for re in recipients:
-            user = re["recipient"]
-            amount = re["amount"]
-            user.iswift_accounts.get(is_default=True).record_credit(debit, amount)
-            self.balance -= amount
+        """Debits this account once and credits the default account of every
+        recipient. The number of queries does not grow with the number of
+        recipients, apart from the batching done by `bulk_create`.
 
-        self.save()
+        The balance is checked after the rows the transfer updates are
+        locked, so concurrent transfers from one account cannot overspend it.
+        A sharded account's own balance never goes negative: its shards are
+        compacted first when it does not cover the transfer."""
+        ((debit, error),) = iSwiftAccount.record_transfers([(self, recipients, description)])
+        if error is not None:
+            raise error
         return debit
 
-    @transaction.atomic
-    def record_credit(self, debit_transaction: "DebitTransaction", amount):
+    @staticmethod
+    @retry_on_conflict
+    def record_transfers(transfers: list) -> list:
+        """Records `transfers`, (account, recipients, description) tuples, in
+        one transaction as `record_transfer` would one after the other. The
+        accounts of all of them are read and locked together and their rows
+        inserted together, so the number of queries does not grow with the
+        number of transfers either.
+
+        Returns a (debit, error) pair for each transfer. One that fails its
+        checks writes nothing and gets the error, while the rest are recorded."""
+        outcomes = [(None, None)] * len(transfers)
+        resolved = iSwiftAccount.get_recipient_accounts(
+            [recipients for _, recipients, _ in transfers]
+        )
+        written = []
+        for i, (account, _, _) in enumerate(transfers):
+            if resolved[i] is None:
+                outcomes[i] = (None, NotFound(iSwiftAccount))
+            elif account.pk in {recipient.pk for recipient in resolved[i].values()}:
+                outcomes[i] = (None, SameAccountOperation())
+            else:
+                written += account.get_written_accounts(resolved[i].values())
 
-        if self == debit_transaction.iswift_account:
-            raise SameAccountOperation()
+        locked = iSwiftAccount.lock_accounts(written)
+        # Balances as the transfers checked so far left them
+        balances = {pk: account.balance for pk, account in locked.items()}
+        rates = {}
+        recorded = []
+        for i, (account, recipients, description) in enumerate(transfers):
+            if outcomes[i][1] is not None:
+                continue
+
+            account.refresh_balance(locked)
+            total_amount = sum(re["amount"] for re in recipients)
+            if account.balance_shards and Decimal(total_amount) > balances[account.pk]:
+                # The debit is taken from this account's own balance, so the
+                # credits held on its shards are folded in before it is checked
+                balances[account.pk] += account.compact_shards()
+            if Decimal(total_amount) > balances[account.pk]:
+                outcomes[i] = (None, InsufficientFunds())
+                continue
+
+            if account.currency_id not in rates:
+                rates[account.currency_id] = {account.currency_id: (Decimal(1), None)}
+                rates[account.currency_id].update(
+                    rate_cache.get_rates_with_snapshots(account.currency_id)
+                )
+
+            debit = DebitTransaction(
+                description=description,
+                iswift_account=account,
+                currency_id=account.currency_id,
+                amount_sent=total_amount,
+            )
+            if len(recipients) == 1:
+                debit.recipient = recipients[0]["recipient"]
 
-        if not isinstance(amount, Decimal):
             try:
-                amount = Decimal(amount)
-            except InvalidOperation as e:
-                raise e
+                credits = debit.get_credits(resolved[i], recipients, rates[account.currency_id])
+            except ConversionError as e:
+                outcomes[i] = (None, e)
+                continue
+
+            balances[account.pk] -= total_amount
+            if not settings.JOURNAL_DEFERRED_CREDITS:
+                for credit in credits:
+                    pk = credit.iswift_account_id
+                    if pk in balances and not credit.iswift_account.balance_shards:
+                        balances[pk] += credit.amount_received
+
+            outcomes[i] = (debit, None)
+            recorded.append((account, debit, credits))
+
+        if recorded:
+            iSwiftAccount.write_transfers(recorded)
+
+        if settings.JOURNAL_DEFERRED_CREDITS:
+            # Credits to the senders still pending were folded in as well
+            senders = {account.pk for account, *_ in recorded}
+            fresh = iSwiftAccount.objects.filter(pk__in=senders).values_list(
+                "pk", "balance", "projected_sequence"
+            )
+            projected = {pk: (balance, sequence) for pk, balance, sequence in fresh}
+            for account, *_ in recorded:
+                account.balance, account.projected_sequence = projected[account.pk]
+        else:
+            for account, *_ in recorded:
+                account.balance = balances[account.pk]
+        return outcomes
 
-        amount_received = debit_transaction.iswift_account.currency.convert_currency(
-            self.currency, amount
+    @staticmethod
+    def write_transfers(transfers: list):
+        """Inserts the debits, credits and journal entries of `transfers`,
+        (account, debit, credits) tuples already checked, and updates the
+        balances they move, with the same queries however many there are"""
+        DebitTransaction.objects.bulk_create(
+            [debit for _, debit, _ in transfers], batch_size=BULK_BATCH_SIZE
+        )
+        CreditTransaction.objects.bulk_create(
+            [credit for _, _, credits in transfers for credit in credits],
+            batch_size=BULK_BATCH_SIZE,
         )
+        entries = JournalEntry.objects.bulk_create(
+            [
+                JournalEntry(
+                    description=debit.description,
+                    currency_id=debit.currency_id,
+                    debit_transaction=debit,
+                )
+                for _, debit, _ in transfers
+            ],
+            batch_size=BULK_BATCH_SIZE,
+        )
+
+        postings = []
+        for entry, (account, debit, credits) in zip(entries, transfers):
+            amount = debit.amount_sent
+            entry_postings = [
+                Posting(iswift_account=account, amount=-amount, entry_amount=-amount)
+            ]
+            entry_postings += [
+                Posting(
+                    iswift_account_id=credit.iswift_account_id,
+                    amount=credit.amount_received,
+                    entry_amount=credit.amount_sent,
+                    shard=credit.iswift_account.get_shard(credit),
+                )
+                for credit in credits
+            ]
+            postings.append((entry, entry_postings))
+        JournalEntry.post_entries(postings)
+
+        credited = [posting for _, entry_postings in postings for posting in entry_postings[1:]]
+        if any(posting.shard for posting in credited):
+            BalanceShard.apply(entries)
+
+        # The senders are always projected, so their balances never include money they sent
+        projected = {account.pk for account, *_ in transfers}
+        if not settings.JOURNAL_DEFERRED_CREDITS:
+            projected |= {posting.iswift_account_id for posting in credited if not posting.shard}
+        iSwiftAccount.objects.filter(pk__in=projected).update(**iSwiftAccount.get_projection())
+
+    @staticmethod
+    def get_recipient_accounts(recipient_lists: list) -> list:
+        """Returns the default account of every recipient of each list of
+        `recipient_lists` keyed by user pk, read in one query for all of them,
+        or None for a list with a recipient that has none. Accounts already
+        resolved by the caller under `iswift_account` are reused."""
+        users = {
+            re["recipient"].pk
+            for recipients in recipient_lists
+            if not all("iswift_account" in re for re in recipients)
+            for re in recipients
+        }
+        defaults = {}
+        if users:
+            defaults = {
+                account.user_id: account
+                for account in iSwiftAccount.objects.filter(user__in=users, is_default=True)
+            }
 
-        credit = CreditTransaction(
-            iswift_account=self,
-            description=debit_transaction.description,
-            debit_transaction=debit_transaction,
-            sender=debit_transaction.iswift_account.user,
-            amount_sent=amount,
-            currency_sent=debit_transaction.iswift_account.currency,
-            currency_received=self.currency,
-            amount_received=amount_received,
+        resolved = []
+        for recipients in recipient_lists:
+            if all("iswift_account" in re for re in recipients):
+                resolved.append({re["recipient"].pk: re["iswift_account"] for re in recipients})
+            elif all(re["recipient"].pk in defaults for re in recipients):
+                resolved.append(
+                    {re["recipient"].pk: defaults[re["recipient"].pk] for re in recipients}
+                )
+            else:
+                resolved.append(None)
+        return resolved
+
+    def get_balance(self) -> Decimal:
+        """The balance of this account, including the credits held on its shards"""
+        if not self.balance_shards:
+            return self.balance
+
+        held = self.shards.aggregate(total=Sum("balance"))["total"] or 0
+        return self.balance + held
+
+    def get_shard(self, credit: "CreditTransaction") -> int:
+        """The index of the shard `credit` is held on, picked by its uid so
+        credits spread evenly without a shared counter. 0, this account's own
+        balance, when it is not sharded."""
+        if not self.balance_shards:
+            return 0
+        return 1 + credit.uid.int % self.balance_shards
+
+    @write_transaction()
+    def compact_shards(self):
+        """Folds the credits held on the shards of this account into its balance"""
+        shards = BalanceShard.objects.select_for_update().filter(iswift_account=self)
+        held = sum(balance for balance in shards.values_list("balance", flat=True))
+        if held:
+            shards.update(balance=0)
+            iSwiftAccount.objects.filter(pk=self.pk).update(balance=F("balance") + held)
+            self.balance += held
+        return held
+
+    @write_transaction()
+    def set_balance_shards(self, count: int):
+        """Spreads credits to this account over `count` shards, or stops
+        sharding it with a `count` of 0. Held credits are compacted first."""
+        iSwiftAccount.objects.select_for_update().filter(pk=self.pk).first()
+        self.compact_shards()
+        BalanceShard.objects.filter(iswift_account=self, index__gt=count).delete()
+        BalanceShard.objects.bulk_create(
+            [BalanceShard(iswift_account=self, index=index) for index in range(1, count + 1)],
+            ignore_conflicts=True,
         )
-        self.balance += amount_received
-        credit.save()
-        self.save()
+        self.balance_shards = count
+        self.save(update_fields=["balance_shards", "modified"])
+        return self
 
-        return credit
+    def get_transactions(self, after: tuple = None, newest_first=True, start=None, end=None):
+        """Returns the credits and debits of this account as a single
+        DB-side UNION of values, ordered by (created, object, id). Credits
+        and debits are numbered apart, so their `object` breaks ties between
+        a credit and a debit with the same `created` and `id`.
 
-    @transaction.atomic
+        `after` is the (created, object, id) keyset position of the last row
+        already read; only rows past it in the requested order are returned.
+        `start` and `end` limit the rows to those created in [start, end)."""
+        credit_object = object_kebab_case(CreditTransaction())
+        debit_object = object_kebab_case(DebitTransaction())
+        credits = self.credit_transactions.values(
+            "id",
+            "created",
+            "uid",
+            "description",
+            amount=F("amount_received"),
+            object=Value(credit_object),
+            currency_uid=F("currency_received__uid"),
+            currency_name=F("currency_received__name"),
+            currency_iso_code=F("currency_received__iso_code"),
+            sender_or_recipient=Concat("sender__first_name", Value(" "), "sender__last_name"),
+        )
+        debits = self.debit_transactions.values(
+            "id",
+            "created",
+            "uid",
+            "description",
+            amount=F("amount_sent"),
+            object=Value(debit_object),
+            currency_uid=F("currency__uid"),
+            currency_name=F("currency__name"),
+            currency_iso_code=F("currency__iso_code"),
+            sender_or_recipient=Case(
+                When(recipient__isnull=True, then=Value("Bulk Transfer")),
+                default=Concat("recipient__first_name", Value(" "), "recipient__last_name"),
+                output_field=CharField(),
+            ),
+        )
+
+        if after is not None:
+            credits = credits.filter(self._get_position_after(after, credit_object, newest_first))
+            debits = debits.filter(self._get_position_after(after, debit_object, newest_first))
+
+        if start is not None:
+            credits = credits.filter(created__gte=start)
+            debits = debits.filter(created__gte=start)
+
+        if end is not None:
+            credits = credits.filter(created__lt=end)
+            debits = debits.filter(created__lt=end)
+
+        if newest_first:
+            return credits.union(debits, all=True).order_by("-created", "-object", "-id")
+
+        return credits.union(debits, all=True).order_by("created", "object", "id")
+
+    @staticmethod
+    def _get_position_after(after: tuple, row_object: str, newest_first: bool) -> Q:
+        """Returns the filter on the rows of one side of the UNION, whose
+        `object` is `row_object`, that come after the position `after`"""
+        created, after_object, pk = after
+        if newest_first:
+            before = Q(created__lt=created)
+            if row_object < after_object:
+                return before | Q(created=created)
+            if row_object == after_object:
+                return before | Q(created=created, pk__lt=pk)
+            return before
+
+        later = Q(created__gt=created)
+        if row_object > after_object:
+            return later | Q(created=created)
+        if row_object == after_object:
+            return later | Q(created=created, pk__gt=pk)
+        return later
+
+    def get_balance_as_of(self, at=None) -> Decimal:
+        """Returns the balance of this account at `at` (defaults to now), as
+        implied by its transactions: the closing balance of the last
+        checkpointed day before `at` plus the credits and debits since.
+        Each part is a seek on a per-account index, so the cost does not
+        grow with the age of the account."""
+        at = at or timezone.now()
+        checkpoint = (
+            self.balance_checkpoints.filter(date__lt=timezone.localdate(at))
+            .order_by("-date")
+            .first()
+        )
+        credits = self.credit_transactions.filter(created__lt=at)
+        debits = self.debit_transactions.filter(created__lt=at)
+        balance = Decimal("0.00")
+        if checkpoint is not None:
+            credits = credits.filter(created__gte=checkpoint.closed_at)
+            debits = debits.filter(created__gte=checkpoint.closed_at)
+            balance = checkpoint.balance
+
+        credited = credits.aggregate(total=Sum("amount_received"))["total"] or 0
+        debited = debits.aggregate(total=Sum("amount_sent"))["total"] or 0
+        return balance + credited - debited
+
+    @write_transaction()
     def set_default(self):
         # Lock the rows to prevent race conditions
         accounts = iSwiftAccount.objects.select_for_update().filter(user=self.user)
@@ -151,22 +635,66 @@ class iSwiftAccount(Model, ActivatorModel):
 
 class DebitTransaction(Model):
     iswift_account = models.ForeignKey(
-        iSwiftAccount, on_delete=models.PROTECT, related_name="debit_transactions"
+        iSwiftAccount,
+        on_delete=models.PROTECT,
+        related_name="debit_transactions",
+        # Covered by debit_account_created_idx
+        db_index=False,
     )
     description = models.CharField(max_length=500)
     currency = models.ForeignKey(Currency, on_delete=models.PROTECT)
     recipient = models.ForeignKey(User, on_delete=models.PROTECT, null=True, blank=True)
     amount_sent = MoneyField()
 
+    class Meta:
+        indexes = [
+            # Per-account history, newest first
+            models.Index(fields=["iswift_account", "created"], name="debit_account_created_idx"),
+            # Read by the balance checkpoint job a day at a time
+            models.Index(fields=["created"], name="debit_created_idx"),
+        ]
+
     def save(self, **kwargs):
         data = super().save(**kwargs)
         # TODO send notification
         return data
 
+    def get_credits(self, accounts: dict, recipients: list, rates: dict) -> list:
+        """Builds the credit of this debit to the account in `accounts` of every
+        recipient, converted at the rate in `rates` from the debit's currency.
+        Raises `ConversionError` when there is none."""
+        credits = []
+        for re in recipients:
+            account = accounts[re["recipient"].pk]
+            rate, snapshot_id = rates.get(account.currency_id, (None, None))
+            if rate is None:
+                raise ConversionError(
+                    f"No conversion rate from {self.currency} to {account.currency}"
+                )
+
+            credits.append(
+                CreditTransaction(
+                    iswift_account=account,
+                    description=self.description,
+                    debit_transaction=self,
+                    sender_id=self.iswift_account.user_id,
+                    amount_sent=re["amount"],
+                    currency_sent_id=self.currency_id,
+                    currency_received_id=account.currency_id,
+                    amount_received=Currency.apply_rate(rate, re["amount"]),
+                    conversion_rate_snapshot_id=snapshot_id,
+                )
+            )
+        return credits
+
 
 class CreditTransaction(Model):
     iswift_account = models.ForeignKey(
-        iSwiftAccount, on_delete=models.PROTECT, related_name="credit_transactions"
+        iSwiftAccount,
+        on_delete=models.PROTECT,
+        related_name="credit_transactions",
+        # Covered by credit_account_created_idx
+        db_index=False,
     )
     description = models.CharField(max_length=500)
 
@@ -188,8 +716,333 @@ class CreditTransaction(Model):
     currency_sent = models.ForeignKey(
         Currency, on_delete=models.PROTECT, related_name="currency_sent"
     )
+    # The rate the amount was converted at, when the rate has a snapshot
+    conversion_rate_snapshot = models.ForeignKey(
+        ConversionRateSnapshot,
+        on_delete=models.PROTECT,
+        related_name="credit_transactions",
+        null=True,
+        blank=True,
+    )
+
+    class Meta:
+        indexes = [
+            # A debit's credits, as prefetched by DebitTransactionSerializer
+            models.Index(
+                fields=["debit_transaction", "iswift_account"], name="credit_debit_account_idx"
+            ),
+            # Per-account history, newest first
+            models.Index(fields=["iswift_account", "created"], name="credit_account_created_idx"),
+            # Read by the balance checkpoint job a day at a time
+            models.Index(fields=["created"], name="credit_created_idx"),
+        ]
 
     def save(self, **kwargs):
         data = super().save(**kwargs)
         # TODO send notification
         return data
+
+
+class IdempotencyKey(Model):
+    """A client supplied key that makes a mutating request safe to retry.
+
+    The first request with a key claims it and stores its response when it
+    completes. Retries with the same key replay that response instead of
+    running the request again."""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    # Both are empty while the first request is still running
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "key"], name="unique_idempotency_key")
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.__class__.__name__} - {self.key}"
+
+    @property
+    def is_complete(self) -> bool:
+        return self.status_code is not None
+
+
+class BalanceCheckpoint(Model):
+    """The closing balance of an account at the end of a day, as implied by
+    its transactions. Only days on which the account moved get a row, the
+    closing balance of any other day is that of the last row before it."""
+
+    iswift_account = models.ForeignKey(
+        iSwiftAccount, on_delete=models.CASCADE, related_name="balance_checkpoints"
+    )
+    date = models.DateField()
+    # The moment the day ended, where transactions after the checkpoint start
+    closed_at = models.DateTimeField()
+    balance = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["iswift_account", "date"], name="unique_balance_checkpoint"
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.__class__.__name__} - {self.iswift_account_id} {self.date}"
+
+
+class ReconciliationRun(Model):
+    """A pass of the reconciliation job over every account in pk order.
+    `watermark` is the pk of the last account checked, so an interrupted
+    run resumes right after it."""
+
+    watermark = models.BigIntegerField(default=0)
+    accounts_checked = models.PositiveIntegerField(default=0)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"{self.__class__.__name__} - {self.created}"
+
+    @property
+    def is_finished(self) -> bool:
+        return self.finished_at is not None
+
+
+class BalanceDrift(Model):
+    """An account whose balance did not match its transactions when a run checked it"""
+
+    run = models.ForeignKey(ReconciliationRun, on_delete=models.CASCADE, related_name="drifts")
+    iswift_account = models.ForeignKey(iSwiftAccount, on_delete=models.CASCADE, related_name="+")
+    balance = models.DecimalField(max_digits=10, decimal_places=2)
+    expected_balance = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self) -> str:
+        return f"{self.__class__.__name__} - {self.iswift_account_id} {self.difference}"
+
+    @property
+    def difference(self) -> Decimal:
+        return self.balance - self.expected_balance
+
+
+class JournalEntry(Model):
+    """A movement of money between accounts. Its postings sum to zero in the
+    currency the money was sent in, and neither is changed once written."""
+
+    description = models.CharField(max_length=500)
+    # The currency the money was sent in
+    currency = models.ForeignKey(Currency, on_delete=models.PROTECT, related_name="+")
+    debit_transaction = models.ForeignKey(
+        DebitTransaction,
+        on_delete=models.PROTECT,
+        related_name="journal_entries",
+        null=True,
+        blank=True,
+    )
+
+    def save(self, **kwargs):
+        if not self._state.adding:
+            raise JournalError("Journal entries cannot be changed")
+        return super().save(**kwargs)
+
+    def delete(self, **kwargs):
+        raise JournalError("Journal entries cannot be deleted")
+
+    def post(self, postings: list) -> list:
+        """Writes `postings` under this entry, see `post_entries`"""
+        return JournalEntry.post_entries([(self, postings)])
+
+    @staticmethod
+    def post_entries(entries: list) -> list:
+        """Writes the postings of every (entry, postings) pair of `entries`
+        under its entry, numbering each one after the last posting of its
+        account and shard. Raises `JournalError` unless the postings of each
+        entry sum to zero in its currency.
+
+        Numbers are read then inserted, so a concurrent entry may take one
+        first; the unique (account, shard, sequence) constraint rejects the
+        second insert and the numbers are read again."""
+        for _, postings in entries:
+            if sum(posting.entry_amount for posting in postings) != 0:
+                raise JournalError("The postings of a journal entry must sum to zero")
+
+        all_postings = [posting for _, postings in entries for posting in postings]
+        account_ids = list({posting.iswift_account_id for posting in all_postings})
+        for attempt in range(1, JOURNAL_POST_ATTEMPTS + 1):
+            sequences = Posting.get_last_sequences(account_ids)
+            for entry, postings in entries:
+                for posting in postings:
+                    stream = (posting.iswift_account_id, posting.shard)
+                    sequences[stream] = sequences.get(stream, 0) + 1
+                    posting.entry = entry
+                    posting.sequence = sequences[stream]
+
+            try:
+                with transaction.atomic():
+                    return Posting.objects.bulk_create(all_postings, batch_size=BULK_BATCH_SIZE)
+            except IntegrityError:
+                if attempt == JOURNAL_POST_ATTEMPTS:
+                    raise
+
+
+class Posting(Model):
+    """One line of a journal entry: what it moved one account by, in the
+    account's currency (`amount`) and in the entry's (`entry_amount`).
+    Credits are positive and debits negative."""
+
+    entry = models.ForeignKey(JournalEntry, on_delete=models.PROTECT, related_name="postings")
+    iswift_account = models.ForeignKey(
+        iSwiftAccount,
+        on_delete=models.PROTECT,
+        related_name="postings",
+        # Covered by unique_posting_sequence
+        db_index=False,
+    )
+    # The index of the balance shard the amount was added to,
+    # or 0 for the account's own balance
+    shard = models.PositiveSmallIntegerField(default=0)
+    # Position in the journal of the account's shard, from 1 with no gaps.
+    # Each shard is numbered apart so credits to a sharded account do not
+    # contend for the next number either.
+    sequence = models.PositiveBigIntegerField()
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    entry_amount = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["iswift_account", "shard", "sequence"], name="unique_posting_sequence"
+            )
+        ]
+
+    def save(self, **kwargs):
+        if not self._state.adding:
+            raise JournalError("Postings cannot be changed")
+        return super().save(**kwargs)
+
+    def delete(self, **kwargs):
+        raise JournalError("Postings cannot be deleted")
+
+    @staticmethod
+    def get_last_sequences(account_ids: list) -> dict:
+        """Returns the sequence of the last posting of every shard of the
+        accounts in `account_ids` that has one, keyed by (account pk, shard)"""
+        sequences = {}
+        for i in range(0, len(account_ids), BULK_BATCH_SIZE):
+            # fmt:off
+            batch = account_ids[i:i + BULK_BATCH_SIZE]
+            # fmt:on
+            last_sequences = (
+                Posting.objects.filter(iswift_account__in=batch)
+                .values("iswift_account", "shard")
+                .annotate(last=Max("sequence"))
+                .values_list("iswift_account", "shard", "last")
+            )
+            for account_id, shard, last in last_sequences:
+                sequences[account_id, shard] = last
+        return sequences
+
+
+class BalanceShard(Model):
+    """Part of the balance of a sharded account, numbered from 1. Credits to
+    the account are added to one of its shards instead of its own row, so
+    concurrent credits rarely wait on each other. The shards are folded back
+    by compaction."""
+
+    iswift_account = models.ForeignKey(
+        iSwiftAccount,
+        on_delete=models.CASCADE,
+        related_name="shards",
+        # Covered by unique_balance_shard
+        db_index=False,
+    )
+    index = models.PositiveSmallIntegerField()
+    balance = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["iswift_account", "index"], name="unique_balance_shard"
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.__class__.__name__} - {self.iswift_account_id} {self.index}"
+
+    @staticmethod
+    def apply(entries: list) -> int:
+        """Adds the sharded postings of `entries` to their shards in one statement"""
+        postings = Posting.objects.filter(entry__in=entries).exclude(shard=0)
+        applied = postings.filter(
+            iswift_account=OuterRef("iswift_account"), shard=OuterRef("index")
+        )
+        total = applied.values("iswift_account").annotate(total=Sum("amount")).values("total")
+        return (
+            BalanceShard.objects.filter(iswift_account__in=postings.values("iswift_account"))
+            .filter(Exists(applied))
+            .update(balance=F("balance") + Subquery(total))
+        )
+
+
+class PayoutJob(Model):
+    """A bulk transfer uploaded as a file and paid in the background a chunk
+    of items at a time. `watermark` is the index of the last item of the last
+    committed chunk, so a job interrupted by a restart resumes right after it.
+    A job stopped by an unexpected error is finished with the error in `error`."""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="payout_jobs")
+    iswift_account = models.ForeignKey(
+        iSwiftAccount, on_delete=models.CASCADE, related_name="payout_jobs"
+    )
+    description = models.CharField(max_length=450)
+    total = models.PositiveIntegerField()
+    processed = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    watermark = models.PositiveIntegerField(default=0)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    error = models.CharField(max_length=200, blank=True)
+
+    def __str__(self) -> str:
+        return f"{self.__class__.__name__} - {self.uid} {self.processed}/{self.total}"
+
+    @property
+    def remaining(self) -> int:
+        return self.total - self.processed
+
+    @property
+    def is_finished(self) -> bool:
+        return self.finished_at is not None
+
+
+class PayoutItem(Model):
+    """One recipient of a payout job, as uploaded. It is paid once
+    `debit_transaction` is set, and failed if `error` is."""
+
+    job = models.ForeignKey(
+        PayoutJob,
+        on_delete=models.CASCADE,
+        related_name="items",
+        # Covered by unique_payout_item
+        db_index=False,
+    )
+    # Position in the uploaded file, from 1
+    index = models.PositiveIntegerField()
+    # Uid of the recipient user
+    recipient = models.UUIDField()
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    # The debit of the chunk the item was paid in
+    debit_transaction = models.ForeignKey(
+        DebitTransaction, on_delete=models.PROTECT, related_name="+", null=True, blank=True
+    )
+    error = models.CharField(max_length=200, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["job", "index"], name="unique_payout_item")
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.__class__.__name__} - {self.job_id} {self.index}"
@@ -0,0 +1,243 @@
+import csv
+import io
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from core.exceptions import InsufficientFunds
+from core.helpers import write_transaction
+from core.serializers.fields import DecimalField
+from finance.models import BULK_BATCH_SIZE, PayoutItem, PayoutJob, iSwiftAccount
+
+logger = logging.getLogger(__name__)
+
+PAYOUT_COLUMNS = ["recipient", "amount"]
+
+_pool = None
+_pool_lock = threading.Lock()
+# Futures of the jobs resumed when the pool started, by job pk. Popped by the
+# worker that finishes a job as well as by `start_payout_job`, hence the lock.
+_resumed = {}
+_resumed_lock = threading.Lock()
+
+
+def read_payout_file(file) -> list:
+    """Returns the rows of an uploaded recipients file as dicts. JSON files
+    hold a list of objects and anything else is read as CSV with a header.
+    Raises `ValueError` if the file cannot be read."""
+    if file.name.lower().endswith(".json"):
+        rows = json.load(file)
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValueError("A JSON recipients file must hold a list of objects")
+        return rows
+
+    reader = csv.DictReader(io.TextIOWrapper(file, encoding="utf-8-sig"))
+    missing = set(PAYOUT_COLUMNS) - set(reader.fieldnames or [])
+    if missing:
+        raise ValueError(f"The recipients file has no {', '.join(sorted(missing))} column")
+    return list(reader)
+
+
+def parse_payout_rows(rows: list) -> list:
+    """Validates the recipient and amount of every row without touching the
+    database. Returns `(recipient, amount)` pairs, or raises a `ValidationError`
+    naming every invalid row by its position in the file, from 1."""
+    recipient_field = serializers.UUIDField()
+    amount_field = DecimalField()
+    parsed = []
+    errors = []
+    for index, row in enumerate(rows, start=1):
+        try:
+            parsed.append(
+                (
+                    recipient_field.run_validation(row.get("recipient")),
+                    amount_field.run_validation(row.get("amount")),
+                )
+            )
+        except serializers.ValidationError as e:
+            errors.append(f"Row {index}: {' '.join(str(detail) for detail in e.detail)}")
+
+    if errors:
+        raise serializers.ValidationError(errors)
+    return parsed
+
+
+@transaction.atomic
+def create_payout_job(iswift_account: iSwiftAccount, description: str, rows: list) -> PayoutJob:
+    """Stores a job paying the `(recipient, amount)` pairs in `rows` from
+    `iswift_account`, and starts it once the upload is committed"""
+    job = PayoutJob.objects.create(
+        user=iswift_account.user,
+        iswift_account=iswift_account,
+        description=description,
+        total=len(rows),
+    )
+    PayoutItem.objects.bulk_create(
+        (
+            PayoutItem(job=job, index=index, recipient=recipient, amount=amount)
+            for index, (recipient, amount) in enumerate(rows, start=1)
+        ),
+        batch_size=BULK_BATCH_SIZE,
+    )
+    transaction.on_commit(lambda: start_payout_job(job.pk))
+    return job
+
+
+def get_item_error(account: iSwiftAccount, sender: iSwiftAccount, rates: dict) -> str:
+    """Why an item paying `account` from `sender` cannot be paid, or an empty string"""
+    if account is None:
+        return "Recipient not found"
+    if account.pk == sender.pk:
+        return "Cannot pay the paying account"
+    if account.currency_id not in rates:
+        return f"No conversion rate from {sender.currency} to the recipient's currency"
+    return ""
+
+
+def pay_chunk(job_pk: int) -> bool:
+    """Pays the next `PAYOUT_CHUNK_SIZE` items of a job with a single bulk
+    transfer, marks the items that cannot be paid as failed and moves the
+    watermark past them, all in one transaction. Returns False, and marks
+    the job finished, once no items are left.
+
+    The job row is locked first, so two workers never pay the same chunk."""
+    with write_transaction():
+        job = (
+            PayoutJob.objects.select_for_update()
+            .select_related("iswift_account__currency")
+            .get(pk=job_pk)
+        )
+        pending = job.items.filter(index__gt=job.watermark).order_by("index")
+        items = list(pending[: settings.PAYOUT_CHUNK_SIZE])
+        if not items:
+            if job.finished_at is None:
+                job.finished_at = timezone.now()
+                job.save(update_fields=["finished_at", "modified"])
+            return False
+
+        sender = job.iswift_account
+        rates = sender.currency.get_conversion_rates()
+        accounts = {
+            account.user.uid: account
+            for account in iSwiftAccount.objects.filter(
+                user__uid__in={item.recipient for item in items}, is_default=True
+            ).select_related("user")
+        }
+        payable = []
+        for item in items:
+            account = accounts.get(item.recipient)
+            item.error = get_item_error(account, sender, rates)
+            if not item.error:
+                payable.append(item)
+
+        if payable:
+            recipients = [
+                {
+                    "recipient": accounts[item.recipient].user,
+                    "iswift_account": accounts[item.recipient],
+                    "amount": item.amount,
+                }
+                for item in payable
+            ]
+            try:
+                debit = sender.record_transfer(recipients, job.description)
+            except InsufficientFunds:
+                for item in payable:
+                    item.error = "Insufficient funds"
+            else:
+                for item in payable:
+                    item.debit_transaction = debit
+
+        PayoutItem.objects.bulk_update(
+            items, ["debit_transaction", "error"], batch_size=BULK_BATCH_SIZE
+        )
+        job.watermark = items[-1].index
+        job.processed += len(items)
+        job.failed += len([item for item in items if item.error])
+        job.save(update_fields=["watermark", "processed", "failed", "modified"])
+        return True
+
+
+def run_payout_job(job_pk: int):
+    """Pays a job chunk by chunk from its watermark until it is finished.
+    A job stopped by any other error than the failed items `pay_chunk`
+    records is marked failed with it instead of being left running."""
+    try:
+        while pay_chunk(job_pk):
+            pass
+    except Exception as e:
+        logger.exception(f"Payout job {job_pk} failed")
+        fail_payout_job(job_pk, e)
+
+
+def fail_payout_job(job_pk: int, error: Exception):
+    """Finishes a job with `error`, so it is neither shown as running nor resumed"""
+    message = str(error) or error.__class__.__name__
+    now = timezone.now()
+    PayoutJob.objects.filter(pk=job_pk, finished_at=None).update(
+        error=message[: PayoutJob._meta.get_field("error").max_length],
+        finished_at=now,
+        modified=now,
+    )
+
+
+def run_payout_job_in_worker(job_pk: int):
+    try:
+        run_payout_job(job_pk)
+    finally:
+        # Every worker thread opens its own connection
+        connection.close()
+
+
+def get_pool() -> ThreadPoolExecutor:
+    """The process' payout workers, started on first use. Starting them
+    resumes every unfinished job, so jobs left behind when a process
+    stopped are picked up again by the next one that pays a job."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=settings.PAYOUT_WORKERS, thread_name_prefix="payout"
+            )
+            for pk in get_unfinished_jobs():
+                future = _pool.submit(run_payout_job_in_worker, pk)
+                with _resumed_lock:
+                    _resumed[pk] = future
+                future.add_done_callback(lambda _, pk=pk: pop_resumed(pk))
+        return _pool
+
+
+def pop_resumed(job_pk: int):
+    with _resumed_lock:
+        return _resumed.pop(job_pk, None)
+
+
+def start_payout_job(job_pk: int):
+    pool = get_pool()
+    # A job committed before the pool started was resumed with the rest
+    future = pop_resumed(job_pk)
+    if future is None:
+        future = pool.submit(run_payout_job_in_worker, job_pk)
+    return future
+
+
+def get_unfinished_jobs() -> list:
+    return list(
+        PayoutJob.objects.filter(finished_at=None).order_by("pk").values_list("pk", flat=True)
+    )
+
+
+def resume_payout_jobs() -> int:
+    """Pays every unfinished job from its last committed chunk, such as those
+    left behind when the process paying them stopped. Returns the number of
+    jobs resumed."""
+    pks = get_unfinished_jobs()
+    for pk in pks:
+        run_payout_job(pk)
+    return len(pks)
@@ -0,0 +1,183 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import DateTimeField, DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from finance.models import (
+    BULK_BATCH_SIZE,
+    BalanceCheckpoint,
+    BalanceDrift,
+    BalanceShard,
+    CreditTransaction,
+    DebitTransaction,
+    Posting,
+    ReconciliationRun,
+    iSwiftAccount,
+)
+
+# Where transactions are summed from for accounts without a checkpoint
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+CENT = Decimal("0.01")
+
+
+def get_total(Klass, field: str):
+    """Sums `field` over the transactions of the outer account created since its last checkpoint"""
+    transactions = (
+        Klass.objects.filter(iswift_account=OuterRef("pk"), created__gte=OuterRef("since"))
+        .values("iswift_account")
+        .annotate(total=Sum(field))
+        .values("total")
+    )
+    return Coalesce(Subquery(transactions), Value(Decimal(0)), output_field=DecimalField())
+
+
+def get_held_total(queryset, field: str):
+    """Sums `field` over the rows of `queryset` that hold money of the outer
+    account outside its balance"""
+    held = queryset.values("iswift_account").annotate(total=Sum(field)).values("total")
+    return Coalesce(Subquery(held), Value(Decimal(0)), output_field=DecimalField())
+
+
+def get_expected_balances(after: int, last: int):
+    """Returns `(pk, balance, expected_balance)` of every account with a pk in
+    (after, last]. The balance includes credits held on shards and postings
+    not projected yet. The expected balance is the last checkpoint plus the
+    credits and debits since. Both are read by one statement so they come
+    from the same snapshot."""
+    checkpoint = BalanceCheckpoint.objects.filter(iswift_account=OuterRef("pk")).order_by("-date")
+    pending = Posting.objects.filter(
+        iswift_account=OuterRef("pk"), sequence__gt=OuterRef("projected_sequence"), shard=0
+    )
+    return (
+        iSwiftAccount.objects.filter(pk__gt=after, pk__lte=last)
+        .annotate(
+            total_balance=F("balance")
+            + get_held_total(BalanceShard.objects.filter(iswift_account=OuterRef("pk")), "balance")
+            + get_held_total(pending, "amount"),
+            since=Coalesce(
+                Subquery(checkpoint.values("closed_at")[:1]),
+                Value(EPOCH),
+                output_field=DateTimeField(),
+            ),
+            opening=Coalesce(
+                Subquery(checkpoint.values("balance")[:1]),
+                Value(Decimal(0)),
+                output_field=DecimalField(),
+            ),
+        )
+        .annotate(
+            expected_balance=F("opening")
+            + get_total(CreditTransaction, "amount_received")
+            - get_total(DebitTransaction, "amount_sent")
+        )
+        .order_by()
+        .values_list("pk", "total_balance", "expected_balance")
+    )
+
+
+def reconcile_chunk(after: int, last: int) -> tuple:
+    """Checks the accounts with a pk in (after, last].
+    Returns `last`, the number of accounts checked and the drifted accounts."""
+    checked = 0
+    drifts = []
+    for pk, balance, expected_balance in get_expected_balances(after, last):
+        checked += 1
+        balance = balance.quantize(CENT)
+        expected_balance = expected_balance.quantize(CENT)
+        if balance != expected_balance:
+            drifts.append(
+                BalanceDrift(
+                    iswift_account_id=pk, balance=balance, expected_balance=expected_balance
+                )
+            )
+    return last, checked, drifts
+
+
+def reconcile_chunk_in_worker(after: int, last: int) -> tuple:
+    try:
+        return reconcile_chunk(after, last)
+    finally:
+        # Every worker thread opens its own connection
+        connection.close()
+
+
+def get_chunks(after: int, chunk_size: int):
+    """Yields the `(after, last)` pk bounds of consecutive chunks of
+    `chunk_size` accounts, walking the primary key from `after`"""
+    while True:
+        pks = list(
+            iSwiftAccount.objects.filter(pk__gt=after)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:chunk_size]
+        )
+        if not pks:
+            return
+
+        yield after, pks[-1]
+        after = pks[-1]
+
+
+def map_in_order(executor: ThreadPoolExecutor, fn, chunks, limit: int):
+    """Like `executor.map`, but submits at most `limit` chunks ahead of the
+    one being yielded, so the chunks are never all held in memory"""
+    pending = deque()
+    for chunk in chunks:
+        pending.append(executor.submit(fn, *chunk))
+        if len(pending) >= limit:
+            yield pending.popleft().result()
+
+    while pending:
+        yield pending.popleft().result()
+
+
+def get_run(restart=False) -> ReconciliationRun:
+    """Returns the unfinished run to resume, or a new run"""
+    run = None
+    if not restart:
+        run = ReconciliationRun.objects.filter(finished_at=None).order_by("-created").first()
+    return run or ReconciliationRun.objects.create()
+
+
+def reconcile(run: ReconciliationRun = None, chunk_size: int = None, workers: int = None):
+    """Checks that the balance of every account matches its transactions.
+
+    Accounts are read in keyset chunks from the watermark of `run` (defaults
+    to the unfinished run, or a new one) and each chunk is totalled by the
+    database in one read-only statement, `workers` chunks at a time. Drifted
+    accounts are recorded and the watermark moved past a chunk as soon as it
+    and every chunk before it is done, so an interrupted run loses at most
+    the chunks in flight. Returns the finished run."""
+    if run is None:
+        run = get_run()
+
+    chunk_size = chunk_size or settings.RECONCILIATION_CHUNK_SIZE
+    workers = workers or settings.RECONCILIATION_WORKERS
+    chunks = get_chunks(run.watermark, chunk_size)
+
+    def record(results):
+        for last, checked, drifts in results:
+            for drift in drifts:
+                drift.run = run
+
+            with transaction.atomic():
+                BalanceDrift.objects.bulk_create(drifts, batch_size=BULK_BATCH_SIZE)
+                run.watermark = last
+                run.accounts_checked += checked
+                run.save(update_fields=["watermark", "accounts_checked", "modified"])
+
+    if workers == 1:
+        record(reconcile_chunk(*chunk) for chunk in chunks)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            record(map_in_order(executor, reconcile_chunk_in_worker, chunks, workers * 2))
+
+    run.finished_at = timezone.now()
+    run.save(update_fields=["finished_at", "modified"])
+    return run
@@ -0,0 +1,20 @@
+from rest_framework import serializers
+
+from finance.serializers.output import TransactionSerializer
+
+
+class TransactionFeedLinksSchema(serializers.Serializer):
+    next = serializers.URLField(allow_null=True)
+
+
+class TransactionFeedSchema(serializers.Serializer):
+    object = serializers.CharField(default="list")
+    links = TransactionFeedLinksSchema()
+    results = TransactionSerializer(many=True)
+
+
+class AccountBalanceSchema(serializers.Serializer):
+    object = serializers.CharField(default="balance")
+    iswift_account = serializers.UUIDField()
+    balance = serializers.DecimalField(max_digits=10, decimal_places=2)
+    at = serializers.DateTimeField()
@@ -1,11 +1,14 @@
+from django.conf import settings
 from rest_framework import serializers
 from rest_framework.validators import ValidationError
 
-from accounts.models import User
 from core.exceptions import InsufficientFunds, NotFound
 from core.serializers.fields import DecimalField
 from finance.data import currencies
+from finance.group_commit import transfer_committer
 from finance.models import Currency, iSwiftAccount
+from finance.payouts import create_payout_job, parse_payout_rows, read_payout_file
+from finance.statements import STATEMENT_FORMATS
 
 
 class RecipientInputSerializer(serializers.Serializer):
@@ -32,27 +35,30 @@ class MakeTransferSerializer(serializers.Serializer):
         if len(users) != len(set(users)):
             raise ValidationError("Cannot include the same user more than once")
 
-        validated_users = []
-        for value in values:
-            try:
-                user = User.objects.get(uid=value["recipient"])
-                value["recipient"] = user
-                validated_users.append(value)
+        # Resolve every recipient and their default account in one query so
+        # the model layer does not have to fetch them again
+        accounts = {
+            account.user.uid: account
+            for account in iSwiftAccount.objects.filter(
+                user__uid__in=users, is_default=True
+            ).select_related("user")
+        }
+        invalid_users = [user for user in users if user not in accounts]
+        if invalid_users:
+            raise ValidationError([f"User with {user} is not valid" for user in invalid_users])
 
-            except User.DoesNotExist:
-                # why did I declare the variable?
-                # Because Black Formatter was having issues formatting
-                # this: {value["recipient"]}
-                rec = value["recipient"]
-                raise ValidationError(f"User with {rec} is not valid")
+        for value in values:
+            account = accounts[value["recipient"]]
+            value["recipient"] = account.user
+            value["iswift_account"] = account
 
-        return validated_users
+        return values
 
     def validate(self, attrs):
         iswift_account: iSwiftAccount = attrs["iswift_account"]
         recipients = attrs["recipients"]
         total_amount = sum(re["amount"] for re in recipients)
-        if iswift_account.balance < total_amount:
+        if iswift_account.get_balance() < total_amount:
             raise InsufficientFunds()
 
         return super().validate(attrs)
@@ -69,6 +75,9 @@ class MakeTransferSerializer(serializers.Serializer):
             else:
                 description = "Bulk Transfer"
 
+        if settings.TRANSFER_GROUP_COMMIT:
+            return transfer_committer.call(iswift_account.record_transfer, recipients, description)
+
         debit: str = iswift_account.record_transfer(recipients, description)
         return debit
 
@@ -136,3 +145,54 @@ class iSwiftAccountUpdateSerializer(serializers.ModelSerializer):
                     )
 
         return super().update(instance, validated_data)
+
+
+class StatementQuerySerializer(serializers.Serializer):
+    start = serializers.DateField(required=False, help_text="First day of the statement")
+    end = serializers.DateField(required=False, help_text="Last day of the statement")
+    file_format = serializers.ChoiceField(choices=list(STATEMENT_FORMATS), default="csv")
+
+    def validate(self, attrs):
+        if "start" in attrs and "end" in attrs and attrs["start"] > attrs["end"]:
+            raise ValidationError({"end": "End date cannot be before the start date"})
+        return attrs
+
+
+class AutocompleteQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(help_text="The start of a name or phone number")
+    limit = serializers.IntegerField(min_value=1, max_value=50, default=10)
+
+
+class BalanceQuerySerializer(serializers.Serializer):
+    at = serializers.DateTimeField(
+        required=False, help_text="The moment to get the balance at. Defaults to now"
+    )
+
+
+class CreatePayoutJobSerializer(serializers.Serializer):
+    iswift_account = serializers.UUIDField()
+    file = serializers.FileField(help_text="CSV or JSON file of recipient uids and amounts")
+    description = serializers.CharField(required=False, max_length=450)
+
+    def validate_iswift_account(self, value):
+        user = self.context["user"]
+        try:
+            return iSwiftAccount.objects.get(uid=value, user=user)
+        except iSwiftAccount.DoesNotExist:
+            raise NotFound(iSwiftAccount)
+
+    def validate_file(self, value):
+        try:
+            rows = read_payout_file(value)
+        except (ValueError, UnicodeDecodeError) as e:
+            raise ValidationError(str(e))
+
+        if not rows:
+            raise ValidationError("The recipients file is empty")
+        return parse_payout_rows(rows)
+
+    def create(self, validated_data):
+        description = validated_data.get("description", "Bulk Payout")
+        return create_payout_job(
+            validated_data["iswift_account"], description, validated_data["file"]
+        )
@@ -1,12 +1,18 @@
-from django.db.models import QuerySet
+from django.db.models import Prefetch, QuerySet
 from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
 
 from accounts.serializers.output import PublicUserSerializer
-from core import object_kebab_case
 from core.serializers.fields import DecimalField
 from core.serializers.output import ModelBaseSerializer
-from finance.models import CreditTransaction, Currency, DebitTransaction, iSwiftAccount
+from finance.feeds import TransactionFeed
+from finance.models import (
+    CreditTransaction,
+    Currency,
+    DebitTransaction,
+    PayoutJob,
+    iSwiftAccount,
+)
 
 
 class CurrencySerializer(ModelBaseSerializer):
@@ -17,7 +23,7 @@ class CurrencySerializer(ModelBaseSerializer):
 
 class iSwiftAccountSerializer(ModelBaseSerializer):
     currency = CurrencySerializer()
-    balance = DecimalField()
+    balance = DecimalField(source="get_balance")
 
     class Meta:
         model = iSwiftAccount
@@ -41,6 +47,11 @@ class CreditTransactionSerializer(ModelBaseSerializer):
             # "user",
         ]
 
+    @staticmethod
+    def setup_eager_loading(queryset: QuerySet) -> QuerySet:
+        """Joins the relations this serializer reads into the same query"""
+        return queryset.select_related("sender", "currency_sent")
+
     @extend_schema_field(PublicUserSerializer)
     def get_user(self, obj):
         return PublicUserSerializer(obj.iswift_account.user).data
@@ -63,6 +74,15 @@ class DebitTransactionSerializer(ModelBaseSerializer):
             "amount_sent",
         ]
 
+    @staticmethod
+    def setup_eager_loading(queryset: QuerySet) -> QuerySet:
+        """Loads the relations this serializer reads, including every credit
+        of the debit, in two queries however many recipients it has"""
+        credits = CreditTransactionSerializer.setup_eager_loading(CreditTransaction.objects.all())
+        return queryset.select_related("currency", "iswift_account__currency").prefetch_related(
+            Prefetch("credit_transactions", queryset=credits)
+        )
+
     @extend_schema_field(CreditTransactionSerializer(many=True))
     def get_recipients(self, obj):
         serializer = CreditTransactionSerializer(obj.credit_transactions.all(), many=True)
@@ -81,6 +101,12 @@ class PrivateCreditTransactionSerializer(CreditTransactionSerializer):
             "currency_received",
         ]
 
+    @staticmethod
+    def setup_eager_loading(queryset: QuerySet) -> QuerySet:
+        return CreditTransactionSerializer.setup_eager_loading(queryset).select_related(
+            "currency_received", "iswift_account__currency"
+        )
+
 
 class TransactionSerializer(serializers.Serializer):
     uid = serializers.UUIDField()
@@ -100,40 +126,26 @@ class iSwiftAccountDetailSerializer(iSwiftAccountSerializer):
 
     @extend_schema_field(TransactionSerializer(many=True))
     def get_transactions(self, obj):
-        credit_transactions: QuerySet[CreditTransaction] = obj.credit_transactions.select_related(
-            "currency_received", "sender"
-        ).all()
-        debit_transactions: QuerySet[DebitTransaction] = obj.debit_transactions.select_related(
-            "currency", "recipient"
-        ).all()
-
-        credit_object = object_kebab_case(CreditTransaction())
-        debit_object = object_kebab_case(DebitTransaction())
-
-        all_transactions = [
-            {
-                "iswift_account": credit.iswift_account.uid,
-                "amount": credit.amount_received,
-                "uid": credit.uid,
-                "object": credit_object,
-                "currency": CurrencySerializer(credit.currency_received).data,
-                "sender_or_recipient": credit.sender.get_full_name(),
-                "description": credit.description,
-            }
-            for credit in credit_transactions
-        ] + [
-            {
-                "iswift_account": debit.iswift_account.uid,
-                "uid": debit.uid,
-                "object": debit_object,
-                "currency": CurrencySerializer(debit.currency).data,
-                "sender_or_recipient": (
-                    debit.recipient.get_full_name() if debit.recipient else "Bulk Transfer"
-                ),
-                "amount": debit.amount_sent,
-                "description": debit.description,
-            }
-            for debit in debit_transactions
-        ]
+        # Only the latest page, the rest is served by the transactions feed
+        transactions, _ = TransactionFeed(obj).get_page()
+        return TransactionSerializer(transactions, many=True).data
+
+
+class PayoutJobSerializer(ModelBaseSerializer):
+    remaining = serializers.IntegerField(read_only=True)
+    is_finished = serializers.BooleanField(read_only=True)
 
-        return TransactionSerializer(all_transactions, many=True).data
+    class Meta:
+        model = PayoutJob
+        fields = [
+            "uid",
+            "description",
+            "total",
+            "processed",
+            "failed",
+            "remaining",
+            "is_finished",
+            "error",
+            "created",
+            "finished_at",
+        ]
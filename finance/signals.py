@@ -0,0 +1,13 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from finance.cache import bump_rates_version
+from finance.models import ConversionRate
+
+
+@receiver([post_save, post_delete], sender=ConversionRate)
+def invalidate_rate_cache(sender, **kwargs):
+    # Bump only once the change is visible to other connections, otherwise
+    # a worker could reload the old rates under the new version
+    transaction.on_commit(bump_rates_version)
@@ -0,0 +1,95 @@
+import csv
+import json
+from datetime import date, datetime, time, timedelta
+
+from core.helpers import make_aware
+from finance.models import iSwiftAccount
+
+STATEMENT_COLUMNS = [
+    "created",
+    "type",
+    "uid",
+    "description",
+    "amount",
+    "currency",
+    "sender_or_recipient",
+]
+
+# Rows read from the database per fetch, and lines written per chunk of output
+STATEMENT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """File-like object that returns what is written to it,
+    so `csv.writer` hands back each line instead of buffering it"""
+
+    def write(self, value):
+        return value
+
+
+def get_date_range(start: date = None, end: date = None) -> tuple:
+    """Turns an inclusive range of dates into the
+    [start, end) datetimes taken by `get_transactions`"""
+    if start is not None:
+        start = make_aware(datetime.combine(start, time.min))
+    if end is not None:
+        end = make_aware(datetime.combine(end + timedelta(days=1), time.min))
+    return start, end
+
+
+def get_statement_rows(account: iSwiftAccount, start: date = None, end: date = None):
+    """Yields the credits and debits of `account` oldest first. Rows are read
+    from a single query `STATEMENT_CHUNK_SIZE` at a time, so only one chunk
+    is ever held in memory."""
+    start, end = get_date_range(start, end)
+    transactions = account.get_transactions(newest_first=False, start=start, end=end)
+    for row in transactions.iterator(chunk_size=STATEMENT_CHUNK_SIZE):
+        yield {
+            "created": row["created"].isoformat(),
+            "type": row["object"],
+            "uid": str(row["uid"]),
+            "description": row["description"],
+            "amount": str(row["amount"]),
+            "currency": row["currency_iso_code"],
+            "sender_or_recipient": row["sender_or_recipient"].strip(),
+        }
+
+
+def render_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(STATEMENT_COLUMNS)
+    for row in rows:
+        yield writer.writerow([row[column] for column in STATEMENT_COLUMNS])
+
+
+def render_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row) + "\n"
+
+
+# file format: (renderer, content type)
+STATEMENT_FORMATS = {
+    "csv": (render_csv, "text/csv"),
+    "ndjson": (render_ndjson, "application/x-ndjson"),
+}
+
+
+def stream_statement(
+    account: iSwiftAccount, file_format: str = "csv", start: date = None, end: date = None
+):
+    """Yields the statement of `account` in `file_format` as chunks of text.
+    The first line is sent on its own so the download starts right away,
+    the rest go out `STATEMENT_CHUNK_SIZE` lines at a time."""
+    render, _ = STATEMENT_FORMATS[file_format]
+    lines = render(get_statement_rows(account, start, end))
+    yield next(lines, "")
+
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == STATEMENT_CHUNK_SIZE:
+            yield "".join(chunk)
+            chunk = []
+
+    if chunk:
+        yield "".join(chunk)
@@ -6,8 +6,17 @@ app_name = "finance"
 
 urlpatterns = [
     path("users/", views.UsersListView.as_view(), name="list_users"),
+    path(
+        "users/autocomplete/", views.UsersAutocompleteView.as_view(), name="autocomplete_users"
+    ),
     path("currencies/", views.CurrenciesListView.as_view(), name="list_currencies"),
     path("transfer/", views.MakeTransferView.as_view(), name="transfer"),
+    path("payout-jobs/", views.PayoutJobsCreateView.as_view(), name="payout_jobs"),
+    path(
+        "payout-jobs/<uuid:uid>/",
+        views.PayoutJobDetailView.as_view(),
+        name="one_payout_job",
+    ),
     path(
         "iswift-accounts/",
         views.iSwiftAccountsListCreateView.as_view(),
@@ -18,6 +27,21 @@ urlpatterns = [
         views.iSwiftAccountDetailView.as_view(),
         name="one_iswift_account",
     ),
+    path(
+        "iswift-accounts/<uuid:uid>/transactions/",
+        views.iSwiftAccountTransactionsView.as_view(),
+        name="iswift_account_transactions",
+    ),
+    path(
+        "iswift-accounts/<uuid:uid>/statement/",
+        views.iSwiftAccountStatementView.as_view(),
+        name="iswift_account_statement",
+    ),
+    path(
+        "iswift-accounts/<uuid:uid>/balance/",
+        views.iSwiftAccountBalanceView.as_view(),
+        name="iswift_account_balance",
+    ),
     path(
         "transactions/<uuid:uid>/<str:type>/",
         views.TransactionDetail.as_view(),
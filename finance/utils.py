@@ -1,43 +1,238 @@
+import json
 import logging
-from decimal import Decimal, getcontext
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, localcontext
+from pathlib import Path
 
 import requests
+from django.conf import settings
 from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
 
-from finance.models import ConversionRate, Currency
+from finance.cache import bump_rates_version
+from finance.models import ConversionRate, ConversionRateSnapshot, Currency
 
 logger = logging.getLogger(__name__)
-getcontext().prec = 8
 
+# Significant digits rates are computed with, before they are rounded to
+# the places ConversionRate stores them with
+RATE_PRECISION = 28
 
-def update_rates():
-    currencies = Currency.objects.filter(status=Currency.ACTIVE_STATUS)
+RATE_PLACES = Decimal(10) ** -ConversionRate._meta.get_field("conversion_rate").decimal_places
+
+
+class RateProvider:
+    """Source of the exchange rates from one base currency to every other currency"""
+
+    def fetch(self, iso_code: str) -> dict:
+        """Returns the rates from `iso_code` keyed by the target iso code"""
+        raise NotImplementedError
+
+
+class CurrencyAPIRateProvider(RateProvider):
+    """Fetches rates from the free currency API served over jsDelivr"""
+
+    url = "https://cdn.jsdelivr.net/npm/@fawazahmed0/currency-api@latest/v1/currencies/{}.json"
+
+    def __init__(self, timeout=10):
+        self.timeout = timeout
+
+    def fetch(self, iso_code: str) -> dict:
+        response = requests.get(self.url.format(iso_code), timeout=self.timeout)
+        response.raise_for_status()
+        return response.json().get(iso_code, {})
+
+
+class FileRateProvider(RateProvider):
+    """Reads payloads in the currency API's format from `<iso_code>.json`
+    files in a directory. Useful for tests and benchmarks."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def fetch(self, iso_code: str) -> dict:
+        with open(self.directory / f"{iso_code}.json") as file:
+            return json.load(file).get(iso_code, {})
+
+
+class FixtureRateProvider(RateProvider):
+    """Serves rates from a `{base: {target: rate}}` dict"""
+
+    def __init__(self, rates: dict):
+        self.rates = rates
+
+    def fetch(self, iso_code: str) -> dict:
+        return self.rates[iso_code]
+
+
+def get_rate_provider() -> RateProvider:
+    return import_string(settings.RATES_PROVIDER)()
+
+
+def fetch_rates(currencies: list, provider: RateProvider) -> dict:
+    """Fetches the payload of every base currency concurrently.
+
+    Returns the rates keyed by base iso code. Bases that fail to fetch are
+    logged and left out."""
+
+    def fetch(currency: Currency):
+        try:
+            return currency.iso_code, provider.fetch(currency.iso_code)
+        except Exception:
+            logger.exception(f"Failed to fetch rates for {currency.iso_code}")
+            return currency.iso_code, None
+
+    with ThreadPoolExecutor(max_workers=settings.RATES_FETCH_WORKERS) as executor:
+        payloads = executor.map(fetch, currencies)
+        return {iso_code: rates for iso_code, rates in payloads if rates is not None}
+
+
+def derive_payloads(currencies: list, anchor: str, anchor_rates: dict) -> dict:
+    """Derives the payload of every currency from the payload of the `anchor`
+    currency by triangulation: rate(base -> target) = rate(anchor -> target)
+    / rate(anchor -> base). Currencies the anchor has no rate for are left out."""
+    anchor_rates = {
+        iso_code: Decimal(str(rate)) for iso_code, rate in anchor_rates.items() if rate
+    }
+    anchor_rates[anchor] = Decimal(1)
+
+    payloads = {}
+    with localcontext() as ctx:
+        ctx.prec = RATE_PRECISION
+        for base in currencies:
+            base_rate = anchor_rates.get(base.iso_code)
+            if base_rate is None:
+                continue
+
+            payloads[base.iso_code] = {
+                target.iso_code: anchor_rates[target.iso_code] / base_rate
+                for target in currencies
+                if target.iso_code in anchor_rates
+            }
+
+    return payloads
+
+
+def parse_rate(rate) -> Decimal:
+    return rate if isinstance(rate, Decimal) else Decimal(str(rate))
+
+
+def compute_rates(currencies: list, payloads: dict) -> list:
+    """Returns a `ConversionRate` for every pair of currencies with a valid rate.
+    Each pair is stored once, from the earlier currency to the later one.
+
+    Both rates of a pair are rounded to the places they are stored with only
+    once computed, the reverse rate from the payload's rate as given."""
+    conversion_rates = []
+    with localcontext() as ctx:
+        ctx.prec = RATE_PRECISION
+        for i, base in enumerate(currencies):
+            rates = payloads.get(base.iso_code)
+            if rates is None:
+                continue
+
+            # fmt:off
+            for target in currencies[i + 1:]:
+                # fmt:on
+                rate = rates.get(target.iso_code)
+                if not rate:
+                    continue
+
+                rate_decimal = parse_rate(rate)
+                conversion_rate = rate_decimal.quantize(RATE_PLACES)
+                if conversion_rate == 0:
+                    logger.error(f"Invalid rate received for {base.iso_code} to {target.iso_code}")
+                    continue
+
+                conversion_rates.append(
+                    ConversionRate(
+                        base_currency=base,
+                        target_currency=target,
+                        conversion_rate=conversion_rate,
+                        reverse_rate=(Decimal("1") / rate_decimal).quantize(RATE_PLACES),
+                    )
+                )
+
+    return conversion_rates
+
+
+def save_rates(conversion_rates: list) -> int:
+    """Upserts the given rates in one statement, skipping pairs whose
+    stored rate has not changed, and appends a snapshot of every changed
+    rate to the rate history. Returns the number of rates written."""
+    existing = {
+        (base, target): (rate, reverse)
+        for base, target, rate, reverse in ConversionRate.objects.values_list(
+            "base_currency_id", "target_currency_id", "conversion_rate", "reverse_rate"
+        )
+    }
+
+    changed = []
+    for rate in conversion_rates:
+        rate.conversion_rate = rate.conversion_rate.quantize(RATE_PLACES)
+        rate.reverse_rate = rate.reverse_rate.quantize(RATE_PLACES)
+        pair = (rate.base_currency.pk, rate.target_currency.pk)
+        if existing.get(pair) != (rate.conversion_rate, rate.reverse_rate):
+            changed.append(rate)
+
+    if not changed:
+        return 0
 
     with transaction.atomic():
+        effective_at = timezone.now()
+        snapshots = ConversionRateSnapshot.objects.bulk_create(
+            [
+                ConversionRateSnapshot(
+                    base_currency=rate.base_currency,
+                    target_currency=rate.target_currency,
+                    conversion_rate=rate.conversion_rate,
+                    reverse_rate=rate.reverse_rate,
+                    effective_at=effective_at,
+                )
+                for rate in changed
+            ]
+        )
+        for rate, snapshot in zip(changed, snapshots):
+            rate.snapshot = snapshot
+
+        ConversionRate.objects.bulk_create(
+            changed,
+            update_conflicts=True,
+            unique_fields=["base_currency", "target_currency"],
+            update_fields=["conversion_rate", "reverse_rate", "snapshot", "modified"],
+        )
+        # Every worker reloads its rate matrix on next use
+        transaction.on_commit(bump_rates_version)
+
+    return len(changed)
+
+
+def update_rates(provider: RateProvider = None, anchor: str = None) -> int:
+    """Refreshes the rates between every active currency.
+    Returns the number of rates that changed.
+
+    With an `anchor` currency (defaults to `RATES_ANCHOR_CURRENCY`) only the
+    anchor's payload is fetched and every other rate is derived from it,
+    otherwise one payload is fetched per currency."""
+    if provider is None:
+        provider = get_rate_provider()
+
+    if anchor is None:
+        anchor = settings.RATES_ANCHOR_CURRENCY
+
+    # Pairs are stored from the earlier currency to the later one, so the
+    # order must be stable for an update to land on the rows already stored
+    currencies = list(Currency.objects.filter(status=Currency.ACTIVE_STATUS).order_by("pk"))
+    if anchor:
         try:
-            for i, base in enumerate(currencies):
-                url = f"https://cdn.jsdelivr.net/npm/@fawazahmed0/currency-api@latest/v1/currencies/{base.iso_code}.json"  # noqa
-                response = requests.get(url, timeout=10)
-                if response.status_code == 200:
-                    # fmt:off
-                    for target in currencies[i + 1:]:
-                        # fmt:on
-                        data = response.json()
-                        rate = data.get(base.iso_code, {}).get(target.iso_code)
-                        if rate:
-                            rate_str = "{:.8f}".format(rate)
-                            rate_decimal = Decimal(rate_str)
-                            if rate_decimal != 0:
-                                c_rate, _ = ConversionRate.objects.get_or_create(
-                                    base_currency=base, target_currency=target
-                                )
-                                c_rate.conversion_rate = rate_decimal
-                                c_rate.reverse_rate = Decimal("1") / rate_decimal
-                                c_rate.save()
-                            else:
-                                logger.error(
-                                    f"Invalid rate received for {base.iso_code} to {target.iso_code}"  # noqa
-                                )
-
-        except Exception as e:
-            print(e)
+            anchor_rates = provider.fetch(anchor)
+        except Exception:
+            logger.exception(f"Failed to fetch rates for {anchor}")
+            return 0
+
+        payloads = derive_payloads(currencies, anchor, anchor_rates)
+    else:
+        payloads = fetch_rates(currencies, provider)
+
+    return save_rates(compute_rates(currencies, payloads))
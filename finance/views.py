@@ -1,36 +1,60 @@
 from uuid import UUID
 
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import OpenApiParameter, extend_schema
 from rest_framework import status
 from rest_framework.filters import SearchFilter
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import AllowAny
 from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import APIView
 
+from accounts.autocomplete import user_autocomplete
 from accounts.models import User
-from accounts.serializers.output import PublicUserSerializer
+from accounts.search import search_users
+from accounts.serializers.output import PublicUserSerializer, UserMatchSerializer
 from core.exceptions import BadRequest
 from core.filters import UserFilter
 from core.helpers import get_object_or_404
-from core.mixins import AuthenticatedOnlyMixin
-from core.schema import uid_parameter
+from core.mixins import AuthenticatedOnlyMixin, ReadReplicaMixin
+from core.pagination import CursorPagination
+from core.schema import idempotency_key_parameter, uid_parameter
 from core.views import ListAPIView
-from finance.models import CreditTransaction, Currency, DebitTransaction, iSwiftAccount
+from finance.feeds import TransactionFeed
+from finance.idempotency import idempotent
+from finance.models import (
+    CreditTransaction,
+    Currency,
+    DebitTransaction,
+    PayoutJob,
+    iSwiftAccount,
+)
+from finance.schema import AccountBalanceSchema, TransactionFeedSchema
 from finance.serializers.input import (
+    AutocompleteQuerySerializer,
+    BalanceQuerySerializer,
     CreateAccountSerializer,
+    CreatePayoutJobSerializer,
     MakeTransferSerializer,
+    StatementQuerySerializer,
     iSwiftAccountUpdateSerializer,
 )
 from finance.serializers.output import (
     CurrencySerializer,
     DebitTransactionSerializer,
+    PayoutJobSerializer,
     PrivateCreditTransactionSerializer,
+    TransactionSerializer,
     iSwiftAccountDetailSerializer,
     iSwiftAccountSerializer,
 )
+from finance.statements import STATEMENT_FORMATS, stream_statement
 
 
 @extend_schema(
@@ -43,14 +67,44 @@ from finance.serializers.output import (
         ),
     ]
 )
-class UsersListView(AuthenticatedOnlyMixin, ListAPIView):
+class UsersListView(ReadReplicaMixin, AuthenticatedOnlyMixin, ListAPIView):
     queryset = User.non_staff.all()
     serializer_class = PublicUserSerializer
     filter_backends = (DjangoFilterBackend,)
     filterset_class = UserFilter
+    pagination_class = CursorPagination
+    ordering = ("first_name", "id")
+
+    def get_ordering(self) -> tuple:
+        # Searches rank users by how many terms match a whole name or number
+        if self.request.query_params.get("search"):
+            return ("-relevance", *self.ordering)
+        return self.ordering
+
+
+class UsersAutocompleteView(ReadReplicaMixin, AuthenticatedOnlyMixin, APIView):
+    @extend_schema(
+        responses=UserMatchSerializer(many=True), parameters=[AutocompleteQuerySerializer]
+    )
+    def get(self, request: Request) -> Response:
+        """This endpoint returns the users best matching the start of a name
+        or phone number, for recipient autocomplete. It is served from
+        memory when `USER_AUTOCOMPLETE` is set."""
+        serializer = AutocompleteQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        query, limit = serializer.validated_data["q"], serializer.validated_data["limit"]
+
+        if settings.USER_AUTOCOMPLETE:
+            user_autocomplete.ensure_loaded()
+            users = user_autocomplete.search(query, limit)
+        else:
+            users = search_users(User.non_staff.all(), query).order_by(
+                "-relevance", "first_name", "id"
+            )[:limit]
+        return Response(UserMatchSerializer(users, many=True).data, status.HTTP_200_OK)
 
 
-class CurrenciesListView(ListAPIView):
+class CurrenciesListView(ReadReplicaMixin, ListAPIView):
     queryset = Currency.objects.active().order_by("iso_code")
     serializer_class = CurrencySerializer
     filter_backends = [SearchFilter]
@@ -61,15 +115,49 @@ class CurrenciesListView(ListAPIView):
 
 class MakeTransferView(AuthenticatedOnlyMixin, APIView):
 
-    @extend_schema(request=MakeTransferSerializer, responses=DebitTransactionSerializer)
+    @extend_schema(
+        request=MakeTransferSerializer,
+        responses=DebitTransactionSerializer,
+        parameters=[idempotency_key_parameter()],
+    )
+    @idempotent
     def post(self, request: Request) -> Response:
         in_serializer = MakeTransferSerializer(data=request.data, context={"user": request.user})
         in_serializer.is_valid(raise_exception=True)
         debit = in_serializer.save()
+        debit = DebitTransactionSerializer.setup_eager_loading(DebitTransaction.objects).get(
+            pk=debit.pk
+        )
         out_serializer = DebitTransactionSerializer(debit)
         return Response(out_serializer.data, status.HTTP_201_CREATED)
 
 
+class PayoutJobsCreateView(AuthenticatedOnlyMixin, APIView):
+    parser_classes = [MultiPartParser]
+
+    @extend_schema(request=CreatePayoutJobSerializer, responses={202: PayoutJobSerializer})
+    def post(self, request: Request) -> Response:
+        """This endpoint takes a CSV or JSON file of recipients and amounts,
+        too many to pay in one request, and pays them in the background.
+        CSV files need a header with `recipient` and `amount` columns.
+        Follow the job's progress on the payout job endpoint."""
+        in_serializer = CreatePayoutJobSerializer(
+            data=request.data, context={"user": request.user}
+        )
+        in_serializer.is_valid(raise_exception=True)
+        job = in_serializer.save()
+        return Response(PayoutJobSerializer(job).data, status.HTTP_202_ACCEPTED)
+
+
+class PayoutJobDetailView(AuthenticatedOnlyMixin, APIView):
+    @extend_schema(responses=PayoutJobSerializer, parameters=[uid_parameter("Payout job")])
+    def get(self, request: Request, uid: UUID) -> Response:
+        """This endpoint returns how many items of a payout job
+        were processed, how many of those failed, and how many remain."""
+        job = get_object_or_404(PayoutJob, uid=uid, user=request.user)
+        return Response(PayoutJobSerializer(job).data, status.HTTP_200_OK)
+
+
 class iSwiftAccountsListCreateView(AuthenticatedOnlyMixin, ListAPIView):
     serializer_class = iSwiftAccountSerializer
     pagination_class = None
@@ -83,7 +171,9 @@ class iSwiftAccountsListCreateView(AuthenticatedOnlyMixin, ListAPIView):
     @extend_schema(
         request=CreateAccountSerializer,
         responses=iSwiftAccountSerializer,
+        parameters=[idempotency_key_parameter()],
     )
+    @idempotent
     def post(self, request: Request) -> Response:
         in_serializer = CreateAccountSerializer(data=request.data, context={"user": request.user})
         in_serializer.is_valid(raise_exception=True)
@@ -92,7 +182,7 @@ class iSwiftAccountsListCreateView(AuthenticatedOnlyMixin, ListAPIView):
         return Response(out_serializer.data, status.HTTP_201_CREATED)
 
 
-class iSwiftAccountDetailView(AuthenticatedOnlyMixin, APIView):
+class iSwiftAccountDetailView(ReadReplicaMixin, AuthenticatedOnlyMixin, APIView):
     serializer_class = iSwiftAccountDetailSerializer
 
     @extend_schema(
@@ -107,7 +197,9 @@ class iSwiftAccountDetailView(AuthenticatedOnlyMixin, APIView):
     @extend_schema(
         request=iSwiftAccountUpdateSerializer,
         operation_id="finance_iswift_accounts_update",
+        parameters=[uid_parameter("iSwift account"), idempotency_key_parameter()],
     )
+    @idempotent
     def post(self, request: Request, uid: UUID) -> Response:
         account = get_object_or_404(iSwiftAccount, uid=uid, user=request.user)
         in_serializer = iSwiftAccountUpdateSerializer(data=request.data)
@@ -117,7 +209,102 @@ class iSwiftAccountDetailView(AuthenticatedOnlyMixin, APIView):
         return Response(out_serializer.data, status.HTTP_200_OK)
 
 
-class TransactionDetail(AuthenticatedOnlyMixin, APIView):
+class iSwiftAccountTransactionsView(AuthenticatedOnlyMixin, APIView):
+    @extend_schema(
+        responses=TransactionFeedSchema,
+        parameters=[
+            uid_parameter("iSwift account"),
+            OpenApiParameter(
+                name="cursor",
+                type=OpenApiTypes.STR,
+                description="The cursor of the page to return, from the previous page's next link",
+                location=OpenApiParameter.QUERY,
+            ),
+            OpenApiParameter(
+                name="page_size",
+                type=OpenApiTypes.INT,
+                description=f"Transactions per page, at most {TransactionFeed.max_page_size}",
+                location=OpenApiParameter.QUERY,
+            ),
+        ],
+    )
+    def get(self, request: Request, uid: UUID) -> Response:
+        """This endpoint returns the credits and debits
+        of an iSwift account, newest first."""
+        account = get_object_or_404(iSwiftAccount, uid=uid, user=request.user)
+        page_size = request.query_params.get("page_size")
+        try:
+            feed = TransactionFeed(account, page_size=int(page_size) if page_size else None)
+        except ValueError:
+            raise BadRequest("page_size must be a number")
+
+        transactions, next_cursor = feed.get_page(request.query_params.get("cursor"))
+        next_link = None
+        if next_cursor:
+            next_link = replace_query_param(request.build_absolute_uri(), "cursor", next_cursor)
+
+        return Response(
+            {
+                "object": "list",
+                "links": {"next": next_link},
+                "results": TransactionSerializer(transactions, many=True).data,
+            },
+            status.HTTP_200_OK,
+        )
+
+
+class iSwiftAccountStatementView(AuthenticatedOnlyMixin, APIView):
+    @extend_schema(
+        responses={
+            (200, "text/csv"): OpenApiTypes.STR,
+            (200, "application/x-ndjson"): OpenApiTypes.STR,
+        },
+        parameters=[uid_parameter("iSwift account"), StatementQuerySerializer],
+    )
+    def get(self, request: Request, uid: UUID) -> StreamingHttpResponse:
+        """This endpoint streams the credits and debits of an iSwift
+        account between two dates, oldest first, as CSV or NDJSON."""
+        account = get_object_or_404(iSwiftAccount, uid=uid, user=request.user)
+        serializer = StatementQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        file_format = serializer.validated_data["file_format"]
+        _, content_type = STATEMENT_FORMATS[file_format]
+
+        response = StreamingHttpResponse(
+            stream_statement(
+                account,
+                file_format,
+                serializer.validated_data.get("start"),
+                serializer.validated_data.get("end"),
+            ),
+            content_type=content_type,
+        )
+        filename = f"statement-{account.uid}.{file_format}"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
+class iSwiftAccountBalanceView(AuthenticatedOnlyMixin, APIView):
+    @extend_schema(
+        responses=AccountBalanceSchema,
+        parameters=[uid_parameter("iSwift account"), BalanceQuerySerializer],
+    )
+    def get(self, request: Request, uid: UUID) -> Response:
+        """This endpoint returns the balance of an iSwift account at a
+        moment in the past, as implied by its transactions."""
+        account = get_object_or_404(iSwiftAccount, uid=uid, user=request.user)
+        serializer = BalanceQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        at = serializer.validated_data.get("at") or timezone.now()
+        data = {
+            "iswift_account": account.uid,
+            "balance": account.get_balance_as_of(at),
+            "at": at,
+        }
+        return Response(AccountBalanceSchema(data).data, status=status.HTTP_200_OK)
+
+
+class TransactionDetail(ReadReplicaMixin, AuthenticatedOnlyMixin, APIView):
     types = ["credit-transaction", "debit-transaction"]
 
     @extend_schema(
@@ -149,6 +336,10 @@ class TransactionDetail(AuthenticatedOnlyMixin, APIView):
             Klass = DebitTransaction
             SerializerKlass = DebitTransactionSerializer
 
-        transaction = get_object_or_404(Klass, uid=uid, iswift_account__user=request.user)
+        transaction = get_object_or_404(
+            SerializerKlass.setup_eager_loading(Klass.objects.all()),
+            uid=uid,
+            iswift_account__user=request.user,
+        )
         serializer = SerializerKlass(transaction)
         return Response(serializer.data, status.HTTP_200_OK)
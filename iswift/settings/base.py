@@ -1,4 +1,5 @@
 import os
+import tempfile
 from datetime import timedelta
 from pathlib import Path
 
@@ -40,6 +41,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "core.middleware.ReplicaStickinessMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -72,11 +74,37 @@ WSGI_APPLICATION = "iswift.wsgi.application"
 
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
+        # SQLite with WAL and serialized writers, tuned by the SQLITE_* settings below
+        "ENGINE": "core.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
     }
 }
 
+# Shared by every process serving the API, which all need to agree on what
+# is kept there, such as the conversion rates version. The default keeps it
+# in files that every process on the host shares, as it does the SQLite
+# database. Point CACHE_URL at a redis:// or memcache:// server once
+# processes run on more than one host.
+CACHES = {
+    "default": env.cache(
+        "CACHE_URL", default=f"filecache://{Path(tempfile.gettempdir()) / 'iswift-cache'}"
+    )
+}
+
+# Aliases of read replicas of the default database. Safe requests to views
+# with core.mixins.ReadReplicaMixin read from one of them at random. Locally
+# each is a SQLite file next to the default one, copied by `sync_replicas`.
+DATABASE_REPLICAS = env.list("DATABASE_REPLICAS", default=[])
+
+for alias in DATABASE_REPLICAS:
+    DATABASES[alias] = {**DATABASES["default"], "NAME": BASE_DIR / f"{alias}.sqlite3"}
+
+DATABASE_ROUTERS = ["core.routers.ReplicaRouter"]
+
+# Seconds a user's reads stay on the primary after a request of theirs that
+# wrote. Kept in the cache, which must be shared by every process serving them.
+REPLICA_STICKY_SECONDS = 5
+
 AUTH_USER_MODEL = "accounts.User"
 
 # DRF Settings
@@ -187,3 +215,89 @@ OTP_EXPIRY_MINUTES = 15
 
 # Time to wait after maximum tries have been exhausted before new OTP can be generated
 OTP_MAX_OUT_MINUTES = 25
+
+# Where finance.utils.update_rates fetches exchange rates from
+RATES_PROVIDER = "finance.utils.CurrencyAPIRateProvider"
+
+# Number of base currencies fetched concurrently when refreshing rates
+RATES_FETCH_WORKERS = 4
+
+# When set, only this currency's rates are fetched and every other
+# rate is derived from them. Set to None to fetch every currency.
+RATES_ANCHOR_CURRENCY = "usd"
+
+# Seconds a process keeps using its conversion rate matrix before reading the
+# shared rates version again, so lookups in between make no cache round trip.
+# Rates refreshed by another process are picked up within this long.
+RATES_VERSION_CHECK_SECONDS = 1
+
+# Hours a stored Idempotency-Key response is replayed for before it can be purged
+IDEMPOTENCY_KEY_TTL_HOURS = 24
+
+# Seconds a retry waits for the first request with the same Idempotency-Key to finish
+IDEMPOTENCY_WAIT_SECONDS = 10
+
+# Accounts checked per query by the reconciliation job
+RECONCILIATION_CHUNK_SIZE = 1000
+
+# Chunks the reconciliation job checks concurrently
+RECONCILIATION_WORKERS = 4
+
+# When set, transfers only insert the postings of the accounts they credit and
+# `project_balances` folds them into balances later, so busy inbound accounts
+# are not rewritten on every credit. Balances then lag until projected.
+JOURNAL_DEFERRED_CREDITS = False
+
+# When set, transfers are handed to an in-process committer that records many
+# of them in one transaction, so they share a commit and their queries instead
+# of paying for them each. Transfers made in a transaction run in it instead:
+# those sent with an Idempotency-Key always do, so they are never grouped.
+TRANSFER_GROUP_COMMIT = False
+
+# Most transfers applied in one group commit
+TRANSFER_GROUP_COMMIT_SIZE = 100
+
+# Milliseconds the committer waits after the first transfer of a batch for more
+TRANSFER_GROUP_COMMIT_WAIT_MS = 5
+
+# Seconds a transfer waits for its group commit. One the committer has not
+# started by then runs on its own instead, so a stalled committer cannot hang
+# requests; one already in a batch fails, as it may still commit.
+TRANSFER_GROUP_COMMIT_TIMEOUT = 10
+
+# Items of a payout job paid per transaction
+PAYOUT_CHUNK_SIZE = 1000
+
+# Payout jobs paid concurrently by each process. A process resumes every
+# unfinished job when it starts its workers, on the first job it pays; the
+# run_payout_jobs command resumes them without waiting for one.
+PAYOUT_WORKERS = 2
+
+# Pragmas set on every new connection by the core.backends.sqlite3 engine.
+# WAL lets reads run alongside the writer, and `synchronous = normal` only
+# syncs at checkpoints, which WAL keeps crash safe.
+SQLITE_PRAGMAS = {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    # Bytes of the database file read through memory maps
+    "mmap_size": 256 * 1024**2,
+    # Negative sizes are in KiB, so this is 64MB of page cache per connection
+    "cache_size": -64 * 1024,
+    # Milliseconds a writer waits for the database or the write lock
+    "busy_timeout": 5000,
+}
+
+# When set, transactions that write and writes outside a transaction queue
+# on one lock per process before taking SQLite's, so concurrent writers
+# never retry against each other. Transactions that only read skip it.
+SQLITE_WRITE_LOCK = True
+
+# Most tokens recipient autocomplete scans from the index range of the longest
+# term of a lookup, keeping short prefixes as fast as long ones. The users
+# list search is not capped, so it pages through every match.
+USER_SEARCH_CANDIDATES = 1000
+
+# When set, each process keeps every non-staff user's names and phone number
+# in memory and serves recipient autocomplete from there instead of the
+# database, at roughly 700MB per million users. See accounts.autocomplete.
+USER_AUTOCOMPLETE = False
@@ -1 +1,13 @@
+import atexit
+import shutil
+import tempfile
+
 from iswift.settings.base import *
+
+# A replica of the test database, read from by tests that set DATABASE_REPLICAS
+DATABASES["replica"] = {**DATABASES["default"], "TEST": {"MIRROR": "default"}}
+
+# A cache of its own for each test run, unless CACHE_URL is set
+CACHE_DIR = tempfile.mkdtemp(prefix="iswift-test-cache-")
+atexit.register(shutil.rmtree, CACHE_DIR, ignore_errors=True)
+CACHES = {"default": env.cache("CACHE_URL", default=f"filecache://{CACHE_DIR}")}
@@ -78,10 +78,10 @@ class TestLoginEndpoint:
         ):
             user = user_factory()
             phone_number = user.phone_number
-            otp_factory(user=user)
+            user_otp = otp_factory(user=user)
             user.is_active = False
             user.save()
-            data = self.otp.copy()
+            data = {"otp": user_otp.get_code()}
             data["phone_number"] = phone_number
             response: Response = anon_client.post(
                 reverse("accounts:verify_otp"),
@@ -104,7 +104,7 @@ class TestLoginEndpoint:
             otp.save()
             user.is_active = False
             user.save()
-            data = self.otp.copy()
+            data = {"otp": otp.get_code()}
             data["phone_number"] = phone_number
             response: Response = anon_client.post(
                 reverse("accounts:verify_otp"),
@@ -118,8 +118,8 @@ class TestLoginEndpoint:
         ):
             user = user_factory()
             phone_number = user.phone_number
-            otp_factory(user=user)
-            data = self.otp.copy()
+            user_otp = otp_factory(user=user)
+            data = {"otp": user_otp.get_code()}
             data["phone_number"] = phone_number
             response: Response = anon_client.post(
                 reverse("accounts:verify_otp"),
@@ -133,10 +133,12 @@ class TestLoginEndpoint:
         ):
             user = user_factory()
             phone_number = user.phone_number
-            otp_factory(user=user)
-            data = self.otp.copy()
+            user_otp = otp_factory(user=user)
+            user.is_active = False
+            user.save()
+            wrong_otp = (int(user_otp.get_code()) + 1) % 10**6
+            data = {"otp": f"{wrong_otp:06d}"}
             data["phone_number"] = phone_number
-            data["otp"] = 432177
             response: Response = anon_client.post(
                 reverse("accounts:verify_otp"),
                 data=data,
@@ -236,8 +238,6 @@ class TestGenerateOTPPasswordReset:
 
 
 class TestOTPVerification:
-    otp = {"otp": 123456}
-
     @pytest.mark.auth
     def test_verification_success(
         self,
@@ -247,10 +247,10 @@ class TestOTPVerification:
     ):
         user = user_factory()
         phone_number = user.phone_number
-        otp_factory(user=user)
+        user_otp = otp_factory(user=user)
         user.is_active = False
         user.save()
-        data = self.otp.copy()
+        data = {"otp": user_otp.get_code()}
         data["phone_number"] = phone_number
         response: Response = anon_client.post(
             reverse("accounts:password_reset_verify_otp"),
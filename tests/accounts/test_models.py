@@ -1,4 +1,9 @@
+from io import StringIO
+
 import pytest
+from django.core.management import call_command
+
+from accounts.models import UserSearchToken
 
 pytestmark = pytest.mark.django_db
 
@@ -15,3 +20,46 @@ class TestOTPModel:
     def test_str_method(self, otp_factory):
         otp = otp_factory()
         assert otp.__str__() == str(otp)
+
+    @pytest.mark.accounts_models
+    def test_issue_replaces_code(self, otp_factory):
+        otp = otp_factory()
+        old_code = otp.get_code()
+        code = otp.issue()
+        assert len(code) == 6 and code.isdigit()
+        assert otp.check_code(code)
+        assert not otp.check_code(old_code)
+
+    @pytest.mark.accounts_models
+    def test_codes_are_per_user(self, otp_factory):
+        first, second = otp_factory(), otp_factory()
+        second.otp_expiry = first.otp_expiry
+        assert first.get_code() != second.get_code()
+
+
+class TestUserSearchTokens:
+    @pytest.mark.accounts_models
+    def test_tokens_follow_user_fields(self, user_factory):
+        user = user_factory(
+            first_name="Chidi Émeka", last_name="Okafor", phone_number=8031234567, country_code=234
+        )
+        tokens = set(user.search_tokens.values_list("token", flat=True))
+        assert tokens == {"chidi", "emeka", "okafor", "8031234567", "2348031234567"}
+
+        user.last_name = "Obi"
+        user.save()
+        tokens = set(user.search_tokens.values_list("token", flat=True))
+        assert "obi" in tokens and "okafor" not in tokens
+
+    @pytest.mark.accounts_models
+    def test_saves_of_other_fields_skip_tokens(self, user_factory, django_assert_num_queries):
+        user = user_factory()
+        with django_assert_num_queries(1):
+            user.save(update_fields=["last_login"])
+
+    @pytest.mark.accounts_models
+    def test_rebuild_indexes_users_inserted_in_bulk(self, user_factory):
+        user = user_factory(first_name="Ada")
+        UserSearchToken.objects.all().delete()
+        call_command("rebuild_user_search", batch_size=1, stdout=StringIO())
+        assert user.search_tokens.filter(token="ada").exists()
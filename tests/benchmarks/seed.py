@@ -0,0 +1,144 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+
+from accounts.models import User
+from finance.models import CreditTransaction, Currency, DebitTransaction, iSwiftAccount
+
+PASSWORD = make_password("password")
+
+
+def insert_rows(model, rows, batch_size=5000):
+    """Inserts `rows` with executemany, skipping the ORM's per-object overhead.
+
+    Each row is a dict keyed by field attname. Missing fields get their
+    default, or the current time for auto timestamps, so the primary key is
+    the only column left to the database."""
+    now = timezone.now()
+    fields = [f for f in model._meta.concrete_fields if not f.primary_key]
+    # The connection itself, as `django.db.connection` is a proxy looked up per value
+    connection = connections[DEFAULT_DB_ALIAS]
+
+    def get_default(field):
+        if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False):
+            return now
+        return field.get_default()
+
+    sql = "INSERT INTO {} ({}) VALUES ({})".format(
+        connection.ops.quote_name(model._meta.db_table),
+        ", ".join(connection.ops.quote_name(f.column) for f in fields),
+        ", ".join(["%s"] * len(fields)),
+    )
+    with connection.cursor() as cursor:
+        batch = []
+        for row in rows:
+            values = [row[f.attname] if f.attname in row else get_default(f) for f in fields]
+            batch.append([f.get_db_prep_save(v, connection) for f, v in zip(fields, values)])
+            if len(batch) == batch_size:
+                cursor.executemany(sql, batch)
+                batch = []
+
+        if batch:
+            cursor.executemany(sql, batch)
+
+
+def seed_users(count: int, start: int = 0) -> None:
+    insert_rows(
+        User,
+        (
+            {
+                "email": f"bench{i}@test.com",
+                "password": PASSWORD,
+                "first_name": f"first{i}",
+                "last_name": f"last{i}",
+                "phone_number": 10**10 + i,
+                "country_code": 234,
+                "is_active": True,
+            }
+            for i in range(start, start + count)
+        ),
+    )
+
+
+def seed_accounts(users, currency: Currency) -> None:
+    insert_rows(
+        iSwiftAccount,
+        (
+            {
+                "user_id": user.pk,
+                "name": "Benchmark Account",
+                "currency_id": currency.pk,
+                "balance": Decimal("1000000.00"),
+                "is_default": True,
+                "status": iSwiftAccount.ACTIVE_STATUS,
+            }
+            for user in users
+        ),
+    )
+
+
+def seed_ledger(rows: int, accounts: int = 1000) -> list:
+    """Seeds `accounts` users with a default account each and `rows`
+    transactions spread evenly across them, half credits and half debits.
+    Returns the seeded accounts."""
+    currency = Currency.objects.first()
+    seed_users(accounts)
+    users = list(User.objects.filter(email__startswith="bench").order_by("pk"))
+    seed_accounts(users, currency)
+    seeded = list(iSwiftAccount.objects.filter(user__in=users).order_by("pk"))
+
+    now = timezone.now()
+    debits = rows // 2
+    insert_rows(
+        DebitTransaction,
+        (
+            {
+                "iswift_account_id": seeded[i % accounts].pk,
+                "created": now - timedelta(seconds=i),
+                "modified": now,
+                "description": "Benchmark debit",
+                "currency_id": currency.pk,
+                "recipient_id": users[(i + 1) % accounts].pk,
+                "amount_sent": Decimal("10.00"),
+            }
+            for i in range(debits)
+        ),
+    )
+    first_debit = DebitTransaction.objects.order_by("pk").values_list("pk", flat=True).first()
+    insert_rows(
+        CreditTransaction,
+        (
+            {
+                "iswift_account_id": seeded[i % accounts].pk,
+                "created": now - timedelta(seconds=i),
+                "modified": now,
+                "description": "Benchmark credit",
+                "debit_transaction_id": first_debit + i % debits,
+                "amount_received": Decimal("10.00"),
+                "currency_received_id": currency.pk,
+                "sender_id": users[(i + 1) % accounts].pk,
+                "amount_sent": Decimal("10.00"),
+                "currency_sent_id": currency.pk,
+            }
+            for i in range(rows - debits)
+        ),
+    )
+    return seeded
+
+
+def seed_dataset(size: int) -> list:
+    """Seeds `size` users with a default account each and `size`
+    transactions spread over at most the first 1000 accounts, so every
+    account's history grows with the dataset. Returns the accounts that
+    hold transactions."""
+    active = min(size, 1000)
+    accounts = seed_ledger(size, accounts=active)
+    if size > active:
+        seed_users(size - active, start=active)
+        users = User.objects.filter(email__startswith="bench", iswift_accounts__isnull=True)
+        seed_accounts(users.iterator(), accounts[0].currency)
+
+    return accounts
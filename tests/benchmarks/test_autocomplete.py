@@ -0,0 +1,75 @@
+import os
+import statistics
+import time
+import tracemalloc
+
+import pytest
+
+from accounts.autocomplete import AutocompleteIndex
+from accounts.models import User
+from tests.benchmarks.seed import seed_users
+
+pytestmark = [pytest.mark.django_db, pytest.mark.benchmark]
+
+# Non-staff users loaded into the index
+USERS = int(os.environ.get("BENCHMARK_AUTOCOMPLETE_USERS", 1_000_000))
+
+# Measured lookups per query, after one warm up lookup
+ITERATIONS = int(os.environ.get("BENCHMARK_AUTOCOMPLETE_ITERATIONS", 1000))
+
+# Seeded users are named first<n> last<n> with phone number 10**10 + n
+QUERIES = ["fir", "first4242", "last77 first77", "1000000", "234 1000000 4242"]
+
+# What a million seeded users may cost once loaded, and the p95 of a lookup
+# and of re-indexing a saved user. A million users measured 707MB, with
+# lookups at most 91us and updates 26us at the p95.
+MAX_MB_PER_MILLION = 800
+MAX_LOOKUP_US = 500
+MAX_UPDATE_US = 500
+
+
+def get_timings_us(fn, *args) -> list:
+    fn(*args)
+    timings = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        fn(*args)
+        timings.append((time.perf_counter() - start) * 10**6)
+    return timings
+
+
+class TestAutocomplete:
+    def test_autocomplete_memory_and_latency(self):
+        seed_users(USERS)
+        index = AutocompleteIndex()
+        # Traced rather than read from the process' resident memory, which
+        # keeps what loading freed and so hides what the index itself holds
+        tracemalloc.start()
+        start = time.perf_counter()
+        index.load()
+        elapsed = time.perf_counter() - start
+        held, peak = (size / 1024**2 for size in tracemalloc.get_traced_memory())
+        tracemalloc.stop()
+        per_million = held * 10**6 / USERS
+
+        print(
+            f"\nLoaded {len(index)} users in {elapsed:.1f}s (traced): holds {held:.0f}MB,"
+            f" {per_million:.0f}MB per million users, peaked at {peak:.0f}MB"
+        )
+        print(f"{'':32}p50 us    p95 us")
+        p95s = []
+        for query in QUERIES:
+            timings = get_timings_us(index.search, query, 10)
+            p95s.append(statistics.quantiles(timings, n=20)[-1])
+            print(f"{query:32}{statistics.median(timings):6.0f}{p95s[-1]:10.0f}")
+
+        user = User.objects.order_by("pk")[USERS // 2]
+        timings = get_timings_us(index.update, user)
+        update_p95 = statistics.quantiles(timings, n=20)[-1]
+        print(f"{'update one user':32}{statistics.median(timings):6.0f}{update_p95:10.0f}")
+
+        assert len(index) == USERS
+        assert index.search("first4242" if USERS > 4242 else "first1")
+        assert max(p95s) < MAX_LOOKUP_US
+        assert update_p95 < MAX_UPDATE_US
+        assert per_million < MAX_MB_PER_MILLION
@@ -0,0 +1,348 @@
+import gc
+import itertools
+import json
+import os
+import statistics
+import time
+from decimal import Decimal
+from pathlib import Path
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from knox.models import AuthToken
+from rest_framework.test import APIClient
+
+from accounts.models import OTP, User
+from core.tokens import password_reset_token
+from finance.models import Currency, iSwiftAccount
+from finance.payouts import create_payout_job
+from tests.benchmarks.seed import seed_dataset
+from tests.fixtures.finance import CurrencyFixtures
+
+pytestmark = [pytest.mark.django_db, pytest.mark.benchmark]
+
+# Rows seeded for each run, overridable as a comma separated list
+SIZES = [int(i) for i in os.environ.get("BENCHMARK_SIZES", "10,1000,100000").split(",")]
+
+# Measured requests per endpoint, after one warm up request
+ITERATIONS = int(os.environ.get("BENCHMARK_ITERATIONS", 50))
+
+# How far an endpoint's p95 latency may drift above its baseline before failing
+TOLERANCE = float(os.environ.get("BENCHMARK_TOLERANCE", 3))
+MIN_SLACK_MS = 10
+
+BASELINE_FILE = Path(__file__).parent / "baselines" / "endpoints.json"
+
+PASSWORD = "password"
+
+# The query count of every endpoint at the first size measured this session
+recorded_queries = {}
+
+
+def get_client(user: User = None) -> APIClient:
+    """A fresh client per request, so no session state leaks between requests"""
+    client = APIClient()
+    if user is not None:
+        _, token = AuthToken.objects.create(user)
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+    return client
+
+
+class Scenario:
+    """A seeded dataset and the request every endpoint is driven with.
+
+    Each `<endpoint>` method prepares whatever state the request needs and
+    returns `(client, method, url, data, expected_status)`. Only the request
+    itself is timed and has its queries counted."""
+
+    endpoints = [
+        "signup",
+        "login",
+        "verify_otp",
+        "regenerate_otp",
+        "password_reset_get_otp",
+        "password_reset_verify_otp",
+        "logout",
+        "reset_password_from_otp",
+        "password_reset",
+        "list_users",
+        "autocomplete_users",
+        "list_currencies",
+        "transfer",
+        "list_iswift_accounts",
+        "create_iswift_account",
+        "one_iswift_account",
+        "update_iswift_account",
+        "iswift_account_transactions",
+        "iswift_account_statement",
+        "iswift_account_balance",
+        "one_credit_transaction",
+        "one_debit_transaction",
+        "one_payout_job",
+    ]
+
+    def __init__(self, size: int):
+        accounts = seed_dataset(size)
+        self.account = accounts[0]
+        self.user = self.account.user
+        self.user.set_password(PASSWORD)
+        self.user.save()
+        self.recipients = [account.user.uid for account in accounts[1:6]]
+        self.credit = self.account.credit_transactions.first()
+        self.debit = self.account.debit_transactions.first()
+        rows = [(uid, Decimal(1)) for uid in self.recipients]
+        self.payout_job = create_payout_job(self.account, "Benchmark payout", rows)
+        self.other_currency = Currency.objects.exclude(pk=self.account.currency_id).first()
+        self.counter = itertools.count()
+        self.login_user = self.create_user()
+        self.signup_user = self.create_user(is_active=False)
+        self.reset_user = self.create_user()
+
+    def create_user(self, is_active=True) -> User:
+        n = next(self.counter)
+        user = User.objects.create_user(
+            email=f"subject{n}@test.com",
+            password=PASSWORD,
+            first_name="Subject",
+            last_name=str(n),
+            phone_number=2 * 10**10 + n,
+            country_code=234,
+            is_active=is_active,
+        )
+        OTP.objects.create(user=user, otp_expiry=timezone.now())
+        return user
+
+    def reset_otp(self, user: User) -> str:
+        otp = user.otp
+        otp.max_otp_try = 3
+        otp.otp_max_out = None
+        code = otp.issue(expiry_minutes=10)
+        otp.save()
+        return code
+
+    def url(self, name: str, **kwargs) -> str:
+        return reverse(name, kwargs=kwargs)
+
+    def signup(self):
+        n = next(self.counter)
+        data = {
+            "email": f"signup{n}@test.com",
+            "first_name": "Signup",
+            "last_name": str(n),
+            "password": PASSWORD,
+            "confirm_password": PASSWORD,
+            "country_code": 234,
+            "phone_number": 3 * 10**10 + n,
+            "currency": self.account.currency.iso_code,
+        }
+        return get_client(), "post", self.url("accounts:signup"), data, 201
+
+    def login(self):
+        data = {"email": self.login_user.email, "password": PASSWORD}
+        return get_client(), "post", self.url("accounts:login"), data, 200
+
+    def verify_otp(self):
+        user = self.create_user(is_active=False)
+        data = {"phone_number": str(user.phone_number), "otp": self.reset_otp(user)}
+        return get_client(), "post", self.url("accounts:verify_otp"), data, 200
+
+    def regenerate_otp(self):
+        self.reset_otp(self.signup_user)
+        data = {"phone_number": str(self.signup_user.phone_number)}
+        return get_client(), "post", self.url("accounts:regenerate_otp"), data, 200
+
+    def password_reset_get_otp(self):
+        self.reset_otp(self.reset_user)
+        data = {"phone_number": str(self.reset_user.phone_number)}
+        return get_client(), "post", self.url("accounts:password_reset_get_otp"), data, 200
+
+    def password_reset_verify_otp(self):
+        data = {
+            "phone_number": str(self.reset_user.phone_number),
+            "otp": self.reset_otp(self.reset_user),
+        }
+        return get_client(), "post", self.url("accounts:password_reset_verify_otp"), data, 200
+
+    def logout(self):
+        return get_client(self.user), "post", self.url("accounts:logout"), None, 200
+
+    def reset_password_from_otp(self):
+        self.reset_user.refresh_from_db()
+        data = {
+            "uid": self.reset_user.uid,
+            "token": password_reset_token.make_token(self.reset_user),
+            "password": PASSWORD,
+            "confirm_password": PASSWORD,
+        }
+        return get_client(), "post", self.url("accounts:reset_password_from_otp"), data, 200
+
+    def password_reset(self):
+        data = {
+            "current_password": PASSWORD,
+            "new_password": PASSWORD,
+            "confirm_new_password": PASSWORD,
+        }
+        return get_client(self.user), "post", self.url("accounts:password_reset"), data, 200
+
+    def list_users(self):
+        return get_client(self.user), "get", self.url("finance:list_users"), None, 200
+
+    def autocomplete_users(self):
+        url = self.url("finance:autocomplete_users") + "?q=first1"
+        return get_client(self.user), "get", url, None, 200
+
+    def list_currencies(self):
+        return get_client(), "get", self.url("finance:list_currencies"), None, 200
+
+    def transfer(self):
+        data = {
+            "iswift_account": self.account.uid,
+            "recipients": [{"recipient": uid, "amount": 1} for uid in self.recipients],
+        }
+        return get_client(self.user), "post", self.url("finance:transfer"), data, 201
+
+    def list_iswift_accounts(self):
+        return get_client(self.user), "get", self.url("finance:iswift_accounts"), None, 200
+
+    def create_iswift_account(self):
+        iSwiftAccount.objects.filter(user=self.user, currency=self.other_currency).delete()
+        data = {"currency": self.other_currency.iso_code}
+        return get_client(self.user), "post", self.url("finance:iswift_accounts"), data, 201
+
+    def one_iswift_account(self):
+        url = self.url("finance:one_iswift_account", uid=self.account.uid)
+        return get_client(self.user), "get", url, None, 200
+
+    def update_iswift_account(self):
+        url = self.url("finance:one_iswift_account", uid=self.account.uid)
+        return get_client(self.user), "post", url, {"name": "Benchmark Account"}, 200
+
+    def iswift_account_transactions(self):
+        url = self.url("finance:iswift_account_transactions", uid=self.account.uid)
+        return get_client(self.user), "get", url, None, 200
+
+    def iswift_account_statement(self):
+        url = self.url("finance:iswift_account_statement", uid=self.account.uid)
+        return get_client(self.user), "get", url, None, 200
+
+    def iswift_account_balance(self):
+        url = self.url("finance:iswift_account_balance", uid=self.account.uid)
+        return get_client(self.user), "get", url, None, 200
+
+    def one_credit_transaction(self):
+        url = self.url("finance:one_transaction", uid=self.credit.uid, type="credit-transaction")
+        return get_client(self.user), "get", url, None, 200
+
+    def one_debit_transaction(self):
+        url = self.url("finance:one_transaction", uid=self.debit.uid, type="debit-transaction")
+        return get_client(self.user), "get", url, None, 200
+
+    def one_payout_job(self):
+        url = self.url("finance:one_payout_job", uid=self.payout_job.uid)
+        return get_client(self.user), "get", url, None, 200
+
+
+def measure(scenario: Scenario, endpoint: str) -> dict:
+    """Drives `endpoint` and returns its query count and latency percentiles"""
+    queries = []
+    timings = []
+    # Collection pauses would land on whichever request happens to trigger them
+    gc.collect()
+    gc.disable()
+    try:
+        for i in range(ITERATIONS + 1):
+            client, method, url, data, expected_status = getattr(scenario, endpoint)()
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = getattr(client, method)(url, data, format="json")
+                if response.streaming:
+                    b"".join(response.streaming_content)
+                elapsed = (time.perf_counter() - start) * 1000
+            assert response.status_code == expected_status, f"{endpoint}: {response.data}"
+            # The first request warms up caches such as the rate matrix
+            if i:
+                queries.append(len(context))
+                timings.append(elapsed)
+    finally:
+        gc.enable()
+
+    return {
+        "queries": max(queries),
+        "p50_ms": statistics.median(timings),
+        "p95_ms": statistics.quantiles(timings, n=20)[18],
+    }
+
+
+def load_baseline() -> dict:
+    if BASELINE_FILE.exists():
+        return json.loads(BASELINE_FILE.read_text())
+    return {}
+
+
+def save_baseline(baseline: dict):
+    BASELINE_FILE.parent.mkdir(exist_ok=True)
+    BASELINE_FILE.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+
+
+class TestEndpoints(CurrencyFixtures):
+    @pytest.fixture(autouse=True)
+    def fast_password_hasher(self, settings):
+        # Hashing costs the same at every size and would drown out everything else
+        settings.PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+
+    @pytest.mark.parametrize("size", SIZES)
+    def test_endpoints_do_not_regress(self, request, size):
+        update = request.config.getoption("--update-baseline")
+        scenario = Scenario(size)
+        baseline = load_baseline()
+        failures = []
+
+        print(f"\n{size} rows{'':24}queries    p50 ms    p95 ms")
+        for endpoint in Scenario.endpoints:
+            result = measure(scenario, endpoint)
+            print(
+                f"{endpoint:32}{result['queries']:7}"
+                f"{result['p50_ms']:10.2f}{result['p95_ms']:10.2f}"
+            )
+
+            first_size, first_queries = recorded_queries.setdefault(
+                endpoint, (size, result["queries"])
+            )
+            if result["queries"] > first_queries:
+                failures.append(
+                    f"{endpoint} made {result['queries']} queries with {size} rows"
+                    f" but {first_queries} with {first_size} rows"
+                )
+
+            if update:
+                entry = baseline.setdefault(endpoint, {"p95_ms": {}})
+                entry["queries"] = result["queries"]
+                entry["p95_ms"][str(size)] = round(result["p95_ms"], 2)
+                continue
+
+            expected = baseline.get(endpoint, {})
+            if "queries" not in expected or str(size) not in expected["p95_ms"]:
+                failures.append(f"{endpoint} has no baseline for {size} rows")
+                continue
+
+            if result["queries"] > expected["queries"]:
+                failures.append(
+                    f"{endpoint} made {result['queries']} queries,"
+                    f" the baseline is {expected['queries']}"
+                )
+
+            baseline_ms = expected["p95_ms"][str(size)]
+            limit = max(baseline_ms * TOLERANCE, baseline_ms + MIN_SLACK_MS)
+            if result["p95_ms"] > limit:
+                failures.append(
+                    f"{endpoint} p95 is {result['p95_ms']:.2f}ms with {size} rows,"
+                    f" the baseline is {baseline_ms}ms"
+                )
+
+        if update:
+            save_baseline(baseline)
+
+        assert not failures, "\n".join(failures)
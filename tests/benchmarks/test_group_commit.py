@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+
+import pytest
+from django.db import connection, transaction
+from django.utils import timezone
+
+from finance.group_commit import TransferCommitter
+from finance.models import DebitTransaction, iSwiftAccount
+from tests.benchmarks.seed import seed_ledger
+from tests.fixtures.finance import CurrencyFixtures
+
+# The committer thread opens its own connection, which only sees committed rows
+pytestmark = [pytest.mark.django_db(transaction=True), pytest.mark.benchmark]
+
+# Threads standing in for request workers, and transfers made by each
+THREADS = int(os.environ.get("BENCHMARK_GROUP_COMMIT_THREADS", 16))
+TRANSFERS = int(os.environ.get("BENCHMARK_GROUP_COMMIT_TRANSFERS", 50))
+
+# Durable commits timed to report what one costs on the disk under the benchmark
+COMMITS = 200
+
+# How much faster than one commit per transfer group commits must be. Grouping
+# leaves one commit per batch, and the transfers of a batch are recorded with
+# the queries of one, so the speedup does not rest on commits being slow.
+# 3.5-4.1x was measured on SQLite with 16 threads, whose batches hold 16.
+MIN_SPEEDUP = float(os.environ.get("BENCHMARK_GROUP_COMMIT_MIN_SPEEDUP", 3))
+
+
+def get_throughput(make_transfer) -> float:
+    """Transfers per second made by `THREADS` threads calling `make_transfer`"""
+    errors = []
+
+    def run(index):
+        try:
+            for _ in range(TRANSFERS):
+                make_transfer(index)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(THREADS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    assert not errors
+    return THREADS * TRANSFERS / elapsed
+
+
+def get_commit_seconds(account: iSwiftAccount) -> float:
+    """Seconds a transaction writing one row takes, most of it its commit"""
+    start = time.perf_counter()
+    for _ in range(COMMITS):
+        with transaction.atomic():
+            iSwiftAccount.objects.filter(pk=account.pk).update(modified=timezone.now())
+    return (time.perf_counter() - start) / COMMITS
+
+
+class TestGroupCommit(CurrencyFixtures):
+    def test_group_commit_throughput(self, settings):
+        # Every commit is synced to disk, the case group commits are for
+        settings.SQLITE_PRAGMAS = {**settings.SQLITE_PRAGMAS, "synchronous": "full"}
+        connection.close()
+        with transaction.atomic():
+            *senders, recipient = seed_ledger(0, accounts=THREADS + 1)
+        recipients = [{"recipient": recipient.user, "amount": 1}]
+        commit = get_commit_seconds(recipient)
+
+        # One transaction per transfer. Made one at a time, as SQLite would
+        # make concurrent writers wait for each other anyway.
+        lock = threading.Lock()
+
+        def transfer(index):
+            with lock:
+                senders[index].record_transfer(recipients, "Benchmark transfer")
+
+        direct = get_throughput(transfer)
+
+        committer = TransferCommitter()
+
+        def submit(index):
+            sender = senders[index]
+            committer.submit(sender.record_transfer, recipients, "Benchmark transfer").result()
+
+        grouped = get_throughput(submit)
+
+        transfers = THREADS * TRANSFERS
+        print(
+            f"\n{transfers} transfers from {THREADS} threads, {commit * 1000:.2f}ms a commit:"
+            f" {direct:.0f}/s one commit each, {grouped:.0f}/s in {committer.batches} group"
+            f" commits of up to {committer.size}, {grouped / direct:.1f}x"
+        )
+        assert DebitTransaction.objects.count() == 2 * transfers
+        assert grouped > direct * MIN_SPEEDUP
@@ -0,0 +1,73 @@
+import os
+import re
+import time
+
+import pytest
+
+from accounts.models import User
+from finance.models import CreditTransaction, DebitTransaction, iSwiftAccount
+from tests.benchmarks.seed import seed_ledger
+from tests.fixtures.finance import CurrencyFixtures
+
+pytestmark = [pytest.mark.django_db, pytest.mark.benchmark]
+
+# Transactions seeded before the plans are checked
+ROWS = int(os.environ.get("BENCHMARK_ROWS", 1_000_000))
+
+# Full table scans (SQLite / PostgreSQL) and sorts that an index should avoid
+FULL_SCAN = re.compile(r"^\W*(SCAN|Seq Scan on) (?P<table>\w+)", re.MULTILINE)
+SORT = re.compile(r"USE TEMP B-TREE FOR ORDER BY|Sort Key")
+
+
+def assert_uses_indexes(name, queryset, sorted=False):
+    plan = queryset.explain()
+    scans = [
+        match.group("table")
+        for match in FULL_SCAN.finditer(plan)
+        if "USING" not in match.group(0) and match.group("table") != "CONSTANT"
+    ]
+    assert not scans, f"{name} scans {scans}:\n{plan}"
+    if sorted:
+        assert not SORT.search(plan), f"{name} sorts without an index:\n{plan}"
+
+    start = time.perf_counter()
+    for _ in range(100):
+        list(queryset)
+    elapsed = (time.perf_counter() - start) * 10
+    print(f"{name}: {elapsed:.3f}ms\n{plan}")
+
+
+class TestQueryPlans(CurrencyFixtures):
+    def test_hot_lookups_use_indexes(self):
+        accounts = seed_ledger(ROWS)
+        account = accounts[len(accounts) // 2]
+        user = account.user
+        credit = account.credit_transactions.first()
+        debit = account.debit_transactions.first()
+
+        assert_uses_indexes("account by uid", iSwiftAccount.objects.filter(uid=account.uid))
+        assert_uses_indexes("user by uid", User.objects.filter(uid=user.uid))
+        assert_uses_indexes(
+            "credit by uid",
+            CreditTransaction.objects.filter(uid=credit.uid, iswift_account__user=user),
+        )
+        assert_uses_indexes(
+            "debit by uid",
+            DebitTransaction.objects.filter(uid=debit.uid, iswift_account__user=user),
+        )
+        assert_uses_indexes(
+            "account credits",
+            account.credit_transactions.order_by("-created")[:20],
+            sorted=True,
+        )
+        assert_uses_indexes(
+            "account debits",
+            account.debit_transactions.order_by("-created")[:20],
+            sorted=True,
+        )
+        assert_uses_indexes(
+            "default accounts by user uid",
+            iSwiftAccount.objects.filter(
+                user__uid__in=[i.user.uid for i in accounts[:10]], is_default=True
+            ),
+        )
@@ -0,0 +1,59 @@
+import os
+import threading
+import time
+
+import pytest
+from django.db import transaction
+
+from finance.models import iSwiftAccount
+from finance.reconciliation import reconcile
+from tests.benchmarks.seed import seed_ledger
+from tests.benchmarks.test_statement_export import MAX_GROWTH_MB, get_rss_mb
+from tests.fixtures.finance import CurrencyFixtures
+
+# Worker threads open their own connections, which only see committed rows
+pytestmark = [pytest.mark.django_db(transaction=True), pytest.mark.benchmark]
+
+# Transactions and accounts seeded before reconciling
+ROWS = int(os.environ.get("BENCHMARK_RECONCILIATION_ROWS", 10_000_000))
+ACCOUNTS = int(os.environ.get("BENCHMARK_RECONCILIATION_ACCOUNTS", 100_000))
+
+
+class MemorySampler(threading.Thread):
+    """Samples the resident memory of this process until stopped"""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.stopped = threading.Event()
+        self.peak = get_rss_mb()
+
+    def run(self):
+        while not self.stopped.wait(0.01):
+            self.peak = max(self.peak, get_rss_mb())
+
+
+class TestReconciliation(CurrencyFixtures):
+    def test_reconcile_in_flat_memory(self):
+        if not os.path.exists("/proc/self/statm"):
+            pytest.skip("needs /proc to sample memory")
+
+        with transaction.atomic():
+            seed_ledger(ROWS, accounts=ACCOUNTS)
+
+        baseline = get_rss_mb()
+        sampler = MemorySampler()
+        sampler.start()
+        start = time.perf_counter()
+        run = reconcile()
+        elapsed = time.perf_counter() - start
+        sampler.stopped.set()
+        sampler.join()
+
+        print(
+            f"\n{ROWS} transactions over {run.accounts_checked} accounts in {elapsed:.1f}s,"
+            f" grew {sampler.peak - baseline:.1f}MB"
+        )
+        assert run.accounts_checked == iSwiftAccount.objects.count()
+        # Seeded balances are not backed by transactions, so every account drifts
+        assert run.drifts.count() == ACCOUNTS
+        assert sampler.peak - baseline < MAX_GROWTH_MB
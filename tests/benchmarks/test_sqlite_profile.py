@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+from django.db import DatabaseError
+from django.db.utils import ConnectionHandler
+
+pytestmark = pytest.mark.benchmark
+
+# Threads writing and reading at once, and seconds each profile is driven for
+WRITERS = int(os.environ.get("BENCHMARK_SQLITE_WRITERS", 8))
+READERS = int(os.environ.get("BENCHMARK_SQLITE_READERS", 8))
+DURATION = float(os.environ.get("BENCHMARK_SQLITE_SECONDS", 5))
+
+ACCOUNTS = 100
+
+PROFILES = {
+    "defaults": "django.db.backends.sqlite3",
+    "tuned": "core.backends.sqlite3",
+}
+
+
+@contextmanager
+def write_transaction(connection):
+    """What `core.helpers.write_transaction` does on SQLite, for a
+    connection outside `django.db.connections`"""
+    connection._start_transaction_under_autocommit()
+    getattr(connection, "begin_writing", lambda: None)()
+    try:
+        yield
+    except BaseException:
+        connection.rollback()
+        raise
+    else:
+        connection.commit()
+
+
+def transfer(connection, account_id: int):
+    """Reads then writes, like a transfer checking a balance before debiting it"""
+    with write_transaction(connection):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT balance FROM bench_account WHERE id = %s", [account_id])
+            balance = cursor.fetchone()[0]
+            cursor.execute(
+                "UPDATE bench_account SET balance = %s WHERE id = %s", [balance - 1, account_id]
+            )
+            cursor.execute(
+                "INSERT INTO bench_transfer (account_id, amount) VALUES (%s, 1)", [account_id]
+            )
+
+
+def read(connection, account_id: int):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT COUNT(*), SUM(amount) FROM bench_transfer WHERE account_id = %s", [account_id]
+        )
+        cursor.fetchone()
+
+
+def drive(connections: ConnectionHandler) -> dict:
+    """Runs writers and readers against one database for `DURATION`
+    seconds and returns the operations per second each managed"""
+    counts = {"writes": 0, "reads": 0, "errors": 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + DURATION
+
+    def run(operation, key, offset):
+        connection = connections["default"]
+        done = errors = 0
+        try:
+            while time.monotonic() < deadline:
+                try:
+                    operation(connection, 1 + (done + offset) % ACCOUNTS)
+                    done += 1
+                except DatabaseError:
+                    errors += 1
+        finally:
+            connection.close()
+            with lock:
+                counts[key] += done
+                counts["errors"] += errors
+
+    threads = [threading.Thread(target=run, args=(transfer, "writes", i)) for i in range(WRITERS)]
+    threads += [threading.Thread(target=run, args=(read, "reads", i)) for i in range(READERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return {
+        "writes": counts["writes"] / DURATION,
+        "reads": counts["reads"] / DURATION,
+        "errors": counts["errors"],
+    }
+
+
+def get_connections(engine: str, path) -> ConnectionHandler:
+    connections = ConnectionHandler({"default": {"ENGINE": engine, "NAME": str(path)}})
+    connection = connections["default"]
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE TABLE bench_account (id INTEGER PRIMARY KEY, balance INTEGER)")
+        cursor.execute(
+            "CREATE TABLE bench_transfer"
+            " (id INTEGER PRIMARY KEY AUTOINCREMENT, account_id INTEGER, amount INTEGER)"
+        )
+        cursor.execute("CREATE INDEX bench_transfer_account ON bench_transfer (account_id)")
+        cursor.executemany(
+            "INSERT INTO bench_account (id, balance) VALUES (%s, 1000000)",
+            [[i] for i in range(1, ACCOUNTS + 1)],
+        )
+    connection.close()
+    return connections
+
+
+class TestSQLiteProfile:
+    def test_tuned_profile_beats_defaults(self, tmp_path, django_db_blocker):
+        results = {}
+        with django_db_blocker.unblock():
+            for name, engine in PROFILES.items():
+                results[name] = drive(get_connections(engine, tmp_path / f"{name}.sqlite3"))
+
+        print(f"\n{WRITERS} writers and {READERS} readers for {DURATION:.0f}s each")
+        for name, result in results.items():
+            print(
+                f"{name:10}{result['writes']:8.0f} writes/s{result['reads']:10.0f} reads/s"
+                f"{result['errors']:8} errors"
+            )
+
+        tuned, defaults = results["tuned"], results["defaults"]
+        assert tuned["errors"] == 0
+        assert tuned["writes"] >= defaults["writes"]
+        assert tuned["reads"] > defaults["reads"]
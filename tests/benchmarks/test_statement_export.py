@@ -0,0 +1,51 @@
+import os
+import time
+
+import pytest
+
+from finance.statements import stream_statement
+from tests.benchmarks.seed import seed_ledger
+from tests.fixtures.finance import CurrencyFixtures
+
+pytestmark = [pytest.mark.django_db, pytest.mark.benchmark]
+
+# Transactions seeded on the exported account
+ROWS = int(os.environ.get("BENCHMARK_STATEMENT_ROWS", 5_000_000))
+
+# How much the process may grow while streaming, however many rows it streams
+MAX_GROWTH_MB = 50
+
+MAX_FIRST_BYTE_MS = 50
+
+
+def get_rss_mb() -> float:
+    """The current resident memory of this process"""
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024**2
+
+
+class TestStatementExport(CurrencyFixtures):
+    def test_export_streams_in_flat_memory(self):
+        if not os.path.exists("/proc/self/statm"):
+            pytest.skip("needs /proc to sample memory")
+
+        [account] = seed_ledger(ROWS, accounts=1)
+        for file_format in ["csv", "ndjson"]:
+            start = time.perf_counter()
+            chunks = stream_statement(account, file_format)
+            next(chunks)
+            first_byte_ms = (time.perf_counter() - start) * 1000
+
+            baseline = peak = get_rss_mb()
+            size = 0
+            for chunk in chunks:
+                size += len(chunk)
+                peak = max(peak, get_rss_mb())
+            elapsed = time.perf_counter() - start
+
+            print(
+                f"\n{file_format}: {ROWS} rows, {size / 1024**2:.1f}MB in {elapsed:.1f}s,"
+                f" first byte after {first_byte_ms:.1f}ms, grew {peak - baseline:.1f}MB"
+            )
+            assert peak - baseline < MAX_GROWTH_MB
+            assert first_byte_ms < MAX_FIRST_BYTE_MS
@@ -0,0 +1,89 @@
+import os
+import random
+import threading
+import time
+
+import pytest
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from core.exceptions import InsufficientFunds
+from finance.models import iSwiftAccount
+from tests.benchmarks.seed import seed_ledger
+from tests.fixtures.finance import CurrencyFixtures
+
+# Worker threads open their own connections, which only see committed rows
+pytestmark = [pytest.mark.django_db(transaction=True), pytest.mark.benchmark]
+
+# Threads transferring at once, transfers made by each and the accounts they
+# move money between. Few accounts, so most transfers overlap.
+THREADS = int(os.environ.get("BENCHMARK_STRESS_THREADS", 8))
+TRANSFERS = int(os.environ.get("BENCHMARK_STRESS_TRANSFERS", 100))
+ACCOUNTS = int(os.environ.get("BENCHMARK_STRESS_ACCOUNTS", 10))
+
+# Recipients of each bulk transfer
+RECIPIENTS = 3
+
+
+def make_transfers(accounts: list, seed: int, outcomes: list, errors: list):
+    """Makes `TRANSFERS` bulk transfers between random `accounts`, each
+    large enough to empty its sender now and then. Appending to a list is
+    atomic, so the threads share `outcomes` and `errors` without a lock."""
+    rng = random.Random(seed)
+    try:
+        # Copies of its own, as a transfer updates its sender in memory
+        accounts = list(
+            iSwiftAccount.objects.filter(pk__in=[a.pk for a in accounts]).select_related("user")
+        )
+        for _ in range(TRANSFERS):
+            sender, *recipients = rng.sample(accounts, RECIPIENTS + 1)
+            amount = rng.randint(1, 400_000)
+            try:
+                sender.record_transfer(
+                    [{"recipient": account.user, "amount": amount} for account in recipients],
+                    "Stress transfer",
+                )
+                outcomes.append("made")
+            except InsufficientFunds:
+                outcomes.append("refused")
+    except Exception as e:
+        errors.append(e)
+    finally:
+        connection.close()
+
+
+class TestTransferStress(CurrencyFixtures):
+    def test_concurrent_transfers_conserve_money(self):
+        if connection.vendor == "sqlite" and not settings.SQLITE_WRITE_LOCK:
+            # The shared in-memory test database fails a writer that finds a
+            # table locked right away, instead of waiting for the lock
+            pytest.skip("needs a database that queues concurrent writers")
+
+        with transaction.atomic():
+            accounts = seed_ledger(0, accounts=ACCOUNTS)
+        total = iSwiftAccount.objects.aggregate(total=Sum("balance"))["total"]
+
+        outcomes, errors = [], []
+        threads = [
+            threading.Thread(target=make_transfers, args=(accounts, seed, outcomes, errors))
+            for seed in range(THREADS)
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        made, refused = outcomes.count("made"), outcomes.count("refused")
+        print(
+            f"\n{made} transfers ({refused} refused) from {THREADS} threads"
+            f" over {ACCOUNTS} accounts in {elapsed:.1f}s,"
+            f" {made / elapsed:.0f} transfers/s"
+        )
+        assert not errors
+        assert len(outcomes) == THREADS * TRANSFERS
+        # No money was created or lost, and no account was overspent
+        assert iSwiftAccount.objects.aggregate(total=Sum("balance"))["total"] == total
+        assert not iSwiftAccount.objects.filter(balance__lt=0).exists()
@@ -0,0 +1,104 @@
+import os
+import statistics
+import time
+
+import pytest
+from django.db.models import Q
+
+from accounts.models import User, UserSearchToken
+from accounts.search import get_user_tokens, search_users
+from tests.benchmarks.seed import insert_rows, seed_users
+
+pytestmark = [pytest.mark.django_db, pytest.mark.benchmark]
+
+# Users in the directory at each step, overridable as a comma separated list
+SIZES = [int(i) for i in os.environ.get("BENCHMARK_SEARCH_SIZES", "1000,100000").split(",")]
+
+# Measured searches per query, after one warm up search
+ITERATIONS = int(os.environ.get("BENCHMARK_SEARCH_ITERATIONS", 20))
+
+# How far the p95 of a search may grow from the smallest directory to the largest
+TOLERANCE = 3
+MIN_SLACK_MS = 5
+
+# Seeded users are named first<n> last<n> with phone number 10**10 + n.
+# These match about as many users whatever the size of the directory.
+QUERIES = ["first4242", "last77 first77", "234 1000000 4242"]
+
+# These match a share of every user, and a search ranks all of its matches,
+# so they may only grow as fast as the directory
+BROAD_QUERIES = ["fir", "1000000"]
+
+PAGE_SIZE = 10
+
+
+def index_users(users):
+    """Inserts the tokens of users seeded without signals"""
+    insert_rows(
+        UserSearchToken,
+        (
+            {"user_id": user.pk, "token": token}
+            for user in users
+            for token in get_user_tokens(user)
+        ),
+    )
+
+
+def indexed_search(query: str) -> list:
+    users = search_users(User.non_staff.all(), query)
+    return list(users.order_by("-relevance", "first_name", "id")[:PAGE_SIZE])
+
+
+def icontains_search(query: str) -> list:
+    """What the directory search did before it had an index"""
+    users = User.non_staff.filter(
+        Q(first_name__icontains=query)
+        | Q(phone_number__icontains=query)
+        | Q(last_name__icontains=query)
+    ).distinct()
+    return list(users.order_by("first_name", "id")[:PAGE_SIZE])
+
+
+def get_p95_ms(search, query: str) -> float:
+    search(query)
+    timings = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        search(query)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.quantiles(timings, n=20)[-1]
+
+
+class TestUserSearch:
+    def test_search_stays_flat_as_directory_grows(self):
+        results = {}
+        seeded = 0
+        for size in SIZES:
+            seed_users(size - seeded, start=seeded)
+            last_pk = UserSearchToken.objects.order_by("-user_id").values_list("user_id").first()
+            index_users(User.objects.filter(pk__gt=last_pk[0] if last_pk else 0).iterator())
+            seeded = size
+
+            print(f"\n{size} users{'':20}indexed p95 ms  icontains p95 ms")
+            for query in QUERIES + BROAD_QUERIES:
+                results[size, query] = (
+                    get_p95_ms(indexed_search, query),
+                    get_p95_ms(icontains_search, query),
+                )
+                indexed, icontains = results[size, query]
+                print(f"{query:32}{indexed:15.2f}{icontains:18.2f}")
+
+        smallest, largest = SIZES[0], SIZES[-1]
+        assert indexed_search("first4242" if largest > 4242 else "first1")
+        for query in QUERIES:
+            small, large = results[smallest, query][0], results[largest, query][0]
+            assert large <= max(small * TOLERANCE, small + MIN_SLACK_MS), query
+        for query in BROAD_QUERIES:
+            small, large = results[smallest, query][0], results[largest, query][0]
+            assert large <= small * largest / smallest, query
+
+        # icontains stops at the first page of a broad query unranked, so the
+        # index is compared on the queries it is for
+        indexed_total = sum(results[largest, query][0] for query in QUERIES)
+        icontains_total = sum(results[largest, query][1] for query in QUERIES)
+        assert indexed_total < icontains_total
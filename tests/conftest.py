@@ -1,3 +1,5 @@
+import pytest
+from django.conf import settings
 from pytest_factoryboy import register
 
 from tests.factories.accounts import OTPFactory, UserFactory
@@ -22,6 +24,37 @@ FACTORIES = [
 for i in FACTORIES:
     register(i)
 
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--benchmark", action="store_true", default=False, help="run the benchmark suite"
+    )
+    parser.addoption(
+        "--update-baseline",
+        action="store_true",
+        default=False,
+        help="rewrite the benchmark baselines instead of checking against them",
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--benchmark"):
+        return
+
+    skip_benchmark = pytest.mark.skip(reason="benchmarks only run with --benchmark")
+    for item in items:
+        if item.get_closest_marker("benchmark"):
+            item.add_marker(skip_benchmark)
+
+
+@pytest.fixture(scope="session")
+def django_db_modify_db_settings(request, tmp_path_factory):
+    # Benchmarks run against a database file, as a deployment does, so every
+    # commit pays for its write. The other tests keep the in-memory database.
+    if request.config.getoption("--benchmark"):
+        test_settings = settings.DATABASES["default"].setdefault("TEST", {})
+        test_settings["NAME"] = str(tmp_path_factory.mktemp("benchmark") / "db.sqlite3")
+
 from tests.fixtures.anon_user import *  # noqa
 from tests.fixtures.auth_user import *  # noqa
 from tests.fixtures.finance import *  # noqa
@@ -0,0 +1,49 @@
+import pytest
+from django.conf import settings
+from django.db import connection, transaction
+
+from core.backends.sqlite3.base import DatabaseWrapper
+from core.helpers import write_transaction
+from finance.models import Currency
+
+pytestmark = [
+    pytest.mark.django_db(transaction=True),
+    pytest.mark.skipif(
+        settings.DATABASES["default"]["ENGINE"] != "core.backends.sqlite3",
+        reason="Tests the project's SQLite engine",
+    ),
+]
+
+
+def write_lock_is_free() -> bool:
+    if not DatabaseWrapper.write_lock.acquire(blocking=False):
+        return False
+    DatabaseWrapper.write_lock.release()
+    return True
+
+
+class TestSQLiteTransactions:
+    @pytest.mark.core
+    def test_read_only_transactions_skip_write_lock(self):
+        with transaction.atomic():
+            list(Currency.objects.all())
+            assert not connection.holds_write_lock
+            assert write_lock_is_free()
+
+    @pytest.mark.core
+    def test_transactions_take_write_lock_at_first_write(self):
+        with transaction.atomic():
+            list(Currency.objects.all())
+            Currency.objects.create(name="Naira", iso_code="ngn")
+            assert connection.holds_write_lock
+            assert not write_lock_is_free()
+        assert not connection.holds_write_lock
+        assert write_lock_is_free()
+
+    @pytest.mark.core
+    def test_write_transactions_take_write_lock_up_front(self):
+        with transaction.atomic():
+            with write_transaction():
+                assert connection.holds_write_lock
+            assert connection.holds_write_lock
+        assert not connection.holds_write_lock
@@ -31,6 +31,6 @@ class OTPFactory(DjangoModelFactory):
         model = OTP
 
     user = factory.SubFactory(UserFactory)
-    otp = 123456
+    counter = 1
     otp_expiry = timezone.now() + timedelta(minutes=settings.OTP_EXPIRY_MINUTES)
     max_otp_try = settings.MAX_OTP_TRY
@@ -1,13 +1,38 @@
+import csv
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import StringIO
 from random import choice
 from uuid import uuid4
 
 import pytest
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, IntegrityError, connection, connections
+from django.db.utils import ConnectionHandler
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.response import Response
 from rest_framework.test import APIClient
 
+from accounts.autocomplete import AutocompleteIndex, user_autocomplete
 from accounts.models import User
-from finance.models import Currency, iSwiftAccount
+from core.helpers import make_aware
+from core.management.commands.sync_replicas import copy_database
+from finance.cache import rate_cache
+from finance.models import (
+    CreditTransaction,
+    Currency,
+    DebitTransaction,
+    IdempotencyKey,
+    PayoutJob,
+    iSwiftAccount,
+)
+from finance.payouts import run_payout_job
+from finance.serializers.input import MakeTransferSerializer
 from tests.fixtures.finance import CurrencyFixtures
 
 pytestmark = pytest.mark.django_db
@@ -30,6 +55,213 @@ class TestListUsers:
         assert response.status_code == 200
         assert response.data["results"]
 
+    @pytest.mark.finance
+    def test_search_users_by_prefix(self, auth_client, user_factory):
+        xena = user_factory(first_name="Xena", last_name="Lovelace", phone_number=8031234567)
+        xenaida = user_factory(first_name="Xenaida", last_name="Obi", phone_number=7010000000)
+        user_factory(first_name="Bola", last_name="Xen", phone_number=9020000000)
+
+        def search(query):
+            response: Response = auth_client.get(reverse("finance:list_users"), {"search": query})
+            assert response.status_code == 200
+            return [user["uid"] for user in response.data["results"]]
+
+        assert search("lovelac") == [str(xena.uid)]
+        assert search("0803 123") == [str(xena.uid)]
+        assert search("xena obi") == [str(xenaida.uid)]
+        assert search("xyz") == []
+        assert search("!!!") == []
+        # Whole matches rank first, so "Xena" beats "Xenaida" and "Xen" never matches
+        assert search("xena") == [str(xena.uid), str(xenaida.uid)]
+
+    @pytest.mark.finance
+    def test_search_users_pages_by_relevance(self, auth_client, user_factory):
+        users = [user_factory(first_name="Xena" if i % 2 else "Xenaida") for i in range(15)]
+        ranked = sorted(users, key=lambda u: (u.first_name != "Xena", u.first_name, u.pk))
+
+        found = []
+        url = reverse("finance:list_users") + "?search=xena"
+        while url:
+            response: Response = auth_client.get(url)
+            found += [user["uid"] for user in response.data["results"]]
+            url = response.data["links"]["next"]
+        assert found == [str(user.uid) for user in ranked]
+
+    @pytest.mark.finance
+    def test_search_users_returns_every_match(self, auth_client, user_factory, settings):
+        # more matches than autocomplete scans, over two pages
+        settings.USER_SEARCH_CANDIDATES = 5
+        users = [user_factory(first_name="Xena") for _ in range(12)]
+
+        found = []
+        url = reverse("finance:list_users") + "?search=xena"
+        while url:
+            response: Response = auth_client.get(url)
+            found += [user["uid"] for user in response.data["results"]]
+            url = response.data["links"]["next"]
+        assert sorted(found) == sorted(str(user.uid) for user in users)
+
+    @pytest.mark.finance
+    def test_list_users_pages_through_everything(self, auth_client, user_factory):
+        # Shared first names, so pages break ties on the id
+        [user_factory(first_name=f"Name{i % 3}") for i in range(24)]
+        users = User.non_staff.order_by("first_name", "id")
+        expected = [str(uid) for uid in users.values_list("uid", flat=True)]
+
+        pages = []
+        url = reverse("finance:list_users")
+        while url:
+            response: Response = auth_client.get(url)
+            assert response.status_code == 200
+            assert "count" not in response.data
+            pages.append([user["uid"] for user in response.data["results"]])
+            url = response.data["links"]["next"]
+
+        assert [len(page) for page in pages] == [10, 10, 5]
+        assert sum(pages, []) == expected
+
+        response = auth_client.get(response.data["links"]["previous"])
+        assert [user["uid"] for user in response.data["results"]] == pages[1]
+        response = auth_client.get(response.data["links"]["previous"])
+        assert [user["uid"] for user in response.data["results"]] == pages[0]
+        assert response.data["links"]["previous"] is None
+
+    @pytest.mark.finance
+    def test_list_users_page_is_one_query(self, auth_client, user_factory):
+        [user_factory() for _ in range(25)]
+        url = auth_client.get(reverse("finance:list_users")).data["links"]["next"]
+        with CaptureQueriesContext(connection) as queries:
+            response: Response = auth_client.get(url)
+        assert response.status_code == 200
+        assert len(queries) == 1
+
+    @pytest.mark.finance
+    # Not base64, a position of the wrong length and one that is not an id
+    @pytest.mark.parametrize(
+        "cursor", ["not-a-cursor", "WzAsIFsiYSJdXQ==", "WzAsIFsiYSIsICJiIl1d"]
+    )
+    def test_list_users_fail_invalid_cursor(self, auth_client, cursor):
+        response: Response = auth_client.get(reverse("finance:list_users"), {"cursor": cursor})
+        assert response.status_code == 400
+
+
+class TestAutocompleteUsers:
+    @pytest.fixture(params=[True, False], ids=["memory", "database"])
+    def autocomplete(self, request, settings):
+        settings.USER_AUTOCOMPLETE = request.param
+        yield request.param
+        user_autocomplete.unload()
+
+    def search(self, client: APIClient, query: str, **params) -> list:
+        response: Response = client.get(
+            reverse("finance:autocomplete_users"), {"q": query, **params}
+        )
+        assert response.status_code == 200
+        return [user["uid"] for user in response.data]
+
+    @pytest.mark.finance
+    def test_autocomplete_users(self, auth_client, user_factory, autocomplete):
+        xena = user_factory(first_name="Xena", last_name="Lovelace", phone_number=8031234567)
+        xenaida = user_factory(first_name="Xenaida", last_name="Obi", phone_number=7010000000)
+        user_factory(first_name="Xenon", is_staff=True)
+
+        assert self.search(auth_client, "xena") == [str(xena.uid), str(xenaida.uid)]
+        assert self.search(auth_client, "xen", limit=1) == [str(xena.uid)]
+        assert self.search(auth_client, "xena obi") == [str(xenaida.uid)]
+        assert self.search(auth_client, "0803 123") == [str(xena.uid)]
+
+        response: Response = auth_client.get(reverse("finance:autocomplete_users"), {"q": "obi"})
+        assert response.data == [
+            {
+                "uid": str(xenaida.uid),
+                "object": "user",
+                "first_name": "Xenaida",
+                "last_name": "Obi",
+                "phone_number": 7010000000,
+            }
+        ]
+
+    @pytest.mark.finance
+    def test_autocomplete_ranks_every_candidate(self, auth_client, user_factory, autocomplete):
+        for _ in range(3):
+            user_factory(first_name="Xena", last_name="Obiora")
+        # Scanned last, as its tokens tie with the others and its pk is highest
+        best = user_factory(first_name="Xena", last_name="Obi")
+
+        assert self.search(auth_client, "xena obi", limit=1) == [str(best.uid)]
+
+    @pytest.mark.finance
+    def test_autocomplete_stops_once_page_is_full(self, user_factory, monkeypatch):
+        users = [user_factory(first_name="Xena", last_name=f"Obi{i}") for i in range(20)]
+        index = AutocompleteIndex()
+        index.load()
+        ranked = []
+        rank = index._rank
+        monkeypatch.setattr(index, "_rank", lambda pk, *args: ranked.append(pk) or rank(pk, *args))
+
+        # whole matches come first, so the page fills inside their run
+        assert [match.uid for match in index.search("xena", 3)] == [u.uid for u in users[:3]]
+        assert len(ranked) == 3
+        # nobody holds "xen" whole, so the first matches found are the best
+        ranked.clear()
+        assert [match.uid for match in index.search("xen", 3)] == [u.uid for u in users[:3]]
+        assert len(ranked) == 3
+
+    @pytest.mark.finance
+    def test_autocomplete_follows_saves(
+        self, auth_client, user_factory, autocomplete, django_capture_on_commit_callbacks
+    ):
+        user = user_factory(first_name="Xena")
+        assert self.search(auth_client, "xena") == [str(user.uid)]
+
+        with django_capture_on_commit_callbacks(execute=True):
+            user.first_name = "Yara"
+            user.save()
+        assert self.search(auth_client, "xena") == []
+        assert self.search(auth_client, "yara") == [str(user.uid)]
+
+        with django_capture_on_commit_callbacks(execute=True):
+            user.delete()
+        assert self.search(auth_client, "yara") == []
+
+    @pytest.mark.finance
+    def test_autocomplete_from_memory_makes_no_queries(
+        self, auth_client, user_factory, settings, django_assert_num_queries
+    ):
+        settings.USER_AUTOCOMPLETE = True
+        user_factory(first_name="Xena")
+        user_autocomplete.load()
+        try:
+            with django_assert_num_queries(0):
+                assert len(self.search(auth_client, "xena")) == 1
+        finally:
+            user_autocomplete.unload()
+
+    @pytest.mark.finance
+    def test_autocomplete_index_stays_sorted_through_updates(self, user_factory):
+        index = AutocompleteIndex()
+        index.chunk_size = 2
+        index.load([])
+        users = [user_factory(first_name=f"Xena{i % 4}", last_name="Obi") for i in range(12)]
+        for user in users:
+            index.update(user)
+        for user in users[::3]:
+            index.remove(user.pk)
+
+        kept = sorted(users[1::3] + users[2::3], key=lambda user: (user.first_name, user.pk))
+        assert len(index._chunks) > 1
+        assert [match.uid for match in index.search("obi", limit=20)] == [
+            user.uid for user in kept
+        ]
+        assert [match.uid for match in index.search("xena2", limit=20)] == [
+            user.uid for user in kept if user.first_name == "Xena2"
+        ]
+
+    @pytest.mark.finance
+    def test_autocomplete_fail_without_query(self, auth_client):
+        response: Response = auth_client.get(reverse("finance:autocomplete_users"))
+        assert response.status_code == 400
+
 
 class TestMakeTransfer(CurrencyFixtures):
     @pytest.mark.finance
@@ -60,6 +292,24 @@ class TestMakeTransfer(CurrencyFixtures):
         assert response.status_code == 201
         assert response.data
 
+    @pytest.mark.finance
+    @pytest.mark.django_db(transaction=True)
+    def test_make_transfer_with_group_commit(
+        self, settings, auth_user_client, iswift_account_factory
+    ):
+        settings.TRANSFER_GROUP_COMMIT = True
+        user, client = auth_user_client
+        recipient_acc = iswift_account_factory()
+        sender_acc = iswift_account_factory(user=user, balance=Decimal("1500.00"))
+        data = {
+            "recipients": [{"recipient": recipient_acc.user.uid, "amount": 1000}],
+            "iswift_account": sender_acc.uid,
+        }
+        response: Response = client.post(reverse("finance:transfer"), data=data)
+        assert response.status_code == 201
+        assert response.data["amount_sent"] == "1000.00"
+        assert iSwiftAccount.objects.get(pk=sender_acc.pk).balance == 500
+
     @pytest.mark.finance
     def test_make_transfer_fail_insufficient_balance(
         self, auth_user_client, iswift_account_factory
@@ -85,6 +335,69 @@ class TestMakeTransfer(CurrencyFixtures):
         response: Response = client.post(reverse("finance:transfer"), data=data)
         assert response.status_code == 400
 
+    @pytest.mark.finance
+    def test_make_transfer_fail_reports_every_nonexistent_user(
+        self, auth_user_client, iswift_account_factory
+    ):
+        user, client = auth_user_client
+        sender_acc = iswift_account_factory(user=user)
+        recipient_acc = iswift_account_factory()
+        invalid = [uuid4(), uuid4()]
+        data = {
+            "recipients": [{"recipient": recipient_acc.user.uid, "amount": 1000}]
+            + [{"recipient": uid, "amount": 1000} for uid in invalid],
+            "iswift_account": sender_acc.uid,
+        }
+        response: Response = client.post(reverse("finance:transfer"), data=data)
+        assert response.status_code == 400
+        errors = response.data["extra"]["fields"]["recipients"]
+        assert errors == [f"User with {uid} is not valid" for uid in invalid]
+
+    @pytest.mark.finance
+    def test_validate_recipients_query_count(
+        self, auth_user_client, iswift_account_factory, django_assert_num_queries
+    ):
+        user, _ = auth_user_client
+        sender_acc = iswift_account_factory(user=user)
+        recipients = [iswift_account_factory() for _ in range(20)]
+        data = {
+            "recipients": [
+                {"recipient": recipient.user.uid, "amount": 1000} for recipient in recipients
+            ],
+            "iswift_account": sender_acc.uid,
+        }
+        serializer = MakeTransferSerializer(data=data, context={"user": user})
+        # sender account and recipients
+        with django_assert_num_queries(2):
+            assert serializer.is_valid()
+
+        validated = serializer.validated_data["recipients"]
+        assert [value["iswift_account"] for value in validated] == recipients
+
+    @pytest.mark.finance
+    def test_make_transfer_query_count_does_not_grow_with_recipients(
+        self, auth_user_client, iswift_account_factory
+    ):
+        user, client = auth_user_client
+        sender_acc = iswift_account_factory(user=user)
+        rate_cache.get_rates(sender_acc.currency_id)
+        queries = []
+        for width in [1, 10]:
+            recipients = [iswift_account_factory() for _ in range(width)]
+            data = {
+                "recipients": [
+                    {"recipient": recipient.user.uid, "amount": 10} for recipient in recipients
+                ],
+                "iswift_account": sender_acc.uid,
+            }
+            with CaptureQueriesContext(connection) as context:
+                response: Response = client.post(reverse("finance:transfer"), data=data)
+            assert response.status_code == 201
+            assert len(response.data["recipients"]) == width
+            queries.append(len(context))
+
+        assert queries[0] == queries[1]
+
     @pytest.mark.finance
     def test_make_transfer_fail_nonexistent_account(
         self, auth_user_client, iswift_account_factory
@@ -111,6 +424,60 @@ class TestMakeTransfer(CurrencyFixtures):
         assert response.status_code == 403
 
 
+class TestPayoutJobs(CurrencyFixtures):
+    def upload(self, client, account, name, content):
+        data = {"iswift_account": account.uid, "file": SimpleUploadedFile(name, content.encode())}
+        return client.post(reverse("finance:payout_jobs"), data=data, format="multipart")
+
+    @pytest.mark.finance
+    def test_payout_job_progress(self, auth_user_client, iswift_account_factory):
+        user, client = auth_user_client
+        account = user.iswift_accounts.first()
+        recipients = [iswift_account_factory(currency=account.currency) for _ in range(3)]
+        rows = [f"{recipient.user.uid},10" for recipient in recipients] + [f"{uuid4()},10"]
+        content = "\n".join(["recipient,amount"] + rows)
+        response = self.upload(client, account, "salaries.csv", content)
+        assert response.status_code == 202
+        assert response.data["object"] == "payout-job"
+        assert response.data["total"] == response.data["remaining"] == 4
+        assert not response.data["is_finished"]
+
+        url = reverse("finance:one_payout_job", kwargs={"uid": response.data["uid"]})
+        run_payout_job(PayoutJob.objects.get(uid=response.data["uid"]).pk)
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.data["processed"] == 4
+        assert response.data["failed"] == 1
+        assert response.data["remaining"] == 0
+        assert response.data["is_finished"]
+
+    @pytest.mark.finance
+    def test_payout_job_accepts_json(self, auth_user_client, iswift_account_factory):
+        user, client = auth_user_client
+        recipient = iswift_account_factory()
+        content = json.dumps([{"recipient": str(recipient.user.uid), "amount": 25.5}])
+        response = self.upload(client, user.iswift_accounts.first(), "payout.json", content)
+        assert response.status_code == 202
+        job = PayoutJob.objects.get(uid=response.data["uid"])
+        assert job.items.get().amount == Decimal("25.50")
+
+    @pytest.mark.finance
+    def test_payout_job_fail(self, auth_user_client):
+        user, client = auth_user_client
+        account = user.iswift_accounts.first()
+        response = self.upload(client, account, "payout.csv", "uid,amount\n")
+        assert response.status_code == 400
+        content = f"recipient,amount\nnope,10\n{uuid4()},0"
+        response = self.upload(client, account, "payout.csv", content)
+        assert response.status_code == 400
+        errors = response.data["extra"]["fields"]["file"]
+        assert [error[:6] for error in errors] == ["Row 1:", "Row 2:"]
+        assert not PayoutJob.objects.exists()
+
+        url = reverse("finance:one_payout_job", kwargs={"uid": uuid4()})
+        assert client.get(url).status_code == 404
+
+
 class TestiSwiftAccountsListCreate(CurrencyFixtures):
     @pytest.mark.finance
     def test_list_iswift_account(self, auth_user_with_iswift_accounts: tuple[User, APIClient]):
@@ -123,7 +490,7 @@ class TestiSwiftAccountsListCreate(CurrencyFixtures):
     def test_create_iswift_account_success(self, auth_user_client):
         user, client = auth_user_client
         existing_usr_acc = user.iswift_accounts.all()
-        pks = [i.pk for i in existing_usr_acc]
+        pks = [i.currency_id for i in existing_usr_acc]
         currencies = Currency.objects.exclude(pk__in=pks)
         data = {
             "name": "Test name",
@@ -159,6 +526,17 @@ class TestiSwiftAccountDetail(CurrencyFixtures):
         assert response.status_code == 200
         assert response.data["transactions"]
 
+    @pytest.mark.finance
+    def test_get_sharded_iswift_account(self, auth_user_client):
+        user, client = auth_user_client
+        user_acc = user.iswift_accounts.first().set_balance_shards(2)
+        user_acc.shards.update(balance=Decimal("5.25"))
+        response: Response = client.get(
+            reverse("finance:one_iswift_account", kwargs={"uid": user_acc.uid})
+        )
+        assert response.status_code == 200
+        assert Decimal(response.data["balance"]) == user_acc.balance + Decimal("10.50")
+
     @pytest.mark.finance
     def test_update_one_iswift_account_success(self, auth_user_client):
         user, client = auth_user_client
@@ -183,6 +561,205 @@ class TestiSwiftAccountDetail(CurrencyFixtures):
         assert response.status_code == 400
 
 
+class TestiSwiftAccountTransactions(CurrencyFixtures):
+    @pytest.fixture
+    def account_with_transactions(
+        self, auth_user_client, credit_transaction_factory, debit_transaction_factory
+    ):
+        user, client = auth_user_client
+        account = user.iswift_accounts.first()
+        credits = [credit_transaction_factory(iswift_account=account) for _ in range(13)]
+        debits = [debit_transaction_factory(iswift_account=account) for _ in range(12)]
+        debits.append(debit_transaction_factory(iswift_account=account, recipient=None))
+        return account, client, credits + debits
+
+    @pytest.mark.finance
+    def test_list_transactions_pages_through_everything_newest_first(
+        self, account_with_transactions, django_assert_num_queries
+    ):
+        account, client, transactions = account_with_transactions
+        url = reverse("finance:iswift_account_transactions", kwargs={"uid": account.uid})
+        url += "?page_size=10"
+        results = []
+        while url:
+            # account and page
+            with django_assert_num_queries(2):
+                response: Response = client.get(url)
+            assert response.status_code == 200
+            assert len(response.data["results"]) <= 10
+            results += response.data["results"]
+            url = response.data["links"]["next"]
+
+        expected = sorted(transactions, key=lambda t: (t.created, t.id), reverse=True)
+        assert [r["uid"] for r in results] == [str(t.uid) for t in expected]
+        assert results[0]["object"] == "debit-transaction"
+        assert results[0]["sender_or_recipient"] == "Bulk Transfer"
+        assert results[0]["currency"]["iso_code"] == expected[0].currency.iso_code
+
+    @pytest.mark.finance
+    def test_list_transactions_pages_past_credit_and_debit_with_same_position(
+        self, auth_user_client, credit_transaction_factory, debit_transaction_factory
+    ):
+        user, client = auth_user_client
+        account = user.iswift_accounts.first()
+        credit = credit_transaction_factory(iswift_account=account)
+        debit = debit_transaction_factory(iswift_account=account)
+        # Credits and debits are numbered apart, so both can have the same id
+        pk = 1 + max(
+            CreditTransaction.objects.latest("pk").pk, DebitTransaction.objects.latest("pk").pk
+        )
+        created = timezone.now()
+        CreditTransaction.objects.filter(pk=credit.pk).update(id=pk, created=created)
+        DebitTransaction.objects.filter(pk=debit.pk).update(id=pk, created=created)
+
+        url = reverse("finance:iswift_account_transactions", kwargs={"uid": account.uid})
+        url += "?page_size=1"
+        results = []
+        while url:
+            response: Response = client.get(url)
+            assert response.status_code == 200
+            results += response.data["results"]
+            url = response.data["links"]["next"]
+
+        assert [r["uid"] for r in results] == [str(debit.uid), str(credit.uid)]
+
+    @pytest.mark.finance
+    def test_account_detail_embeds_latest_page(self, account_with_transactions):
+        account, client, transactions = account_with_transactions
+        response: Response = client.get(
+            reverse("finance:one_iswift_account", kwargs={"uid": account.uid})
+        )
+        assert response.status_code == 200
+        assert len(response.data["transactions"]) == 20
+        latest = max(transactions, key=lambda t: (t.created, t.id))
+        assert response.data["transactions"][0]["uid"] == str(latest.uid)
+
+    @pytest.mark.finance
+    def test_list_transactions_fail_invalid_cursor(self, auth_user_client):
+        user, client = auth_user_client
+        account = user.iswift_accounts.first()
+        response: Response = client.get(
+            reverse("finance:iswift_account_transactions", kwargs={"uid": account.uid}),
+            {"cursor": "invalid"},
+        )
+        assert response.status_code == 400
+
+
+class TestiSwiftAccountStatement(CurrencyFixtures):
+    @pytest.fixture
+    def account_with_history(
+        self, auth_user_client, credit_transaction_factory, debit_transaction_factory
+    ):
+        user, client = auth_user_client
+        account = user.iswift_accounts.first()
+        transactions = []
+        for day in range(1, 7):
+            factory = credit_transaction_factory if day % 2 else debit_transaction_factory
+            transaction = factory(iswift_account=account)
+            transaction.created = make_aware(datetime(2024, 1, day, 12))
+            type(transaction).objects.filter(pk=transaction.pk).update(created=transaction.created)
+            transactions.append(transaction)
+        return account, client, transactions
+
+    def get_statement(self, client, account, **params):
+        url = reverse("finance:iswift_account_statement", kwargs={"uid": account.uid})
+        return client.get(url, params)
+
+    @pytest.mark.finance
+    def test_statement_streams_csv_oldest_first(
+        self, account_with_history, django_assert_num_queries
+    ):
+        account, client, transactions = account_with_history
+        response = self.get_statement(client, account)
+        assert response.status_code == 200
+        assert response["Content-Type"] == "text/csv"
+        assert response.streaming
+        # every row comes from a single query, read as the response is consumed
+        with django_assert_num_queries(1):
+            content = b"".join(response.streaming_content).decode()
+
+        rows = list(csv.DictReader(StringIO(content)))
+        assert [row["uid"] for row in rows] == [str(t.uid) for t in transactions]
+        assert rows[0]["type"] == "credit-transaction"
+        assert rows[1]["type"] == "debit-transaction"
+        assert Decimal(rows[0]["amount"]) == transactions[0].amount_received
+
+    @pytest.mark.finance
+    def test_statement_streams_ndjson_in_date_range(self, account_with_history):
+        account, client, transactions = account_with_history
+        response = self.get_statement(
+            client, account, file_format="ndjson", start="2024-01-02", end="2024-01-04"
+        )
+        assert response.status_code == 200
+        assert response["Content-Type"] == "application/x-ndjson"
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        assert [json.loads(line)["uid"] for line in lines] == [
+            str(t.uid) for t in transactions[1:4]
+        ]
+
+    @pytest.mark.finance
+    def test_statement_fail_invalid_range(self, account_with_history):
+        account, client, _ = account_with_history
+        response = self.get_statement(client, account, start="2024-01-04", end="2024-01-02")
+        assert response.status_code == 400
+        assert self.get_statement(client, account, file_format="pdf").status_code == 400
+
+    @pytest.mark.finance
+    def test_export_statement_command(self, account_with_history, tmp_path):
+        account, _, transactions = account_with_history
+        output = tmp_path / "statement.csv"
+        call_command("export_statement", str(account.uid), "--start=2024-01-05", output=output)
+        rows = list(csv.DictReader(output.open()))
+        assert [row["uid"] for row in rows] == [str(t.uid) for t in transactions[4:]]
+
+
+class TestiSwiftAccountBalance(CurrencyFixtures):
+    @pytest.fixture
+    def account_with_history(self, auth_user_client, credit_transaction_factory):
+        user, client = auth_user_client
+        account = user.iswift_accounts.first()
+        credits = []
+        for day in range(1, 4):
+            credit = credit_transaction_factory(iswift_account=account)
+            CreditTransaction.objects.filter(pk=credit.pk).update(
+                created=make_aware(datetime(2024, 1, day, 12))
+            )
+            credit.refresh_from_db()
+            credits.append(credit)
+        return account, client, credits
+
+    def get_balance(self, client, account, **params):
+        url = reverse("finance:iswift_account_balance", kwargs={"uid": account.uid})
+        return client.get(url, params)
+
+    @pytest.mark.finance
+    def test_balance_as_of(self, account_with_history):
+        account, client, credits = account_with_history
+        call_command("update_balance_checkpoints", "--until=2024-01-02")
+        assert account.balance_checkpoints.count() == 2
+
+        at = make_aware(datetime(2024, 1, 3, 18))
+        response = self.get_balance(client, account, at=at.isoformat())
+        assert response.status_code == 200
+        assert response.data["object"] == "balance"
+        assert response.data["iswift_account"] == str(account.uid)
+        assert Decimal(response.data["balance"]) == sum(c.amount_received for c in credits)
+
+        response = self.get_balance(client, account, at="2024-01-02T00:00:00Z")
+        assert Decimal(response.data["balance"]) == credits[0].amount_received
+
+    @pytest.mark.finance
+    def test_balance_fail(self, account_with_history, iswift_account_factory):
+        account, client, _ = account_with_history
+        assert self.get_balance(client, account, at="yesterday").status_code == 400
+        assert self.get_balance(client, iswift_account_factory()).status_code == 404
+
+    @pytest.mark.finance
+    def test_checkpoint_command_rejects_open_days(self):
+        with pytest.raises(CommandError):
+            call_command("update_balance_checkpoints", f"--until={timezone.localdate()}")
+
+
 class TestTransactionDetail(CurrencyFixtures):
     @pytest.mark.finance
     @pytest.mark.parametrize(
@@ -202,6 +779,44 @@ class TestTransactionDetail(CurrencyFixtures):
         )
         assert response.status_code == 200
 
+    @pytest.mark.finance
+    def test_get_debit_transaction_query_count_does_not_grow_with_recipients(
+        self, auth_user_client, debit_transaction_factory, credit_transaction_factory
+    ):
+        user, client = auth_user_client
+        queries = []
+        for width in [1, 25]:
+            debit = debit_transaction_factory(iswift_account__user=user)
+            credit_transaction_factory.create_batch(width, debit_transaction=debit)
+            url = reverse(
+                "finance:one_transaction", kwargs={"uid": debit.uid, "type": "debit-transaction"}
+            )
+            with CaptureQueriesContext(connection) as context:
+                response: Response = client.get(url)
+            assert response.status_code == 200
+            assert len(response.data["recipients"]) == width
+            queries.append(len(context))
+
+        assert queries[0] == queries[1]
+
+    @pytest.mark.finance
+    def test_get_credit_transaction_joins_its_relations(
+        self, auth_user_client, credit_transaction_factory
+    ):
+        user, client = auth_user_client
+        credit = credit_transaction_factory(iswift_account__user=user)
+        url = reverse(
+            "finance:one_transaction", kwargs={"uid": credit.uid, "type": "credit-transaction"}
+        )
+        with CaptureQueriesContext(connection) as context:
+            response: Response = client.get(url)
+        assert response.status_code == 200
+        credit_queries = [
+            query for query in context if "finance_credittransaction" in query["sql"]
+        ]
+        assert len(credit_queries) == 1
+        assert "finance_currency" in credit_queries[0]["sql"]
+
     def test_get_one_transaction_fail_invalid_type(
         self, auth_user_client, credit_transaction_factory
     ):
@@ -219,3 +834,216 @@ class TestTransactionDetail(CurrencyFixtures):
             )
         )
         assert response.status_code == 404
+
+
+class TestIdempotentRequests(CurrencyFixtures):
+    key = "transfer-1"
+
+    @pytest.fixture
+    def transfer(self, auth_user_client, iswift_account_factory):
+        user, client = auth_user_client
+        sender_acc = iswift_account_factory(user=user)
+        recipient_acc = iswift_account_factory()
+        data = {
+            "recipients": [{"recipient": recipient_acc.user.uid, "amount": 1000}],
+            "iswift_account": sender_acc.uid,
+        }
+
+        def post(data=data, key=self.key):
+            return client.post(reverse("finance:transfer"), data=data, HTTP_IDEMPOTENCY_KEY=key)
+
+        return post, sender_acc, data
+
+    @pytest.mark.finance
+    def test_retry_replays_stored_response(self, transfer, django_assert_num_queries):
+        post, sender_acc, _ = transfer
+        balance = sender_acc.balance
+        first: Response = post()
+        assert first.status_code == 201
+
+        with django_assert_num_queries(1):
+            retry: Response = post()
+        assert retry.status_code == 201
+        assert retry["Idempotent-Replayed"] == "true"
+        assert retry.json() == first.json()
+        sender_acc.refresh_from_db()
+        assert sender_acc.balance == balance - 1000
+        assert sender_acc.debit_transactions.count() == 1
+
+    @pytest.mark.finance
+    def test_retry_with_different_request_fails(self, transfer):
+        post, _, data = transfer
+        assert post().status_code == 201
+        data = {**data, "description": "Something else"}
+        assert post(data=data).status_code == 422
+
+    @pytest.mark.finance
+    def test_failed_request_releases_key(self, transfer):
+        post, _, data = transfer
+        data["recipients"][0]["amount"] = 99_999_999
+        assert post(data=data).status_code == 400
+        assert not IdempotencyKey.objects.exists()
+
+        data["recipients"][0]["amount"] = 1000
+        assert post(data=data).status_code == 201
+
+    @pytest.mark.finance
+    def test_response_is_stored_with_the_handlers_writes(self, transfer, monkeypatch):
+        post, sender_acc, _ = transfer
+
+        save = IdempotencyKey.save
+
+        def crash_storing_response(record, **kwargs):
+            if "update_fields" in kwargs:
+                raise DatabaseError("Lost the connection")
+            return save(record, **kwargs)
+
+        monkeypatch.setattr(IdempotencyKey, "save", crash_storing_response)
+        with pytest.raises(DatabaseError):
+            post()
+        assert not sender_acc.debit_transactions.exists()
+        assert not IdempotencyKey.objects.exists()
+
+        monkeypatch.undo()
+        assert post().status_code == 201
+        assert sender_acc.debit_transactions.count() == 1
+
+    @pytest.mark.finance
+    def test_claims_key_released_by_a_failed_request(self, transfer, monkeypatch):
+        post, sender_acc, _ = transfer
+        create = IdempotencyKey.objects.create
+        calls = []
+
+        def claimed_by_a_request_that_failed(**kwargs):
+            calls.append(kwargs)
+            if len(calls) == 1:
+                raise IntegrityError("UNIQUE constraint failed")
+            return create(**kwargs)
+
+        monkeypatch.setattr(IdempotencyKey.objects, "create", claimed_by_a_request_that_failed)
+        assert post().status_code == 201
+        assert len(calls) == 2
+        assert sender_acc.debit_transactions.count() == 1
+
+    @pytest.mark.finance
+    def test_concurrent_retry_waits_for_first_request(self, transfer, monkeypatch):
+        post, sender_acc, _ = transfer
+        first: Response = post()
+        record = IdempotencyKey.objects.get(key=self.key)
+        response = record.response
+        # Put the key back in progress, and let the first request finish while the retry waits
+        IdempotencyKey.objects.filter(pk=record.pk).update(status_code=None, response=None)
+
+        def finish_first_request(seconds):
+            IdempotencyKey.objects.filter(pk=record.pk).update(status_code=201, response=response)
+
+        monkeypatch.setattr("finance.idempotency.time.sleep", finish_first_request)
+        retry: Response = post()
+        assert retry.status_code == 201
+        assert retry.json() == first.json()
+        assert sender_acc.debit_transactions.count() == 1
+
+    @pytest.mark.finance
+    def test_concurrent_retry_times_out(self, transfer, settings):
+        settings.IDEMPOTENCY_WAIT_SECONDS = 0
+        post, _, _ = transfer
+        post()
+        IdempotencyKey.objects.update(status_code=None, response=None)
+        assert post().status_code == 409
+
+    @pytest.mark.finance
+    def test_expired_keys_are_purged_in_batches(self, user_factory):
+        user = user_factory()
+        now = timezone.now()
+        IdempotencyKey.objects.bulk_create(
+            [
+                IdempotencyKey(
+                    user=user,
+                    key=str(i),
+                    fingerprint="",
+                    expires_at=now + timedelta(hours=1 if i == 0 else -1),
+                )
+                for i in range(5)
+            ]
+        )
+        call_command("purge_idempotency_keys", batch_size=2, stdout=StringIO())
+        assert list(IdempotencyKey.objects.values_list("key", flat=True)) == ["0"]
+
+
+class TestReadReplicas(CurrencyFixtures):
+    # The replica mirrors the test database through a connection of its own,
+    # which only sees committed rows
+    pytestmark = pytest.mark.django_db(transaction=True, databases=["default", "replica"])
+
+    @pytest.fixture(autouse=True)
+    def replicas(self, settings):
+        settings.DATABASE_REPLICAS = ["replica"]
+        cache.clear()
+
+    def get(self, client: APIClient, url: str) -> dict:
+        """Makes a GET request and counts the queries sent to each database"""
+        with (
+            CaptureQueriesContext(connections["default"]) as primary,
+            CaptureQueriesContext(connections["replica"]) as replica,
+        ):
+            response: Response = client.get(url)
+        assert response.status_code == 200
+        return {"primary": len(primary), "replica": len(replica)}
+
+    @pytest.mark.finance
+    def test_safe_requests_read_from_replica(self, anon_client, auth_user_client):
+        user, client = auth_user_client
+        account = user.iswift_accounts.first()
+        urls = [
+            reverse("finance:list_currencies"),
+            reverse("finance:list_users"),
+            reverse("finance:one_iswift_account", kwargs={"uid": account.uid}),
+        ]
+        for url in urls:
+            queries = self.get(client, url)
+            assert queries["replica"] and not queries["primary"]
+
+    @pytest.mark.finance
+    def test_reads_stick_to_primary_after_write(self, auth_user_client, iswift_account_factory):
+        user, client = auth_user_client
+        sender_acc = user.iswift_accounts.first()
+        recipient_acc = iswift_account_factory()
+        url = reverse("finance:one_iswift_account", kwargs={"uid": sender_acc.uid})
+
+        with CaptureQueriesContext(connections["replica"]) as replica:
+            response: Response = client.post(
+                reverse("finance:transfer"),
+                data={
+                    "recipients": [{"recipient": recipient_acc.user.uid, "amount": 1000}],
+                    "iswift_account": sender_acc.uid,
+                },
+            )
+        assert response.status_code == 201
+        assert not replica
+
+        queries = self.get(client, url)
+        assert queries["primary"] and not queries["replica"]
+
+        # Once the window has passed
+        cache.clear()
+        queries = self.get(client, url)
+        assert queries["replica"] and not queries["primary"]
+
+    @pytest.mark.finance
+    def test_sync_replicas_copies_database(self, tmp_path, django_db_blocker):
+        databases = ConnectionHandler(
+            {
+                alias: {"ENGINE": "core.backends.sqlite3", "NAME": str(tmp_path / alias)}
+                for alias in ["default", "replica"]
+            }
+        )
+        with django_db_blocker.unblock():
+            with databases["default"].cursor() as cursor:
+                cursor.execute("CREATE TABLE synced (id INTEGER PRIMARY KEY)")
+                cursor.execute("INSERT INTO synced (id) VALUES (1)")
+
+            copy_database(databases["default"], databases["replica"])
+            with databases["replica"].cursor() as cursor:
+                cursor.execute("SELECT id FROM synced")
+                assert cursor.fetchall() == [(1,)]
+            databases.close_all()
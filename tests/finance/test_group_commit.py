@@ -0,0 +1,141 @@
+from decimal import Decimal
+
+import pytest
+from django.db import OperationalError, connections
+
+from core.exceptions import InsufficientFunds, TransferPending
+from finance.group_commit import GroupCommitter, TransferCommitter
+from finance.models import DebitTransaction, iSwiftAccount
+from tests.fixtures.finance import CurrencyFixtures
+
+pytestmark = pytest.mark.django_db
+
+
+class TestGroupCommit(CurrencyFixtures):
+    @pytest.mark.finance
+    @pytest.mark.django_db(transaction=True)
+    def test_transfers_share_one_commit(self, iswift_account_factory):
+        senders = [iswift_account_factory(balance=Decimal("100.00")) for _ in range(4)]
+        receiver: iSwiftAccount = iswift_account_factory()
+        committer = GroupCommitter(size=4, wait_ms=1000)
+        amounts = [10, 20, 500, 30]
+        futures = [
+            committer.submit(
+                sender.record_transfer, [{"recipient": receiver.user, "amount": amount}], "Pay"
+            )
+            for sender, amount in zip(senders, amounts)
+        ]
+
+        assert [futures[i].result(timeout=5).amount_sent for i in [0, 1, 3]] == [10, 20, 30]
+        # the transfer that failed was rolled back alone
+        with pytest.raises(InsufficientFunds):
+            futures[2].result(timeout=5)
+        assert committer.batches == 1
+        assert DebitTransaction.objects.count() == 3
+        assert iSwiftAccount.objects.get(pk=senders[2].pk).balance == 100
+
+    @pytest.mark.finance
+    @pytest.mark.django_db(transaction=True)
+    def test_transfers_recorded_together(self, monkeypatch, iswift_account_factory):
+        senders = [iswift_account_factory(balance=Decimal("100.00")) for _ in range(3)]
+        receiver: iSwiftAccount = iswift_account_factory()
+        record_transfers = iSwiftAccount.record_transfers
+        batches = []
+
+        def spy(transfers):
+            batches.append(len(transfers))
+            return record_transfers(transfers)
+
+        monkeypatch.setattr(iSwiftAccount, "record_transfers", spy)
+        committer = TransferCommitter(size=3, wait_ms=1000)
+        futures = [
+            committer.submit(
+                sender.record_transfer, [{"recipient": receiver.user, "amount": amount}], "Pay"
+            )
+            for sender, amount in zip(senders, [10, 500, 30])
+        ]
+
+        assert futures[0].result(timeout=5).amount_sent == 10
+        assert futures[2].result(timeout=5).amount_sent == 30
+        with pytest.raises(InsufficientFunds):
+            futures[1].result(timeout=5)
+        assert batches == [3]
+        assert DebitTransaction.objects.count() == 2
+        assert iSwiftAccount.objects.get(pk=senders[1].pk).balance == 100
+
+    @pytest.mark.finance
+    @pytest.mark.django_db(transaction=True)
+    def test_batch_closes_after_wait(self, iswift_account_factory):
+        sender: iSwiftAccount = iswift_account_factory()
+        receiver: iSwiftAccount = iswift_account_factory()
+        committer = GroupCommitter(size=100, wait_ms=1)
+        recipients = [{"recipient": receiver.user, "amount": 10}]
+        committer.submit(sender.record_transfer, recipients, "Pay").result(timeout=5)
+        committer.submit(sender.record_transfer, recipients, "Pay").result(timeout=5)
+        assert committer.batches == 2
+
+    @pytest.mark.finance
+    def test_submissions_in_a_transaction_run_inline(self, iswift_account_factory):
+        sender: iSwiftAccount = iswift_account_factory()
+        receiver: iSwiftAccount = iswift_account_factory()
+        committer = GroupCommitter()
+        recipients = [{"recipient": receiver.user, "amount": 10}]
+        # the test runs in a transaction the committer would wait on
+        future = committer.submit(sender.record_transfer, recipients, "Pay")
+        assert future.done()
+        assert future.result().amount_sent == 10
+        assert committer.batches == 0
+
+    @pytest.mark.finance
+    @pytest.mark.django_db(transaction=True)
+    def test_batch_retried_after_conflict(self, monkeypatch, iswift_account_factory):
+        sender: iSwiftAccount = iswift_account_factory()
+        receiver: iSwiftAccount = iswift_account_factory()
+        wrapper_class = type(connections["default"])
+        commit = wrapper_class._commit
+        failed = []
+
+        def fail_first_commit(wrapper):
+            if not failed:
+                failed.append(wrapper)
+                raise OperationalError("database is locked")
+            return commit(wrapper)
+
+        monkeypatch.setattr(wrapper_class, "_commit", fail_first_commit)
+        committer = GroupCommitter(wait_ms=1)
+        recipients = [{"recipient": receiver.user, "amount": 10}]
+        debit = committer.submit(sender.record_transfer, recipients, "Pay").result(timeout=5)
+        assert failed and debit.amount_sent == 10
+        assert DebitTransaction.objects.count() == 1
+
+    @pytest.mark.finance
+    @pytest.mark.django_db(transaction=True)
+    def test_call_runs_directly_when_committer_stalls(
+        self, monkeypatch, iswift_account_factory
+    ):
+        sender: iSwiftAccount = iswift_account_factory()
+        receiver: iSwiftAccount = iswift_account_factory()
+        committer = GroupCommitter(timeout=0.1)
+        monkeypatch.setattr(committer, "_start", lambda: None)
+        recipients = [{"recipient": receiver.user, "amount": 10}]
+        assert committer.call(sender.record_transfer, recipients, "Pay").amount_sent == 10
+        assert committer.batches == 0
+        # the queued copy was cancelled, so the committer would skip it
+        assert committer._queue.get_nowait()[0].cancelled()
+
+    @pytest.mark.finance
+    @pytest.mark.django_db(transaction=True)
+    def test_call_fails_when_batch_stalls(self, monkeypatch, iswift_account_factory):
+        sender: iSwiftAccount = iswift_account_factory()
+        receiver: iSwiftAccount = iswift_account_factory()
+        committer = GroupCommitter(wait_ms=1, timeout=0.1)
+
+        def stall(batch):
+            for future, *_ in batch:
+                future.set_running_or_notify_cancel()
+
+        monkeypatch.setattr(committer, "commit", stall)
+        recipients = [{"recipient": receiver.user, "amount": 10}]
+        with pytest.raises(TransferPending):
+            committer.call(sender.record_transfer, recipients, "Pay")
+        assert DebitTransaction.objects.count() == 0
@@ -1,19 +1,51 @@
+import math
+import os
+import subprocess
+import sys
+import threading
+from datetime import date, datetime
 from decimal import Decimal
 
 import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test.utils import CaptureQueriesContext
 
+from accounts.models import User
+from core.exceptions import (
+    ConversionError,
+    InsufficientFunds,
+    JournalError,
+    SameAccountOperation,
+)
+from core.helpers import make_aware
+from finance.cache import RATES_VERSION_KEY, bump_rates_version, rate_cache
+from finance.checkpoints import update_balance_checkpoints
+from finance.journal import project_balances
 from finance.models import (
+    BULK_BATCH_SIZE,
+    TRANSFER_BACKOFF,
     ConversionRate,
+    ConversionRateSnapshot,
     CreditTransaction,
     Currency,
     DebitTransaction,
+    JournalEntry,
+    Posting,
     iSwiftAccount,
 )
+from finance.reconciliation import reconcile
 from tests.fixtures.finance import CurrencyFixtures
 
 pytestmark = pytest.mark.django_db
 
 
+def get_batch_size(model) -> int:
+    fields = [f for f in model._meta.concrete_fields if not f.primary_key]
+    return min(BULK_BATCH_SIZE, connection.ops.bulk_batch_size(fields, []))
+
+
 class TestCurrency(CurrencyFixtures):
     @pytest.mark.finance_models
     def test_get_conversion_rate(self):
@@ -36,6 +68,157 @@ class TestCurrency(CurrencyFixtures):
         ) == first.convert_currency(second, amount)
 
 
+class TestRateCache(CurrencyFixtures):
+    @pytest.mark.finance_models
+    def test_convert_currency_without_queries(self, django_assert_num_queries):
+        usd = Currency.objects.get(iso_code="usd")
+        eur = Currency.objects.get(iso_code="eur")
+        rate = ConversionRate.objects.get(base_currency=usd, target_currency=eur)
+        rate_cache.get_rates(usd.pk)
+        hits = rate_cache.hits
+
+        with django_assert_num_queries(0):
+            assert usd.convert_currency(eur, 100) == (rate.conversion_rate * 100).__round__(2)
+            assert eur.convert_currency(usd, 100) == (rate.reverse_rate * 100).__round__(2)
+
+        assert rate_cache.hits == hits + 2
+
+    @pytest.mark.finance_models
+    def test_bump_rates_version_reloads_matrix(self, django_assert_num_queries):
+        usd = Currency.objects.get(iso_code="usd")
+        eur = Currency.objects.get(iso_code="eur")
+        old_rate = rate_cache.get_rate(usd.pk, eur.pk)
+        ConversionRate.objects.filter(base_currency=usd, target_currency=eur).update(
+            conversion_rate=Decimal("2"), reverse_rate=Decimal("0.5")
+        )
+        assert rate_cache.get_rate(usd.pk, eur.pk) == old_rate
+
+        reloads, misses = rate_cache.reloads, rate_cache.misses
+        bump_rates_version()
+        with django_assert_num_queries(1):
+            assert rate_cache.get_rate(usd.pk, eur.pk) == Decimal("2")
+            assert rate_cache.get_rate(eur.pk, usd.pk) == Decimal("0.5")
+
+        assert rate_cache.reloads == reloads + 1
+        assert rate_cache.misses == misses + 1
+
+    @pytest.mark.finance_models
+    def test_version_read_once_per_check_interval(self, monkeypatch, settings):
+        settings.RATES_VERSION_CHECK_SECONDS = 60
+        usd = Currency.objects.get(iso_code="usd")
+        eur = Currency.objects.get(iso_code="eur")
+        rate_cache.get_rate(usd.pk, eur.pk)
+        reads = []
+        monkeypatch.setattr("finance.cache.get_rates_version", lambda: reads.append(1))
+
+        for _ in range(10):
+            rate_cache.get_rate(usd.pk, eur.pk)
+        assert reads == []
+
+        # the interval has passed
+        settings.RATES_VERSION_CHECK_SECONDS = 0
+        rate_cache.get_rate(usd.pk, eur.pk)
+        assert reads == [1]
+
+    @pytest.mark.finance_models
+    def test_bump_after_version_expired_reloads_matrix(self):
+        usd = Currency.objects.get(iso_code="usd")
+        eur = Currency.objects.get(iso_code="eur")
+        bump_rates_version()
+        rate_cache.get_rate(usd.pk, eur.pk)
+        ConversionRate.objects.filter(base_currency=usd, target_currency=eur).update(
+            conversion_rate=Decimal("2"), reverse_rate=Decimal("0.5")
+        )
+
+        # As when the version key expires or is culled before the next bump
+        cache.delete(RATES_VERSION_KEY)
+        reloads = rate_cache.reloads
+        bump_rates_version()
+        assert rate_cache.get_rate(usd.pk, eur.pk) == Decimal("2")
+        assert rate_cache.reloads == reloads + 1
+
+    @pytest.mark.finance_models
+    def test_bump_from_another_process_reloads_matrix(self, settings):
+        settings.RATES_VERSION_CHECK_SECONDS = 0
+        usd = Currency.objects.get(iso_code="usd")
+        eur = Currency.objects.get(iso_code="eur")
+        rate_cache.get_rate(usd.pk, eur.pk)
+        ConversionRate.objects.filter(base_currency=usd, target_currency=eur).update(
+            conversion_rate=Decimal("2"), reverse_rate=Decimal("0.5")
+        )
+
+        # As the update_rates command would from its own process
+        cache = settings.CACHES["default"]
+        subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import django; django.setup();"
+                "from finance.cache import bump_rates_version; bump_rates_version()",
+            ],
+            env={**os.environ, "CACHE_URL": f"filecache://{cache['LOCATION']}"},
+            check=True,
+        )
+
+        assert rate_cache.get_rate(usd.pk, eur.pk) == Decimal("2")
+
+    @pytest.mark.finance_models
+    def test_saving_rate_invalidates_matrix(self, django_capture_on_commit_callbacks):
+        usd = Currency.objects.get(iso_code="usd")
+        eur = Currency.objects.get(iso_code="eur")
+        rate = ConversionRate.objects.get(base_currency=usd, target_currency=eur)
+        rate_cache.get_rates(usd.pk)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            rate.conversion_rate = Decimal("2")
+            rate.save()
+
+        assert rate_cache.get_rate(usd.pk, eur.pk) == Decimal("2")
+
+
+class TestRateSnapshots(CurrencyFixtures):
+    def create_snapshot(self, base, target, rate, effective_at):
+        return ConversionRateSnapshot.objects.create(
+            base_currency=base,
+            target_currency=target,
+            conversion_rate=rate,
+            reverse_rate=1 / rate,
+            effective_at=make_aware(effective_at),
+        )
+
+    @pytest.mark.finance_models
+    def test_snapshots_are_append_only(self):
+        usd = Currency.objects.get(iso_code="usd")
+        eur = Currency.objects.get(iso_code="eur")
+        snapshot = self.create_snapshot(usd, eur, Decimal("2"), datetime(2024, 1, 1))
+        snapshot.conversion_rate = Decimal("3")
+        with pytest.raises(ConversionError):
+            snapshot.save()
+        with pytest.raises(ConversionError):
+            snapshot.delete()
+        assert ConversionRateSnapshot.objects.get(pk=snapshot.pk).conversion_rate == 2
+
+    @pytest.mark.finance_models
+    def test_rate_as_of_takes_newest_direction(self, django_assert_num_queries):
+        usd = Currency.objects.get(iso_code="usd")
+        eur = Currency.objects.get(iso_code="eur")
+        self.create_snapshot(usd, eur, Decimal("2"), datetime(2024, 1, 1))
+        newer = self.create_snapshot(eur, usd, Decimal("0.25"), datetime(2024, 1, 2))
+
+        with django_assert_num_queries(2) as queries:
+            assert usd.get_conversion_rate_as_of(eur) == (newer.reverse_rate, newer)
+        assert eur.get_conversion_rate_as_of(usd) == (newer.conversion_rate, newer)
+
+        # each direction seeks the pair's index, without sorting its history
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                cursor.execute(f"EXPLAIN QUERY PLAN {query['sql']}")
+                plan = "\n".join(row[-1] for row in cursor.fetchall())
+                assert "rate_snapshot_pair_time_idx" in plan, plan
+                assert "TEMP B-TREE" not in plan, plan
+        assert usd.get_conversion_rate_as_of(eur, make_aware(datetime(2024, 1, 1, 12)))[0] == 2
+
+
 class TestiSwiftAccount(CurrencyFixtures):
     @pytest.mark.finance_models
     def test_bulk_record_transfer(self, iswift_account_factory):
@@ -78,21 +261,238 @@ class TestiSwiftAccount(CurrencyFixtures):
         )
 
     @pytest.mark.finance_models
-    def test_record_credit(self, iswift_account_factory, debit_transaction_factory):
-        account: iSwiftAccount = iswift_account_factory()
-        original_balance = account.balance
-        debit: DebitTransaction = debit_transaction_factory()
-        credit = account.record_credit(debit, debit.amount_sent)
-        amount_received = debit.iswift_account.currency.convert_currency(
-            account.currency, debit.amount_sent
+    @pytest.mark.parametrize("count", [1, 100, 10_000])
+    def test_record_transfer_query_count(
+        self, count, user_factory, iswift_account_factory, django_assert_num_queries
+    ):
+        sender: iSwiftAccount = iswift_account_factory(balance=Decimal("9999999.00"))
+        users = User.objects.bulk_create(
+            [
+                user_factory.build(email=f"user{i}@test.com", phone_number=10**10 + i)
+                for i in range(count)
+            ]
         )
-        assert isinstance(credit, CreditTransaction)
-        assert (
-            iSwiftAccount.objects.filter(pk=account.pk).first().balance
-            == (original_balance + amount_received)
-            == account.balance
+        receivers = iSwiftAccount.objects.bulk_create(
+            [iswift_account_factory.build(user=user) for user in users]
         )
-        assert amount_received == credit.amount_received
+        recipients = [{"recipient": user, "amount": 100} for user in users]
+
+        rate_cache.get_rates(sender.currency_id)
+        postings = count + 1
+        # savepoint, release, accounts, locks, debit, entry, a savepoint pair
+        # around the postings, balances update, then the batches of credits,
+        # of posting sequences read and of postings
+        with django_assert_num_queries(
+            9
+            + math.ceil(count / get_batch_size(CreditTransaction))
+            + math.ceil(postings / BULK_BATCH_SIZE)
+            + math.ceil(postings / get_batch_size(Posting))
+        ):
+            debit = sender.record_transfer(recipients, "Bulk Transfer")
+
+        assert debit.credit_transactions.count() == count
+        assert debit.recipient == (users[0] if count == 1 else None)
+        for r in receivers[:3] + receivers[-3:]:
+            account = iSwiftAccount.objects.get(pk=r.pk)
+            expected_balance = r.balance + sender.currency.convert_currency(r.currency, 100)
+            assert account.balance == expected_balance
+
+        sender_balance = iSwiftAccount.objects.get(pk=sender.pk).balance
+        assert sender_balance == Decimal("9999999.00") - 100 * count
+
+    @pytest.mark.finance_models
+    def test_record_transfer_reuses_resolved_accounts(
+        self, iswift_account_factory, django_assert_num_queries
+    ):
+        sender: iSwiftAccount = iswift_account_factory()
+        receivers: list[iSwiftAccount] = [iswift_account_factory() for _ in range(3)]
+        recipients = [
+            {"recipient": i.user, "amount": 100, "iswift_account": i} for i in receivers
+        ]
+        rate_cache.get_rates(sender.currency_id)
+        # savepoint, release, locks, debit, credits, entry, sequences, a savepoint
+        # pair around the postings, balances update
+        with django_assert_num_queries(11):
+            debit = sender.record_transfer(recipients, "Bulk Transfer")
+
+        assert debit.credit_transactions.count() == len(receivers)
+
+    @pytest.mark.finance_models
+    def test_record_transfers_in_one_batch(
+        self, iswift_account_factory, django_assert_num_queries
+    ):
+        first: iSwiftAccount = iswift_account_factory(balance=Decimal("100.00"))
+        second: iSwiftAccount = iswift_account_factory(balance=0, currency=first.currency)
+        third: iSwiftAccount = iswift_account_factory(currency=first.currency)
+        rate_cache.get_rates(first.currency_id)
+        transfers = [
+            (first, [{"recipient": second.user, "amount": 80}], "First"),
+            # spends the credit the first transfer made
+            (second, [{"recipient": third.user, "amount": 50}], "Second"),
+            (first, [{"recipient": third.user, "amount": 50}], "Overdraft"),
+            (first, [{"recipient": first.user, "amount": 10}], "To itself"),
+        ]
+        # savepoint, release, accounts, locks, debits, credits, entries,
+        # sequences, a savepoint pair around the postings, balances update
+        with django_assert_num_queries(12):
+            outcomes = iSwiftAccount.record_transfers(transfers)
+
+        debits, errors = zip(*outcomes)
+        assert [debit.description for debit in debits[:2]] == ["First", "Second"]
+        assert debits[2:] == (None, None)
+        assert errors[:2] == (None, None)
+        assert isinstance(errors[2], InsufficientFunds)
+        assert isinstance(errors[3], SameAccountOperation)
+        assert first.balance == iSwiftAccount.objects.get(pk=first.pk).balance == 20
+        assert second.balance == iSwiftAccount.objects.get(pk=second.pk).balance == 30
+        assert iSwiftAccount.objects.get(pk=third.pk).balance == third.balance + 50
+        assert [posting.sequence for posting in first.postings.all()] == [1]
+        assert DebitTransaction.objects.count() == 2
+
+    @pytest.mark.finance_models
+    def test_record_transfer_checks_locked_balance(self, iswift_account_factory):
+        sender: iSwiftAccount = iswift_account_factory(balance=Decimal("100.00"))
+        receiver: iSwiftAccount = iswift_account_factory(currency=sender.currency)
+        # a second copy of the sender, read before the first transfer
+        stale = iSwiftAccount.objects.get(pk=sender.pk)
+        sender.record_transfer([{"recipient": receiver.user, "amount": 80}], "Transfer")
+        with pytest.raises(InsufficientFunds):
+            stale.record_transfer([{"recipient": receiver.user, "amount": 80}], "Transfer")
+        assert iSwiftAccount.objects.get(pk=sender.pk).balance == 20
+
+    @pytest.mark.finance_models
+    def test_record_transfer_locks_accounts_in_order(self, iswift_account_factory, monkeypatch):
+        receivers: list[iSwiftAccount] = [iswift_account_factory() for _ in range(3)]
+        sender: iSwiftAccount = iswift_account_factory()
+        receivers[1].set_balance_shards(2)
+        lock_accounts = iSwiftAccount.lock_accounts
+        locked = []
+
+        def record_lock(pks):
+            accounts = lock_accounts(pks)
+            locked.append(list(accounts))
+            return accounts
+
+        monkeypatch.setattr(iSwiftAccount, "lock_accounts", staticmethod(record_lock))
+        sender.record_transfer([{"recipient": r.user, "amount": 10} for r in receivers], "Pay")
+        # the sharded recipient's row is not written, so it is not locked
+        assert locked == [[receivers[0].pk, receivers[2].pk, sender.pk]]
+
+    @pytest.mark.finance_models
+    def test_record_transfer_retries_on_conflict(self, iswift_account_factory, monkeypatch):
+        sender: iSwiftAccount = iswift_account_factory()
+        receiver: iSwiftAccount = iswift_account_factory()
+        lock_accounts = iSwiftAccount.lock_accounts
+        waits = []
+
+        def deadlock_twice(pks):
+            if len(waits) < 2:
+                raise OperationalError("deadlock detected")
+            return lock_accounts(pks)
+
+        monkeypatch.setattr(iSwiftAccount, "lock_accounts", staticmethod(deadlock_twice))
+        monkeypatch.setattr("finance.models.time.sleep", waits.append)
+        sender.record_transfer([{"recipient": receiver.user, "amount": 10}], "Transfer")
+        assert len(waits) == 2
+        assert waits[0] <= TRANSFER_BACKOFF and waits[1] <= TRANSFER_BACKOFF * 2
+        assert DebitTransaction.objects.filter(iswift_account=sender).count() == 1
+
+        waits.clear()
+        monkeypatch.setattr("finance.models.TRANSFER_ATTEMPTS", 2)
+        with pytest.raises(OperationalError):
+            sender.record_transfer([{"recipient": receiver.user, "amount": 10}], "Transfer")
+        assert DebitTransaction.objects.filter(iswift_account=sender).count() == 1
+
+    @pytest.mark.finance_models
+    @pytest.mark.parametrize(
+        "message", ["no such table: finance_iswiftaccount", "server closed the connection"]
+    )
+    def test_record_transfer_raises_other_errors_at_once(
+        self, iswift_account_factory, monkeypatch, message
+    ):
+        sender: iSwiftAccount = iswift_account_factory()
+        receiver: iSwiftAccount = iswift_account_factory()
+        waits = []
+
+        def fail(pks):
+            raise OperationalError(message)
+
+        monkeypatch.setattr(iSwiftAccount, "lock_accounts", staticmethod(fail))
+        monkeypatch.setattr("finance.models.time.sleep", waits.append)
+        with pytest.raises(OperationalError, match=message):
+            sender.record_transfer([{"recipient": receiver.user, "amount": 10}], "Transfer")
+        assert waits == []
+
+    @pytest.mark.finance_models
+    def test_credits_reference_rate_snapshot(
+        self, iswift_account_factory, django_capture_on_commit_callbacks
+    ):
+        usd = Currency.objects.get(iso_code="usd")
+        eur = Currency.objects.get(iso_code="eur")
+        rate = ConversionRate.objects.get(base_currency=usd, target_currency=eur)
+        with django_capture_on_commit_callbacks(execute=True):
+            rate.snapshot = ConversionRateSnapshot.objects.create(
+                base_currency=usd,
+                target_currency=eur,
+                conversion_rate=rate.conversion_rate,
+                reverse_rate=rate.reverse_rate,
+            )
+            rate.save()
+
+        sender: iSwiftAccount = iswift_account_factory(currency=usd)
+        receiver: iSwiftAccount = iswift_account_factory(currency=eur)
+        debit = sender.record_transfer([{"recipient": receiver.user, "amount": 100}], "Transfer")
+        assert debit.credit_transactions.get().conversion_rate_snapshot == rate.snapshot
+
+        refund = receiver.record_transfer([{"recipient": sender.user, "amount": 10}], "Refund")
+        assert refund.credit_transactions.get().conversion_rate_snapshot == rate.snapshot
+
+    @pytest.mark.finance_models
+    def test_credits_take_rate_and_snapshot_from_one_matrix(
+        self, monkeypatch, settings, iswift_account_factory
+    ):
+        settings.RATES_VERSION_CHECK_SECONDS = 0
+        usd = Currency.objects.get(iso_code="usd")
+        eur = Currency.objects.get(iso_code="eur")
+        sender: iSwiftAccount = iswift_account_factory(currency=usd)
+        receiver: iSwiftAccount = iswift_account_factory(currency=eur)
+
+        def update_rate():
+            rate = ConversionRate.objects.get(base_currency=usd, target_currency=eur)
+            rate.snapshot = ConversionRateSnapshot.objects.create(
+                base_currency=usd,
+                target_currency=eur,
+                conversion_rate=rate.conversion_rate * 2,
+                reverse_rate=rate.reverse_rate / 2,
+            )
+            ConversionRate.objects.filter(pk=rate.pk).update(
+                conversion_rate=rate.snapshot.conversion_rate,
+                reverse_rate=rate.snapshot.reverse_rate,
+                snapshot=rate.snapshot,
+            )
+
+        update_rate()
+        load = rate_cache._load
+
+        def load_then_update():
+            matrix = load()
+            update_rate()
+            return matrix
+
+        # Every matrix read sees a new version, and the rates change after each load
+        versions = iter(range(100))
+        monkeypatch.setattr("finance.cache.get_rates_version", lambda: next(versions))
+        monkeypatch.setattr(rate_cache, "_load", load_then_update)
+
+        debit = sender.record_transfer([{"recipient": receiver.user, "amount": 100}], "Transfer")
+        credit = debit.credit_transactions.get()
+        snapshot = credit.conversion_rate_snapshot
+        assert credit.amount_received == Currency.apply_rate(snapshot.conversion_rate, 100)
+
+        refund = receiver.record_transfer([{"recipient": sender.user, "amount": 10}], "Refund")
+        credit = refund.credit_transactions.get()
+        snapshot = credit.conversion_rate_snapshot
+        assert credit.amount_received == Currency.apply_rate(snapshot.reverse_rate, 10)
 
     @pytest.mark.finance_models
     def test_set_default(self, iswift_account_factory):
@@ -103,3 +503,275 @@ class TestiSwiftAccount(CurrencyFixtures):
         accs = iSwiftAccount.objects.filter(user=acc.user).exclude(pk=acc.pk)
         for i in accs:
             assert not i.is_default
+
+
+class TestJournal(CurrencyFixtures):
+    @pytest.fixture
+    def transfer(self, iswift_account_factory):
+        sender: iSwiftAccount = iswift_account_factory()
+        receivers = [iswift_account_factory() for _ in range(3)]
+        recipients = [{"recipient": r.user, "amount": Decimal("10.50")} for r in receivers]
+        debit = sender.record_transfer(recipients, "Bulk Transfer")
+        return sender, receivers, debit
+
+    @pytest.mark.finance_models
+    def test_transfer_posts_balanced_entry(self, transfer):
+        sender, receivers, debit = transfer
+        [entry] = debit.journal_entries.all()
+        postings = {p.iswift_account_id: p for p in entry.postings.all()}
+        assert len(postings) == 4
+        assert sum(p.entry_amount for p in postings.values()) == 0
+        assert postings[sender.pk].amount == Decimal("-31.50")
+        for receiver in receivers:
+            credit = debit.credit_transactions.get(iswift_account=receiver)
+            assert postings[receiver.pk].amount == credit.amount_received
+            assert postings[receiver.pk].sequence == 1
+
+        sender.record_transfer([{"recipient": receivers[0].user, "amount": 1}], "Transfer")
+        sequences = sender.postings.order_by("sequence").values_list("sequence", flat=True)
+        assert list(sequences) == [1, 2]
+        assert iSwiftAccount.objects.get(pk=sender.pk).projected_sequence == 2
+
+    @pytest.mark.finance_models
+    def test_journal_is_append_only(self, transfer):
+        sender, _, debit = transfer
+        entry = debit.journal_entries.get()
+        posting = entry.postings.first()
+        posting.amount = 0
+        with pytest.raises(JournalError):
+            posting.save()
+        with pytest.raises(JournalError):
+            posting.delete()
+        with pytest.raises(JournalError):
+            entry.save()
+
+        unbalanced = JournalEntry.objects.create(
+            description="Unbalanced", currency=sender.currency
+        )
+        with pytest.raises(JournalError):
+            unbalanced.post([Posting(iswift_account=sender, amount=1, entry_amount=1)])
+        assert not unbalanced.postings.exists()
+
+    @pytest.mark.finance_models
+    def test_post_renumbers_on_conflict(self, transfer, monkeypatch):
+        sender, receivers, _ = transfer
+        get_last_sequences = Posting.get_last_sequences
+        calls = []
+
+        def stale_sequences(account_ids):
+            calls.append(account_ids)
+            # the first read misses the postings of the first transfer
+            return {} if len(calls) == 1 else get_last_sequences(account_ids)
+
+        monkeypatch.setattr(Posting, "get_last_sequences", staticmethod(stale_sequences))
+        sender.record_transfer([{"recipient": receivers[0].user, "amount": 1}], "Transfer")
+        assert len(calls) == 2
+        assert sender.postings.filter(sequence=2).exists()
+
+    @pytest.mark.finance_models
+    def test_deferred_credits_are_projected_in_batches(self, settings, iswift_account_factory):
+        settings.JOURNAL_DEFERRED_CREDITS = True
+        sender: iSwiftAccount = iswift_account_factory(balance=Decimal("1000.00"))
+        receiver: iSwiftAccount = iswift_account_factory(currency=sender.currency)
+        for _ in range(3):
+            sender.record_transfer([{"recipient": receiver.user, "amount": 100}], "Transfer")
+
+        assert sender.balance == Decimal("700.00")
+        stale = iSwiftAccount.objects.get(pk=receiver.pk)
+        assert stale.balance == receiver.balance
+        assert stale.projected_sequence == 0
+
+        # the credits to the receiver are folded in as a debit from it is recorded
+        receiver.refresh_from_db()
+        receiver.record_transfer([{"recipient": sender.user, "amount": 50}], "Transfer")
+        assert receiver.balance == stale.balance + 250
+        assert receiver.projected_sequence == 4
+
+        assert project_balances() == 1
+        sender.refresh_from_db()
+        assert sender.balance == Decimal("750.00")
+        assert sender.projected_sequence == 4
+        assert project_balances() == 0
+
+
+class TestBalanceCheckpoints(CurrencyFixtures):
+    def move(self, factory, account, created):
+        transaction = factory(iswift_account=account)
+        type(transaction).objects.filter(pk=transaction.pk).update(created=created)
+        transaction.refresh_from_db()
+        if isinstance(transaction, CreditTransaction):
+            return transaction.amount_received
+        return -transaction.amount_sent
+
+    def sum_history(self, account, until=None):
+        """Sums the whole history of `account`, which checkpoints spare reads from"""
+        return sum(
+            row["amount"] if row["object"] == "credit-transaction" else -row["amount"]
+            for row in account.get_transactions(end=until)
+        )
+
+    @pytest.fixture
+    def account_with_history(
+        self, iswift_account_factory, credit_transaction_factory, debit_transaction_factory
+    ):
+        account = iswift_account_factory()
+        for day in [1, 1, 2, 4]:
+            for hour in [9, 15]:
+                created = make_aware(datetime(2024, 1, day, hour))
+                self.move(credit_transaction_factory, account, created)
+            created = make_aware(datetime(2024, 1, day, 12))
+            self.move(debit_transaction_factory, account, created)
+        return account
+
+    @pytest.mark.finance_models
+    def test_checkpoints_close_every_day_with_activity(self, account_with_history):
+        account = account_with_history
+        assert update_balance_checkpoints(until=date(2024, 1, 4)) == 3
+        checkpoints = list(account.balance_checkpoints.order_by("date"))
+        assert [c.date for c in checkpoints] == [date(2024, 1, day) for day in [1, 2, 4]]
+        for checkpoint in checkpoints:
+            assert checkpoint.balance == self.sum_history(account, checkpoint.closed_at)
+
+    @pytest.mark.finance_models
+    def test_checkpoints_only_read_new_days(
+        self, account_with_history, credit_transaction_factory, django_assert_num_queries
+    ):
+        account = account_with_history
+        assert update_balance_checkpoints(until=date(2024, 1, 2)) == 2
+        assert update_balance_checkpoints(until=date(2024, 1, 2)) == 0
+
+        created = make_aware(datetime(2024, 1, 5, 8))
+        amount = self.move(credit_transaction_factory, account, created)
+        # the last checkpointed day, then a savepoint pair and two totals per
+        # day, and the opening balances and an insert on days with activity
+        with django_assert_num_queries(1 + 3 * (2 + 2) + 2 * (1 + 1)):
+            assert update_balance_checkpoints(until=date(2024, 1, 5)) == 2
+
+        previous = account.balance_checkpoints.get(date=date(2024, 1, 4))
+        last = account.balance_checkpoints.get(date=date(2024, 1, 5))
+        assert last.balance == previous.balance + amount == self.sum_history(account)
+
+    @pytest.mark.finance_models
+    def test_get_balance_as_of(self, account_with_history, django_assert_num_queries):
+        account = account_with_history
+        moments = [
+            make_aware(datetime(2023, 12, 31)),
+            make_aware(datetime(2024, 1, 1, 10)),
+            make_aware(datetime(2024, 1, 3)),
+            make_aware(datetime(2024, 1, 4, 13)),
+            make_aware(datetime(2024, 2, 1)),
+        ]
+        expected = [self.sum_history(account, at) for at in moments]
+        assert [account.get_balance_as_of(at) for at in moments] == expected
+
+        update_balance_checkpoints(until=date(2024, 1, 4))
+        for at, balance in zip(moments, expected):
+            # the nearest checkpoint, then the credits and debits since it
+            with django_assert_num_queries(3):
+                assert account.get_balance_as_of(at) == balance
+
+
+class TestBalanceShards(CurrencyFixtures):
+    @pytest.fixture
+    def hot_account(self, iswift_account_factory):
+        account: iSwiftAccount = iswift_account_factory(balance=Decimal("0.00"))
+        return account.set_balance_shards(4)
+
+    def credit(self, iswift_account_factory, account, times=1):
+        for _ in range(times):
+            sender: iSwiftAccount = iswift_account_factory(currency=account.currency)
+            sender.record_transfer([{"recipient": account.user, "amount": 10}], "Payment")
+
+    @pytest.mark.finance_models
+    def test_credits_land_on_shards(self, hot_account, iswift_account_factory):
+        assert hot_account.shards.count() == 4
+        sender: iSwiftAccount = iswift_account_factory(currency=hot_account.currency)
+        with CaptureQueriesContext(connection) as context:
+            sender.record_transfer([{"recipient": hot_account.user, "amount": 10}], "Payment")
+
+        # only the sender's row is updated, the credit goes to a shard
+        updates = [q["sql"] for q in context if q["sql"].startswith("UPDATE")]
+        assert len([sql for sql in updates if '"finance_iswiftaccount"' in sql]) == 1
+        assert len([sql for sql in updates if '"finance_balanceshard"' in sql]) == 1
+
+        self.credit(iswift_account_factory, hot_account, times=19)
+        account = iSwiftAccount.objects.get(pk=hot_account.pk)
+        assert account.balance == 0
+        assert account.projected_sequence == 0
+        assert account.get_balance() == 200
+        shards = list(account.shards.values_list("balance", flat=True))
+        assert sum(shards) == 200
+        assert len([balance for balance in shards if balance]) > 1
+        assert set(account.postings.values_list("shard", flat=True)) <= {1, 2, 3, 4}
+
+        run = reconcile(workers=1)
+        assert account.pk not in run.drifts.values_list("iswift_account", flat=True)
+
+    @pytest.mark.finance_models
+    @pytest.mark.django_db(transaction=True)
+    def test_concurrent_credits_to_shards(self, iswift_account_factory):
+        hot: iSwiftAccount = iswift_account_factory(balance=Decimal("0.00"))
+        hot.set_balance_shards(4)
+        senders = [iswift_account_factory(currency=hot.currency) for _ in range(8)]
+        errors = []
+
+        def pay(sender: iSwiftAccount):
+            try:
+                for _ in range(10):
+                    sender.record_transfer([{"recipient": hot.user, "amount": 1}], "Payment")
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=pay, args=(sender,)) for sender in senders]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert not errors
+        account = iSwiftAccount.objects.get(pk=hot.pk)
+        # no credit was lost, and none of them touched the account's own row
+        assert (account.balance, account.get_balance()) == (0, 80)
+        assert len(set(account.postings.values_list("shard", flat=True))) > 1
+        run = reconcile(workers=1)
+        assert account.pk not in run.drifts.values_list("iswift_account", flat=True)
+        assert account.compact_shards() == 80
+
+    @pytest.mark.finance_models
+    def test_compact_shards(self, hot_account, iswift_account_factory):
+        self.credit(iswift_account_factory, hot_account, times=5)
+        assert hot_account.compact_shards() == 50
+        assert hot_account.get_balance() == 50
+        assert hot_account.balance == 50
+        assert not hot_account.shards.exclude(balance=0).exists()
+        # the folded postings are never projected again
+        assert project_balances() == 0
+        assert iSwiftAccount.objects.get(pk=hot_account.pk).get_balance() == 50
+
+        call_command("compact_balance_shards")
+        hot_account.set_balance_shards(0)
+        assert not hot_account.shards.exists()
+        self.credit(iswift_account_factory, hot_account)
+        assert iSwiftAccount.objects.get(pk=hot_account.pk).balance == 60
+
+    @pytest.mark.finance_models
+    def test_sharded_sender_spends_held_credits(self, hot_account, iswift_account_factory):
+        self.credit(iswift_account_factory, hot_account, times=3)
+        receiver: iSwiftAccount = iswift_account_factory(currency=hot_account.currency)
+        hot_account.record_transfer([{"recipient": receiver.user, "amount": 25}], "Refund")
+        account = iSwiftAccount.objects.get(pk=hot_account.pk)
+        # the held credits were folded in first, so the own balance stays covered
+        assert account.balance == account.get_balance() == 5
+        assert not account.shards.exclude(balance=0).exists()
+        run = reconcile(workers=1)
+        assert account.pk not in run.drifts.values_list("iswift_account", flat=True)
+
+        # a transfer the own balance covers leaves new credits on the shards
+        self.credit(iswift_account_factory, hot_account)
+        hot_account.record_transfer([{"recipient": receiver.user, "amount": 5}], "Refund")
+        account = iSwiftAccount.objects.get(pk=hot_account.pk)
+        assert (account.balance, account.get_balance()) == (0, 10)
+        with pytest.raises(InsufficientFunds):
+            hot_account.record_transfer([{"recipient": receiver.user, "amount": 11}], "Refund")
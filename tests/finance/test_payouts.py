@@ -0,0 +1,102 @@
+from decimal import Decimal
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+
+from finance import payouts
+from finance.models import CreditTransaction, DebitTransaction, PayoutJob, iSwiftAccount
+from finance.payouts import create_payout_job, pay_chunk, run_payout_job
+from tests.fixtures.finance import CurrencyFixtures
+
+pytestmark = pytest.mark.django_db
+
+
+class TestPayouts(CurrencyFixtures):
+    @pytest.fixture
+    def job(self, settings, iswift_account_factory, django_capture_on_commit_callbacks):
+        settings.PAYOUT_CHUNK_SIZE = 2
+        sender: iSwiftAccount = iswift_account_factory(balance=Decimal("100.00"))
+        recipients = [iswift_account_factory(currency=sender.currency) for _ in range(5)]
+        rows = [(recipient.user.uid, Decimal(30)) for recipient in recipients]
+        with django_capture_on_commit_callbacks() as callbacks:
+            job = create_payout_job(sender, "Salaries", rows)
+        # the job is handed to the workers once the upload commits
+        assert len(callbacks) == 1
+        return job
+
+    @pytest.mark.finance
+    def test_pay_in_chunks(self, job: PayoutJob):
+        while pay_chunk(job.pk):
+            pass
+
+        job.refresh_from_db()
+        assert job.is_finished
+        assert (job.processed, job.failed, job.remaining) == (5, 2, 0)
+        # one bulk transfer per chunk that could be paid
+        assert DebitTransaction.objects.filter(iswift_account=job.iswift_account).count() == 2
+        errors = list(job.items.order_by("index").values_list("error", flat=True))
+        assert errors == ["", "", "Insufficient funds", "Insufficient funds", ""]
+        assert not job.items.filter(error="", debit_transaction=None).exists()
+        assert iSwiftAccount.objects.get(pk=job.iswift_account_id).balance == 10
+        assert not pay_chunk(job.pk)
+
+    @pytest.mark.finance
+    def test_unexpected_error_fails_job(self, monkeypatch, job: PayoutJob):
+        assert pay_chunk(job.pk)
+
+        def fail(*args):
+            raise RuntimeError("Ledger unavailable")
+
+        monkeypatch.setattr(iSwiftAccount, "record_transfer", fail)
+        run_payout_job(job.pk)
+
+        job.refresh_from_db()
+        assert job.is_finished
+        assert job.error == "Ledger unavailable"
+        # the chunk that failed was rolled back
+        assert (job.watermark, job.processed) == (2, 2)
+        assert job.pk not in payouts.get_unfinished_jobs()
+
+    @pytest.mark.finance
+    def test_resume_from_watermark(self, job: PayoutJob):
+        # a worker committed the first chunk and stopped
+        assert pay_chunk(job.pk)
+        job.refresh_from_db()
+        assert (job.watermark, job.processed, job.remaining) == (2, 2, 3)
+
+        out = StringIO()
+        call_command("run_payout_jobs", stdout=out)
+        assert "Paid 1 unfinished payout jobs" in out.getvalue()
+        job.refresh_from_db()
+        assert job.is_finished
+        assert job.processed == 5
+        # every item was paid or failed once
+        debits = job.items.values("debit_transaction")
+        credits = CreditTransaction.objects.filter(debit_transaction__in=debits)
+        assert credits.count() == 3
+
+    @pytest.mark.finance
+    @pytest.mark.django_db(transaction=True)
+    def test_resume_when_pool_starts(self, monkeypatch, settings, iswift_account_factory):
+        settings.PAYOUT_CHUNK_SIZE = 2
+        sender: iSwiftAccount = iswift_account_factory(balance=Decimal("100.00"))
+        recipients = [iswift_account_factory(currency=sender.currency) for _ in range(3)]
+        rows = [(recipient.user.uid, Decimal(10)) for recipient in recipients]
+        with monkeypatch.context() as m:
+            m.setattr(payouts, "start_payout_job", lambda job_pk: None)
+            stopped = create_payout_job(sender, "Salaries", rows)
+        # the process paying it stopped after the first chunk
+        assert pay_chunk(stopped.pk)
+
+        # as in a restarted process, whose pool starts with its first job
+        monkeypatch.setattr(payouts, "_pool", None)
+        monkeypatch.setattr(payouts, "_resumed", {})
+        job = create_payout_job(sender, "Bonuses", rows)
+        payouts._pool.shutdown(wait=True)
+
+        for job in [stopped, job]:
+            job.refresh_from_db()
+            assert job.is_finished
+            assert job.processed == 3
+        assert DebitTransaction.objects.filter(iswift_account=sender).count() == 4
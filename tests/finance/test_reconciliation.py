@@ -0,0 +1,98 @@
+import math
+from datetime import date, datetime
+from decimal import Decimal
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db.models import F
+
+from core.helpers import make_aware
+from finance.checkpoints import update_balance_checkpoints
+from finance.models import BalanceCheckpoint, ReconciliationRun, iSwiftAccount
+from finance.reconciliation import reconcile
+from tests.fixtures.finance import CurrencyFixtures
+
+pytestmark = pytest.mark.django_db
+
+
+class TestReconciliation(CurrencyFixtures):
+    @pytest.fixture
+    def accounts(
+        self, iswift_account_factory, credit_transaction_factory, debit_transaction_factory
+    ):
+        """Accounts with a credit and a debit each, whose balances
+        match their transactions like every other account's"""
+        accounts = []
+        for day in range(1, 6):
+            account = iswift_account_factory()
+            for factory in [credit_transaction_factory, debit_transaction_factory]:
+                transaction = factory(iswift_account=account)
+                type(transaction).objects.filter(pk=transaction.pk).update(
+                    created=make_aware(datetime(2024, 1, day, 12))
+                )
+            accounts.append(account)
+
+        for account in iSwiftAccount.objects.all():
+            account.balance = account.get_balance_as_of()
+            account.save()
+        return accounts
+
+    def drift(self, account, amount):
+        iSwiftAccount.objects.filter(pk=account.pk).update(balance=F("balance") + amount)
+
+    @pytest.mark.finance
+    def test_reconcile_reports_drift(self, accounts, django_assert_num_queries):
+        self.drift(accounts[3], Decimal("0.01"))
+        chunks = math.ceil(iSwiftAccount.objects.count() / 2)
+        # looking up and starting a run, then per chunk its bounds and totals and
+        # a savepoint pair around the watermark update, the drifts recorded by
+        # one chunk, and the bounds that find no more accounts and the finished run
+        with django_assert_num_queries(2 + chunks * (1 + 1 + 3) + 1 + 1 + 1):
+            run = reconcile(chunk_size=2, workers=1)
+
+        assert run.is_finished
+        assert run.accounts_checked == iSwiftAccount.objects.count()
+        assert run.watermark == iSwiftAccount.objects.order_by("pk").last().pk
+        [drift] = run.drifts.all()
+        assert drift.iswift_account == accounts[3]
+        assert drift.difference == Decimal("0.01")
+
+    @pytest.mark.finance
+    def test_reconcile_reads_from_checkpoints(self, accounts):
+        update_balance_checkpoints(until=date(2024, 1, 3))
+        assert BalanceCheckpoint.objects.count() == 3
+        self.drift(accounts[0], Decimal("-5"))
+        run = reconcile(chunk_size=2, workers=1)
+        assert [drift.iswift_account for drift in run.drifts.all()] == [accounts[0]]
+
+    @pytest.mark.finance
+    def test_reconcile_resumes_from_watermark(self, accounts):
+        self.drift(accounts[0], Decimal("1"))
+        self.drift(accounts[4], Decimal("1"))
+        interrupted = ReconciliationRun.objects.create(watermark=accounts[2].pk)
+        run = reconcile(chunk_size=2, workers=1)
+        assert run == interrupted
+        assert run.accounts_checked == iSwiftAccount.objects.filter(pk__gt=accounts[2].pk).count()
+        assert [drift.iswift_account for drift in run.drifts.all()] == [accounts[4]]
+
+        # the next run starts over
+        assert reconcile(chunk_size=2, workers=1).drifts.count() == 2
+
+    @pytest.mark.finance
+    @pytest.mark.django_db(transaction=True)
+    def test_reconcile_on_worker_pool(self, accounts):
+        self.drift(accounts[1], Decimal("2.50"))
+        self.drift(accounts[2], Decimal("-2.50"))
+        run = reconcile(chunk_size=1, workers=3)
+        assert run.accounts_checked == iSwiftAccount.objects.count()
+        drifts = run.drifts.order_by("iswift_account")
+        assert [drift.difference for drift in drifts] == [Decimal("2.50"), Decimal("-2.50")]
+
+    @pytest.mark.finance
+    def test_reconcile_balances_command(self, accounts):
+        self.drift(accounts[2], Decimal("3"))
+        out = StringIO()
+        call_command("reconcile_balances", "--workers=1", stdout=out)
+        assert str(accounts[2].uid) in out.getvalue()
+        assert f"Checked {iSwiftAccount.objects.count()} accounts, 1 drifted" in out.getvalue()
@@ -0,0 +1,148 @@
+import json
+from decimal import Decimal
+
+import pytest
+from django.utils import timezone
+
+from finance.cache import get_rates_version
+from finance.data import currencies
+from finance.models import ConversionRate, ConversionRateSnapshot, Currency
+from finance.utils import FileRateProvider, FixtureRateProvider, RateProvider, update_rates
+from tests.data import conversion_rates
+from tests.fixtures.finance import CurrencyFixtures
+
+pytestmark = pytest.mark.django_db
+
+
+def make_payloads(scale=1):
+    payloads = {iso_code: {} for iso_code in currencies}
+    for rate in conversion_rates:
+        payloads[rate["base_currency"]][rate["target_currency"]] = (
+            float(rate["conversion_rate"]) * scale
+        )
+    return payloads
+
+
+def stored_rate(base, target):
+    return ConversionRate.objects.get(
+        base_currency__iso_code=base, target_currency__iso_code=target
+    )
+
+
+class CountingRateProvider(RateProvider):
+    def __init__(self, rates: dict):
+        self.rates = rates
+        self.calls = []
+
+    def fetch(self, iso_code: str) -> dict:
+        self.calls.append(iso_code)
+        return self.rates[iso_code]
+
+
+class TestUpdateRates(CurrencyFixtures):
+    @pytest.fixture(autouse=True)
+    def fetch_every_base(self, settings):
+        settings.RATES_ANCHOR_CURRENCY = None
+
+    @pytest.mark.finance
+    def test_update_rates_upserts_changed_rates(self, django_capture_on_commit_callbacks):
+        version = get_rates_version()
+        with django_capture_on_commit_callbacks(execute=True):
+            count = update_rates(FixtureRateProvider(make_payloads(scale=2)))
+
+        assert count == len(conversion_rates)
+        assert ConversionRate.objects.count() == len(conversion_rates)
+        rate = stored_rate("usd", "cad")
+        assert rate.conversion_rate == Decimal("2.72709122")
+        assert rate.reverse_rate == Decimal("0.3666910709")
+        assert get_rates_version() != version
+
+    @pytest.mark.finance
+    def test_update_rates_skips_unchanged_rates(self, django_assert_num_queries):
+        provider = FixtureRateProvider(make_payloads(scale=2))
+        update_rates(provider)
+        # currencies and existing rates only
+        with django_assert_num_queries(2):
+            assert update_rates(provider) == 0
+
+    @pytest.mark.finance
+    def test_update_rates_skips_failed_bases(self):
+        payloads = make_payloads(scale=2)
+        del payloads["usd"]
+        count = update_rates(FixtureRateProvider(payloads))
+        assert count == len([i for i in conversion_rates if i["base_currency"] != "usd"])
+        assert stored_rate("usd", "cad").conversion_rate == Decimal("1.3635456100")
+
+    @pytest.mark.finance
+    def test_update_rates_appends_snapshots(self, django_assert_max_num_queries):
+        update_rates(FixtureRateProvider(make_payloads(scale=2)))
+        between = timezone.now()
+        update_rates(FixtureRateProvider(make_payloads(scale=3)))
+
+        assert ConversionRateSnapshot.objects.count() == 2 * len(conversion_rates)
+        rate = stored_rate("usd", "cad")
+        assert rate.snapshot.conversion_rate == rate.conversion_rate
+
+        usd = Currency.objects.get(iso_code="usd")
+        cad = Currency.objects.get(iso_code="cad")
+        with django_assert_max_num_queries(2):
+            old_rate, snapshot = usd.get_conversion_rate_as_of(cad, between)
+        assert old_rate == Decimal("2.72709122")
+        assert snapshot.effective_at <= between
+        assert usd.get_conversion_rate_as_of(cad) == (rate.conversion_rate, rate.snapshot)
+        assert cad.get_conversion_rate_as_of(usd) == (rate.reverse_rate, rate.snapshot)
+        assert usd.get_conversion_rate_as_of(cad, snapshot.effective_at.replace(year=2000)) == (
+            None,
+            None,
+        )
+
+    @pytest.mark.finance
+    def test_update_rates_keeps_pair_direction(self, monkeypatch):
+        # Rates both ways, as a provider returns them
+        payloads = make_payloads(scale=3)
+        for base, rates in make_payloads(scale=3).items():
+            for target, rate in rates.items():
+                payloads[target][base] = 1 / rate
+
+        update_rates(FixtureRateProvider(make_payloads(scale=2)))
+        monkeypatch.setattr(Currency._meta, "ordering", ["-pk"])
+        update_rates(FixtureRateProvider(payloads))
+
+        assert ConversionRate.objects.count() == len(conversion_rates)
+        assert stored_rate("usd", "cad").conversion_rate == Decimal("4.09063683")
+
+    @pytest.mark.finance
+    def test_file_rate_provider(self, tmp_path):
+        for iso_code, rates in make_payloads(scale=2).items():
+            (tmp_path / f"{iso_code}.json").write_text(json.dumps({iso_code: rates}))
+
+        assert update_rates(FileRateProvider(tmp_path)) == len(conversion_rates)
+        assert stored_rate("ngn", "eur").conversion_rate == Decimal("0.00131764")
+
+
+class TestDerivedRates(CurrencyFixtures):
+    anchor_rates = {"usd": {"cad": 1.5, "gbp": 0.8, "ngn": 1400.0, "eur": 0.9, "jpy": 150.0}}
+
+    @pytest.mark.finance
+    def test_update_rates_fetches_anchor_only(self):
+        provider = CountingRateProvider(self.anchor_rates)
+        count = update_rates(provider, anchor="usd")
+
+        assert provider.calls == ["usd"]
+        # every pair of the five currencies
+        assert count == 10
+        assert stored_rate("usd", "cad").conversion_rate == Decimal("1.5")
+        assert stored_rate("cad", "gbp").conversion_rate == Decimal("0.5333333333")
+        assert stored_rate("cad", "gbp").reverse_rate == Decimal("1.875")
+        assert stored_rate("gbp", "ngn").conversion_rate == Decimal("1750")
+        # Weak currency pairs keep every place stored, and their reverse rates
+        # are not thrown off by the rounding of the forward ones
+        assert stored_rate("ngn", "eur").conversion_rate == Decimal("0.0006428571")
+        assert stored_rate("ngn", "eur").reverse_rate == Decimal("1555.5555555556")
+
+    @pytest.mark.finance
+    def test_update_rates_uses_anchor_setting(self, settings):
+        settings.RATES_ANCHOR_CURRENCY = "usd"
+        provider = CountingRateProvider(self.anchor_rates)
+        update_rates(provider)
+        assert provider.calls == ["usd"]
@@ -1,6 +1,7 @@
 import pytest
 from django.db.models import QuerySet
 
+from finance.cache import bump_rates_version
 from finance.data import currencies
 from finance.models import ConversionRate, Currency
 from tests.data import conversion_rates
@@ -15,8 +16,11 @@ def iswift_account_factory():
 class CurrencyFixtures:
     @pytest.fixture(autouse=True)
     def create_currencies(self, currency_factory) -> QuerySet[Currency]:
+        # Fixed pks, so the currencies cached by the factories' iterators stay
+        # valid after a transactional test flushes the tables
         currency_instances = [
-            currency_factory.build(iso_code=key, name=value) for key, value in currencies.items()
+            currency_factory.build(pk=pk, iso_code=key, name=value)
+            for pk, (key, value) in enumerate(currencies.items(), start=1)
         ]
         Currency.objects.bulk_create(currency_instances)
         pks = [currency.pk for currency in currency_instances]
@@ -38,6 +42,7 @@ class CurrencyFixtures:
             for rate in conversion_rates
         ]
         ConversionRate.objects.bulk_create(rates_instances)
+        bump_rates_version()
         pks = [rate.pk for rate in rates_instances]
         self.conversion_rates_queryset = ConversionRate.objects.filter(pk__in=pks)
         return self.conversion_rates_queryset